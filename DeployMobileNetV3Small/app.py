@@ -1,129 +1,1107 @@
 import os
+import time
+# Inicio del import del módulo (desglose de arranque, ver StartupStatus)
+_IMPORT_STARTED = time.perf_counter()
 # Forzar CPU y silenciar logs antes de importar TF y Keras
 os.environ.setdefault("CUDA_VISIBLE_DEVICES", "-1")
 os.environ.setdefault("TF_CPP_MIN_LOG_LEVEL", "2")
 
 import io
 import json
+import base64
+import hashlib
+import asyncio
+import threading
 import uvicorn
-from typing import List, Dict, Any
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager, contextmanager, nullcontext
+from typing import List, Dict, Any, Callable, Optional, Tuple, Union
 import numpy as np
-from fastapi import FastAPI, UploadFile, File, HTTPException, Query
+from fastapi import FastAPI, UploadFile, File, HTTPException, Query, Request, Response, Header, Path, Depends
+from fastapi.responses import JSONResponse
 from PIL import Image, UnidentifiedImageError
-import tensorflow as tf
-from tensorflow import keras
+from prometheus_client import (
+    CollectorRegistry, Counter, Gauge, Histogram, generate_latest, multiprocess, CONTENT_TYPE_LATEST,
+)
+
+_APP_IMPORTS_SECONDS = time.perf_counter() - _IMPORT_STARTED
 
 MODEL_PATH = "./mobileNetV3Small.keras"
+# Grafo solo de inferencia generado por export_serving.py; si existe se carga en
+# lugar de MODEL_PATH (sin augmentation, BatchNorm fusionada)
+SERVING_MODEL_PATH = "./mobileNetV3Small_serving.keras"
 CLASS_MAP = "./class_map_es.json"
 ADVICE_PATH = "./advice.json"
 IMG_SIZE = (224, 224)
 TOP_K = 3
 LANG_DEF = "es"
 ALLOWED_MIMES = ["image/jpeg", "image/png"]
+# POST /predict/tensor: píxeles RGB 224x224 ya redimensionados por el cliente,
+# crudos (uint8) o como archivo .npy (uint8 o float32)
+TENSOR_MIMES = ["application/octet-stream", "application/x-npy"]
+# Decodificar JPEG directamente a escala reducida (DCT) antes del resize final
+JPEG_DRAFT = os.getenv("JPEG_DRAFT", "1") == "1"
+# Límite de píxeles (ancho*alto) para rechazar bombas de descompresión
+MAX_IMAGE_PIXELS = int(os.getenv("MAX_IMAGE_PIXELS", "50000000"))
+Image.MAX_IMAGE_PIXELS = MAX_IMAGE_PIXELS
 
-# Reducir hilos (RAM/CPU bajos)
-tf.config.threading.set_intra_op_parallelism_threads(1)
-tf.config.threading.set_inter_op_parallelism_threads(1)
+# Micro-batching: máximo de imágenes por lote y espera máxima para completarlo
+BATCH_MAX_SIZE = int(os.getenv("BATCH_MAX_SIZE", "8"))
+BATCH_MAX_WAIT_MS = float(os.getenv("BATCH_MAX_WAIT_MS", "5"))
+# Tamaños de lote fijos de los motores TFLite (un intérprete por bucket): por
+# defecto potencias de 2 hasta BATCH_MAX_SIZE, p. ej. 1,2,4,8
+TFLITE_BATCH_BUCKETS = sorted({
+    int(b) for b in os.getenv(
+        "TFLITE_BATCH_BUCKETS",
+        ",".join(str(min(2 ** i, BATCH_MAX_SIZE)) for i in range(max(1, BATCH_MAX_SIZE).bit_length() + 1)),
+    ).split(",") if b.strip() and int(b) > 0
+})
+# Máximo de archivos aceptados por POST /predict/batch
+BATCH_MAX_FILES = int(os.getenv("BATCH_MAX_FILES", "32"))
 
-app = FastAPI(title = "MobileNetV3Small - Clasificador + Recomendaciones")
+# Trabajo CPU (decode + inferencia) fuera del event loop
+INFER_WORKERS = int(os.getenv("INFER_WORKERS", "2"))
+# Imágenes admitidas en proceso a la vez; sobre eso se responde 503 + Retry-After
+INFER_MAX_PENDING = int(os.getenv("INFER_MAX_PENDING", "32"))
+RETRY_AFTER_S = int(os.getenv("RETRY_AFTER_S", "1"))
 
-# -----------------
-# Carga del Modelo
-# -----------------
+# Caché de predicciones por contenido (0 entradas = desactivada)
+CACHE_MAX_ENTRIES = int(os.getenv("CACHE_MAX_ENTRIES", "2048"))
+CACHE_TTL_S = float(os.getenv("CACHE_TTL_S", "3600"))
+
+# Motor de inferencia: keras | tflite | tflite_fp16 | tflite_int8
+INFERENCE_BACKEND = os.getenv("INFERENCE_BACKEND", "keras")
+# Artefactos generados por export_tflite.py a partir de MODEL_PATH
+TFLITE_PATHS = {
+    "tflite": "./mobileNetV3Small_fp32.tflite",
+    "tflite_fp16": "./mobileNetV3Small_fp16.tflite",
+    "tflite_int8": "./mobileNetV3Small_int8.tflite",
+}
+
+# Cascada: un motor barato (p. ej. tflite_int8) responde primero y el motor
+# principal solo corre si duda: top-1 < CASCADE_MIN_PROB o margen top-1 - top-2
+# < CASCADE_MIN_MARGIN. Vacío = desactivada.
+CASCADE_BACKEND = os.getenv("CASCADE_BACKEND", "")
+CASCADE_MIN_PROB = float(os.getenv("CASCADE_MIN_PROB", "0.9"))
+CASCADE_MIN_MARGIN = float(os.getenv("CASCADE_MIN_MARGIN", "0.2"))
+
+# POST /predict?embedding=true devuelve el embedding de la base (salida del
+# GlobalAveragePooling, float16) para re-puntuar con cabezas nuevas sin
+# re-ejecutar la CNN. Solo motor keras.
+EMBEDDINGS = os.getenv("EMBEDDINGS", "0") == "1"
+
+# Hilos de TensorFlow/TFLite por proceso (por defecto 1: RAM/CPU bajos)
+TF_INTRA_OP_THREADS = int(os.getenv("TF_INTRA_OP_THREADS", "1"))
+TF_INTER_OP_THREADS = int(os.getenv("TF_INTER_OP_THREADS", "1"))
+# Procesos uvicorn que comparten el socket al ejecutar python app.py
+WEB_WORKERS = int(os.getenv("WEB_WORKERS", "1"))
+PORT = int(os.getenv("PORT", "8000"))
+
+# Registro de modelos: cada versión extra vive en MODELS_DIR/<versión>/ con su
+# artefacto, class_map_es.json y (opcional) advice.json
+MODELS_DIR = os.getenv("MODELS_DIR", "./models")
+# Versión de los archivos raíz; por defecto el nombre del artefacto (como antes)
+MODEL_VERSION = os.getenv("MODEL_VERSION")
+# Token para cargar/activar/descargar versiones; sin token esas rutas se desactivan
+MODEL_ADMIN_TOKEN = os.getenv("MODEL_ADMIN_TOKEN")
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Corre dentro de cada worker: el modelo se carga después del fork/spawn.
+    # La carga va en segundo plano para que el puerto abra de inmediato;
+    # /readyz responde 503 hasta que termine.
+    loader = asyncio.create_task(load_in_background())
+    yield
+    loader.cancel()
+    await registry.shutdown()
+    executor.shutdown(wait=False, cancel_futures=True)
+
+app = FastAPI(title = "MobileNetV3Small - Clasificador + Recomendaciones", lifespan=lifespan)
+
+# ----------------------
+# Motores de inferencia
+# ----------------------
+
+class InferenceEngine:
+    # Interfaz común: predict recibe (N,224,224,3) float32 en rango [0,255]
+    # y devuelve probabilidades (N, clases).
+    name = "base"
+
+    def __init__(self, path: str):
+        self.path = path
+        self.num_classes = 0
+        # Dimensión del embedding que entrega predict_with_embedding (0 = no soportado)
+        self.embedding_dim = 0
+
+    @property
+    def version(self) -> str:
+        return os.path.basename(self.path)
+
+    def predict(self, x: np.ndarray) -> np.ndarray:
+        raise NotImplementedError
+
+    def predict_with_embedding(self, x: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        raise NotImplementedError
+
+class KerasEngine(InferenceEngine):
+    name = "keras"
+
+    def __init__(self, path: str):
+        super().__init__(path)
+        # TF/Keras solo se importan si se usa este motor
+        import tensorflow as tf
+        from tensorflow import keras
+        tf.config.threading.set_intra_op_parallelism_threads(TF_INTRA_OP_THREADS)
+        tf.config.threading.set_inter_op_parallelism_threads(TF_INTER_OP_THREADS)
+        self.model = keras.models.load_model(path)
+        self.num_classes = int(self.model.output.shape[-1])
+        self.embed_model = None
+        if EMBEDDINGS:
+            # Mismo grafo con una segunda salida: el vector de la base ya promediado,
+            # entrada de la cabeza Dense (lo único que cambia entre reentrenamientos)
+            pool = next(l for l in self.model.layers if isinstance(l, keras.layers.GlobalAveragePooling2D))
+            self.embed_model = keras.Model(self.model.inputs, [self.model.output, pool.output])
+            self.embedding_dim = int(pool.output.shape[-1])
+
+    def predict(self, x: np.ndarray) -> np.ndarray:
+        return self.model.predict(x, verbose=0)
+
+    def predict_with_embedding(self, x: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        probs, emb = self.embed_model.predict(x, verbose=0)
+        return probs, emb
+
+def _tflite_interpreter_class():
+    # Preferir el runtime liviano (sin TensorFlow completo) si está instalado
+    try:
+        from ai_edge_litert.interpreter import Interpreter
+    except ImportError:
+        try:
+            from tflite_runtime.interpreter import Interpreter
+        except ImportError:
+            import tensorflow as tf
+            Interpreter = tf.lite.Interpreter
+    return Interpreter
+
+def _tflite_interpreter(path: str):
+    return _tflite_interpreter_class()(model_path=path, num_threads=TF_INTRA_OP_THREADS)
+
+class _TFLiteSlot:
+    # Un intérprete con la entrada fija en `shape` (lote del bucket) y su arena
+    # ya asignada, más un búfer de entrada propio donde se copia el lote y el
+    # resto queda de relleno. El intérprete no es thread-safe: un lock por slot.
+
+    def __init__(self, path: str, shape: Tuple[int, ...]):
+        self.interpreter = _tflite_interpreter(path)
+        self.input = self.interpreter.get_input_details()[0]
+        if tuple(int(d) for d in self.input["shape"]) != shape:
+            self.interpreter.resize_tensor_input(self.input["index"], list(shape))
+        self.interpreter.allocate_tensors()
+        self.input = self.interpreter.get_input_details()[0]
+        self.output = self.interpreter.get_output_details()[0]
+        self.buf = np.zeros(shape, dtype=self.input["dtype"])
+        self.lock = threading.Lock()
 
-try:
-    model = keras.models.load_model(MODEL_PATH)
-except Exception as e:
-    raise RuntimeError(f"Error al cargar el modelo: {e}")
+    def run(self, x: np.ndarray) -> np.ndarray:
+        n = len(x)
+        with self.lock:
+            scale, zero = self.input["quantization"]
+            if scale:
+                info = np.iinfo(self.input["dtype"])
+                x = np.clip(np.round(x / scale + zero), info.min, info.max)
+            # Las filas de relleno no afectan a las demás (BatchNorm en inferencia)
+            self.buf[:n] = x
+            self.interpreter.set_tensor(self.input["index"], self.buf)
+            self.interpreter.invoke()
+            y = self.interpreter.get_tensor(self.output["index"])[:n]
 
-num_classes_model = int(model.output.shape[-1])
+            scale, zero = self.output["quantization"]
+            if scale:
+                return (y.astype(np.float32) - zero) * scale
+            return y.copy()
+
+class TFLiteEngine(InferenceEngine):
+    # Sirve fp32, fp16 e int8; para int8 (de)cuantiza entrada/salida con los
+    # parámetros guardados en el propio .tflite.
+    # El micro-batcher entrega lotes de 1..BATCH_MAX_SIZE filas casi en cada
+    # llamada: redimensionar la entrada y reasignar la arena cada vez se comería
+    # la ganancia de TFLite. Cada lote se rellena hasta el bucket fijo más
+    # cercano (TFLITE_BATCH_BUCKETS), con un intérprete ya asignado por bucket,
+    # y se recorta la salida; lotes más grandes se parten en el bucket mayor.
+
+    def __init__(self, path: str, name: str, buckets: Optional[List[int]] = None):
+        super().__init__(path)
+        self.name = name
+        self.buckets = sorted(set(buckets or TFLITE_BATCH_BUCKETS))
+        self._slots: Dict[Tuple[int, ...], _TFLiteSlot] = {}
+        self._slots_lock = threading.Lock()
+        first = self._slot((self.buckets[0], *IMG_SIZE, 3))
+        self.num_classes = int(first.output["shape"][-1])
+
+    def _slot(self, shape: Tuple[int, ...]) -> _TFLiteSlot:
+        slot = self._slots.get(shape)
+        if slot is None:
+            with self._slots_lock:
+                slot = self._slots.get(shape)
+                if slot is None:
+                    # Otra resolución (eval_backends.py) crea también sus propios slots
+                    slot = self._slots[shape] = _TFLiteSlot(self.path, shape)
+        return slot
+
+    def predict(self, x: np.ndarray) -> np.ndarray:
+        largest = self.buckets[-1]
+        if len(x) > largest:
+            return np.concatenate([self.predict(x[i:i + largest]) for i in range(0, len(x), largest)], axis=0)
+        bucket = next(b for b in self.buckets if b >= len(x))
+        return self._slot((bucket, *x.shape[1:])).run(x)
+
+def import_backend(backend: str) -> None:
+    # Importa las librerías del motor por separado para medir su costo en el arranque
+    if backend == "keras":
+        import tensorflow  # noqa: F401
+        import keras  # noqa: F401
+    else:
+        _tflite_interpreter_class()
+
+def warmup(engine: InferenceEngine) -> None:
+    # Inferencias con tensores vacíos para trazar el grafo con los tamaños de
+    # lote habituales antes de la primera petición real (TFLite: asigna todos
+    # los buckets)
+    sizes = engine.buckets if isinstance(engine, TFLiteEngine) else [1, BATCH_MAX_SIZE]
+    for n in sorted(set(sizes)):
+        engine.predict(np.zeros((n, *IMG_SIZE, 3), dtype=np.float32))
+    if engine.embedding_dim:
+        engine.predict_with_embedding(np.zeros((1, *IMG_SIZE, 3), dtype=np.float32))
+
+def model_filename(backend: str, model_dir: str = ".") -> str:
+    if backend == "keras":
+        serving = os.path.basename(SERVING_MODEL_PATH)
+        if os.path.exists(os.path.join(model_dir, serving)):
+            return serving
+        return os.path.basename(MODEL_PATH)
+    if backend in TFLITE_PATHS:
+        return os.path.basename(TFLITE_PATHS[backend])
+    raise RuntimeError(f"INFERENCE_BACKEND desconocido: {backend}")
+
+def create_engine(backend: str, model_dir: str = ".") -> InferenceEngine:
+    path = os.path.join(model_dir, model_filename(backend, model_dir))
+    if not os.path.exists(path):
+        raise RuntimeError(f"No existe {path}; los .tflite se generan con export_tflite.py")
+    if backend == "keras":
+        return KerasEngine(path)
+    return TFLiteEngine(path, backend)
 
 # ---------------------
 # Carga de clases EN/ES
 # ---------------------
 
-if not os.path.exists(CLASS_MAP):
-    raise RuntimeError(f"No existe {CLASS_MAP}")
+def load_class_map(path: str) -> Tuple[List[str], List[str]]:
+    if not os.path.exists(path):
+        raise RuntimeError(f"No existe {path}")
 
-with open(CLASS_MAP, "r", encoding="utf-8") as f:
-    mapping = json.load(f)
+    with open(path, "r", encoding="utf-8") as f:
+        mapping = json.load(f)
 
-class_names_en: List[str] = mapping.get("class_names_en") or []
-class_names_es: List[str] = mapping.get("class_names_es") or []
+    class_names_en: List[str] = mapping.get("class_names_en") or []
+    class_names_es: List[str] = mapping.get("class_names_es") or []
 
-if not class_names_en or not class_names_es:
-    raise RuntimeError("class_map_es.json debe contener 'class_names_en' y 'class_names_es'.")
+    if not class_names_en or not class_names_es:
+        raise RuntimeError("class_map_es.json debe contener 'class_names_en' y 'class_names_es'.")
 
-if len(class_names_en) != len(class_names_es):
-    raise RuntimeError("Longitudes distintas en EN vs ES.")
+    if len(class_names_en) != len(class_names_es):
+        raise RuntimeError("Longitudes distintas en EN vs ES.")
 
-if len(class_names_en) != num_classes_model:
-    raise RuntimeError(f"Desalineación: salidas modelo={num_classes_model}, clases={len(class_names_en)}")
+    return class_names_en, class_names_es
 
 
 # ------------------------
 # Carga de recomendaciones
 # ------------------------
 
-if not os.path.exists(ADVICE_PATH):
-    raise RuntimeError(f"No existe {ADVICE_PATH} (JSON con recomendaciones).")
-
-with open(ADVICE_PATH, "r", encoding="utf-8") as f:
-    CLASS_ADVICE: Dict[str, Dict[str, Any]] = json.load(f)
-
-# Validación: avisar si faltan algunas clases o sobran claves
-
-missing_advice = [c for c in class_names_en if c not in CLASS_ADVICE]
-extra_advice  = [k for k in CLASS_ADVICE.keys() if k not in class_names_en]
-
-if missing_advice:
-    print(f"Aviso: faltan recomendaciones para clases: {missing_advice}")
-if extra_advice:
-    print(f"Aviso: hay claves en advice.json que no están en el modelo: {extra_advice}")
-
-def get_recomendation(label_en: str) -> Dict[str, Any]:
-    # Devuelve bloque de recomendación. Fallback genérico si no hay entrada.
-    return CLASS_ADVICE.get(
-        label_en,
-        {
-            "title": label_en,
-            "severity":"desconocida",
-            "advice":[
-                "Monitorear evolución de síntomas",
-                "Mejorar ventilación y evitar mojado foliar",
-                "Consultar asesoría técnica local si progresa"
-            ]
-        }
-    )
+def load_advice(path: str, class_names_en: List[str]) -> Dict[str, Dict[str, Any]]:
+    if not os.path.exists(path):
+        raise RuntimeError(f"No existe {path} (JSON con recomendaciones).")
+
+    with open(path, "r", encoding="utf-8") as f:
+        class_advice: Dict[str, Dict[str, Any]] = json.load(f)
+
+    # Validación: avisar si faltan algunas clases o sobran claves
+
+    missing_advice = [c for c in class_names_en if c not in class_advice]
+    extra_advice  = [k for k in class_advice.keys() if k not in class_names_en]
+
+    if missing_advice:
+        print(f"Aviso: faltan recomendaciones para clases: {missing_advice}")
+    if extra_advice:
+        print(f"Aviso: hay claves en {path} que no están en el modelo: {extra_advice}")
+
+    return class_advice
+
+# Los archivos raíz se validan al importar, como antes: un class map o advice.json
+# roto impide levantar el servicio.
+DEFAULT_CLASS_NAMES = load_class_map(CLASS_MAP)
+DEFAULT_ADVICE = load_advice(ADVICE_PATH, DEFAULT_CLASS_NAMES[0])
+
+# -----------------
+# Carga del Modelo
+# -----------------
+
+STARTUP_SECONDS = Gauge("startup_phase_seconds", "Duración de cada fase del arranque", ["phase"], multiprocess_mode="max")
+MODEL_READY = Gauge("model_ready", "1 si el modelo está cargado y calentado", multiprocess_mode="min")
+
+class StartupStatus:
+    # Fase actual del arranque y duración de cada fase (s), para /readyz y logs
+    def __init__(self):
+        self.phase = "starting"
+        self.error: Optional[str] = None
+        self.timings: Dict[str, float] = {}
+
+    @property
+    def ready(self) -> bool:
+        return self.phase == "ready"
+
+    @contextmanager
+    def stage(self, phase: str):
+        self.phase = phase
+        print(f"Arranque: {phase}...")
+        started = time.perf_counter()
+        yield
+        self.record(phase, time.perf_counter() - started)
+
+    def record(self, phase: str, seconds: float) -> None:
+        self.timings[phase] = round(seconds, 3)
+        STARTUP_SECONDS.labels(phase).set(seconds)
+        print(f"Arranque: {phase} {seconds:.2f}s")
+
+startup = StartupStatus()
+startup.record("app_imports", _APP_IMPORTS_SECONDS)
+
+def load_bundle(
+    version: str,
+    model_dir: str,
+    class_names: Tuple[List[str], List[str]],
+    advice: Dict[str, Dict[str, Any]],
+    stage: Callable = lambda phase: nullcontext(),
+) -> "ModelBundle":
+    # Carga, valida y calienta una versión; corre en un hilo, fuera del event loop
+    with stage("engine_imports"):
+        import_backend(INFERENCE_BACKEND)
+    with stage("model_load"):
+        try:
+            engine = create_engine(INFERENCE_BACKEND, model_dir)
+        except Exception as e:
+            raise RuntimeError(f"Error al cargar el modelo: {e}")
+
+    if len(class_names[0]) != engine.num_classes:
+        raise RuntimeError(f"Desalineación: salidas modelo={engine.num_classes}, clases={len(class_names[0])}")
+
+    fast_engine = None
+    if CASCADE_BACKEND:
+        with stage("cascade_load"):
+            import_backend(CASCADE_BACKEND)
+            try:
+                fast_engine = create_engine(CASCADE_BACKEND, model_dir)
+            except Exception as e:
+                raise RuntimeError(f"Error al cargar el modelo de la cascada: {e}")
+        if fast_engine.num_classes != engine.num_classes:
+            raise RuntimeError(f"Desalineación: salidas cascada={fast_engine.num_classes}, modelo={engine.num_classes}")
+
+    with stage("warmup"):
+        warmup(engine)
+        if fast_engine is not None:
+            warmup(fast_engine)
+
+    return ModelBundle(version, engine, class_names[0], class_names[1], advice, fast_engine)
+
+def load_model() -> "ModelBundle":
+    # Versión inicial, desde los archivos raíz (SERVING_MODEL_PATH o MODEL_PATH / TFLITE_PATHS)
+    version = MODEL_VERSION or model_filename(INFERENCE_BACKEND)
+    return load_bundle(version, ".", DEFAULT_CLASS_NAMES, DEFAULT_ADVICE, stage=startup.stage)
+
+async def load_in_background() -> None:
+    try:
+        bundle = await asyncio.to_thread(load_model)
+    except Exception as e:
+        startup.phase = "failed"
+        startup.error = str(e)
+        print(f"Arranque: error {e}")
+        return
+    registry.add(bundle, activate=True)
+    startup.phase = "ready"
+    MODEL_READY.set(1)
+    print(f"Arranque: listo ({INFERENCE_BACKEND}, {bundle.version}) {startup.timings}")
+
+def require_ready() -> None:
+    if not startup.ready:
+        raise HTTPException(
+            status_code=503,
+            detail=f"Modelo no disponible ({startup.phase}).",
+            headers={"Retry-After": str(RETRY_AFTER_S)},
+        )
+
 
 # ------------------------------------------
 # Preprocesamiento idéntico al entrenamiento
 # ------------------------------------------
 
-preprocess = keras.applications.mobilenet_v3.preprocess_input
-
-def prepare_image(pil_img: Image.Image) -> np.ndarray:
-    pil_img = pil_img.convert("RGB").resize(IMG_SIZE)
-    arr = keras.utils.img_to_array(pil_img)
-    arr = np.expand_dims(arr, axis = 0)
-    return preprocess(arr)
-
-def format_topk(probs: np.ndarray, top_k: int, lang: str) -> List[Dict[str, Any]]:
-    k = int(max(1, min(top_k, probs.size)))
-    idxs = np.argsort(probs)[-k:][::-1]
-    out: List[Dict[str, Any]] = []
-    for i in idxs:
-        label_en = class_names_en[i]
-        item: Dict[str, Any] = {
-            "index": int(i),
-            "label_en": label_en,
-            "probability": float(probs[i]),
-            "recomendation":get_recomendation(label_en)
+def preprocess(arr: np.ndarray) -> np.ndarray:
+    # keras.applications.mobilenet_v3.preprocess_input es un passthrough: el
+    # modelo ya trae su capa Rescaling. Se replica sin importar Keras.
+    return arr
+
+def prepare_image(pil_img: Image.Image, out: Optional[np.ndarray] = None) -> np.ndarray:
+    # Escribe los píxeles en `out` (1,224,224,3) float32, p. ej. un búfer de
+    # input_pool; la única copia intermedia es la vista uint8 de PIL.
+    if pil_img.mode != "RGB":
+        pil_img = pil_img.convert("RGB")
+    if pil_img.size != IMG_SIZE:
+        pil_img = pil_img.resize(IMG_SIZE)
+    if out is None:
+        out = np.empty((1, *IMG_SIZE, 3), dtype=np.float32)
+    out[0] = np.asarray(pil_img)
+    return preprocess(out)
+
+def open_image(contents: bytes, draft: bool = JPEG_DRAFT) -> Image.Image:
+    # Image.open solo lee la cabecera: el tamaño se valida antes de decodificar
+    img = Image.open(io.BytesIO(contents))
+    w, h = img.size
+    IMAGE_PIXELS.observe(w * h)
+    if w * h > MAX_IMAGE_PIXELS:
+        raise HTTPException(status_code=413, detail=f"Imagen demasiado grande: {w}x{h} px.")
+    if draft and img.format == "JPEG":
+        # El decoder JPEG escala 1/2, 1/4 u 1/8 en el dominio DCT; draft elige la
+        # mayor reducción que deja ambos lados >= IMG_SIZE. PNG sigue el camino normal.
+        img.draft("RGB", IMG_SIZE)
+    return img
+
+def load_image(contents: bytes, timings: Optional["Timings"] = None, out: Optional[np.ndarray] = None) -> np.ndarray:
+    # Decodifica y preprocesa los bytes subidos; errores de imagen -> HTTP 400
+    try:
+        started = time.perf_counter()
+        img = open_image(contents)
+        opened = time.perf_counter()
+        x = prepare_image(img, out)
+        if timings is not None:
+            timings.add("open", opened - started)
+            timings.add("prepare", time.perf_counter() - opened)
+        return x
+    except HTTPException:
+        raise
+    except Image.DecompressionBombError:
+        raise HTTPException(status_code=413, detail="Imagen demasiado grande.")
+    except UnidentifiedImageError:
+        raise HTTPException(status_code=400, detail="Archivo no es una imagen válida.")
+    except Exception:
+        raise HTTPException(status_code=400, detail="No se pudo leer la imagen.")
+
+INPUT_BUFFERS_ALLOCATED = Counter("input_buffers_allocated_total", "Búferes de entrada (1,224,224,3) float32 creados")
+INPUT_BUFFERS_FREE = Gauge("input_buffers_free", "Búferes de entrada libres en el pool", multiprocess_mode="livesum")
+
+class InputBufferPool:
+    # Búferes (1,224,224,3) float32 reutilizables para el tensor de cada imagen.
+    # Crecen bajo demanda hasta `capacity` (INFER_MAX_PENDING: la admisión nunca
+    # deja más imágenes en proceso) y se conservan; así en régimen estable no
+    # se reserva memoria por petición. Solo se usa desde el event loop.
+
+    def __init__(self, capacity: int):
+        self.capacity = max(0, capacity)
+        self._free: List[np.ndarray] = []
+
+    def acquire(self) -> np.ndarray:
+        if self._free:
+            buf = self._free.pop()
+            INPUT_BUFFERS_FREE.dec()
+            return buf
+        INPUT_BUFFERS_ALLOCATED.inc()
+        return np.empty((1, *IMG_SIZE, 3), dtype=np.float32)
+
+    def release(self, *bufs: np.ndarray) -> None:
+        # Solo devolver búferes que ya nadie usa: si el llamador se canceló con
+        # el lote en cola, no se liberan (el pool repone creando otros)
+        for buf in bufs:
+            if len(self._free) < self.capacity:
+                self._free.append(buf)
+                INPUT_BUFFERS_FREE.inc()
+
+input_pool = InputBufferPool(INFER_MAX_PENDING)
+
+TENSOR_DTYPES = (np.dtype(np.uint8), np.dtype(np.float32))
+TENSOR_IMAGE_SHAPE = (*IMG_SIZE, 3)
+# Tope de la cabecera .npy (magic + largo + dict); la de un (N,224,224,3) ocupa 128 bytes
+NPY_HEADER_MAX = 64 * 1024
+
+async def read_body_capped(request: Request, max_bytes: int, detail: str) -> bytearray:
+    # Lee el cuerpo por chunks y corta con 413 apenas se pasa de max_bytes: un cliente
+    # chunked (sin Content-Length) nunca llega a dejar más que eso en memoria.
+    # Devuelve el bytearray tal cual (bytes() lo copiaría entero otra vez)
+    body = bytearray()
+    async for chunk in request.stream():
+        body += chunk
+        if len(body) > max_bytes:
+            raise HTTPException(status_code=413, detail=detail)
+    return body
+
+def parse_tensor(body: Union[bytes, bytearray], content_type: str) -> np.ndarray:
+    # Vista sin copia sobre el cuerpo: (224,224,3) o (N,224,224,3), uint8 o
+    # float32 en [0,255]. Forma o tipo inválidos -> HTTP 400.
+    if content_type == "application/x-npy":
+        # BytesIO copia un bytearray: solo se le pasa el tramo de la cabecera
+        f = io.BytesIO(memoryview(body)[:NPY_HEADER_MAX])
+        try:
+            fmt = np.lib.format.read_magic(f)
+            read_header = np.lib.format.read_array_header_1_0 if fmt == (1, 0) else np.lib.format.read_array_header_2_0
+            shape, fortran_order, dtype = read_header(f)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=f"Archivo .npy inválido: {e}")
+        if fortran_order:
+            raise HTTPException(status_code=400, detail="El arreglo .npy debe estar en orden C.")
+        if dtype not in TENSOR_DTYPES:
+            raise HTTPException(status_code=400, detail=f"dtype no soportado: {dtype} (se espera uint8 o float32).")
+        count = int(np.prod(shape))
+        if len(body) - f.tell() != count * dtype.itemsize:
+            raise HTTPException(status_code=400, detail="El tamaño de los datos no coincide con la cabecera .npy.")
+        arr = np.frombuffer(body, dtype=dtype, count=count, offset=f.tell()).reshape(shape)
+    else:
+        n, rest = divmod(len(body), int(np.prod(TENSOR_IMAGE_SHAPE)))
+        if n == 0 or rest:
+            raise HTTPException(status_code=400, detail=f"Se esperan N*{int(np.prod(TENSOR_IMAGE_SHAPE))} bytes RGB uint8 (224x224x3 por imagen).")
+        arr = np.frombuffer(body, dtype=np.uint8)
+        arr = arr.reshape(TENSOR_IMAGE_SHAPE if n == 1 else (n, *TENSOR_IMAGE_SHAPE))
+
+    if arr.shape[-3:] != TENSOR_IMAGE_SHAPE or arr.ndim not in (3, 4) or arr.size == 0:
+        raise HTTPException(status_code=400, detail=f"Forma no soportada: {arr.shape}; se espera (224, 224, 3) o (N, 224, 224, 3).")
+    return arr
+
+# -----------------------------------
+# Métricas por etapa y por petición
+# -----------------------------------
+
+# Histogramas y contadores de prometheus_client: ~1-2 µs por observación,
+# despreciable frente a decode + inferencia; se dejan siempre activos.
+
+LATENCY_BUCKETS = [0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0]
+
+PREDICT_STAGE_SECONDS = Histogram(
+    "predict_stage_seconds",
+    "Duración por etapa: read, open, prepare, decode_queue, model_queue, model, format",
+    ["stage", "model_version"], buckets=LATENCY_BUCKETS,
+)
+PREDICT_REQUEST_SECONDS = Histogram(
+    "predict_request_seconds", "Latencia total por endpoint",
+    ["endpoint"], buckets=LATENCY_BUCKETS,
+)
+PREDICT_REQUESTS = Counter(
+    "predict_requests_total", "Predicciones por endpoint, código HTTP, clase top-1 y versión",
+    ["endpoint", "status", "top_class", "model_version"],
+)
+IMAGE_BYTES = Histogram(
+    "image_bytes", "Tamaño de las imágenes subidas (bytes)",
+    buckets=[2**i for i in range(14, 26)],  # 16 KB .. 32 MB
+)
+IMAGE_PIXELS = Histogram(
+    "image_pixels", "Resolución de las imágenes subidas (ancho*alto, antes del draft)",
+    buckets=[50_176, 250_000, 1e6, 2e6, 4e6, 8e6, 12e6, 16e6, 24e6, 50e6],
+)
+
+@contextmanager
+def count_request(endpoint: str):
+    # El endpoint completa top_class y model_version en el dict; el código HTTP
+    # sale de la excepción si la hubo
+    outcome: Dict[str, Any] = {"status": 200, "top_class": "none", "model_version": ""}
+    started = time.perf_counter()
+    try:
+        yield outcome
+    except HTTPException as e:
+        outcome["status"] = e.status_code
+        raise
+    except Exception:
+        outcome["status"] = 500
+        raise
+    finally:
+        PREDICT_REQUEST_SECONDS.labels(endpoint).observe(time.perf_counter() - started)
+        PREDICT_REQUESTS.labels(
+            endpoint, str(outcome["status"]), outcome["top_class"], outcome["model_version"]
+        ).inc()
+
+# -------------------------------------------
+# Ejecución fuera del event loop y admisión
+# -------------------------------------------
+
+EXECUTOR_QUEUE_SECONDS = Histogram(
+    "executor_queue_seconds", "Espera antes de que un worker tome el trabajo",
+    ["stage"], buckets=LATENCY_BUCKETS,
+)
+EXECUTOR_RUN_SECONDS = Histogram(
+    "executor_run_seconds", "Tiempo de ejecución en el worker",
+    ["stage"], buckets=LATENCY_BUCKETS,
+)
+ADMISSION_PENDING = Gauge("admission_pending_images", "Imágenes admitidas en proceso", multiprocess_mode="livesum")
+ADMISSION_REJECTED = Counter("admission_rejected_total", "Peticiones rechazadas por saturación")
+
+executor = ThreadPoolExecutor(max_workers=INFER_WORKERS, thread_name_prefix="infer")
+
+class Timings:
+    # Acumula duraciones por etapa de una petición (Server-Timing) y las observa
+    # en predict_stage_seconds. En /predict/batch se suman desde varios hilos.
+    def __init__(self, model_version: str = ""):
+        self.model_version = model_version
+        self.stages: Dict[str, float] = {}
+        self._lock = threading.Lock()
+
+    def add(self, stage: str, seconds: float) -> None:
+        PREDICT_STAGE_SECONDS.labels(stage, self.model_version).observe(seconds)
+        with self._lock:
+            self.stages[stage] = self.stages.get(stage, 0.0) + seconds
+
+    def header(self) -> str:
+        return ", ".join(f"{k};dur={v * 1000:.1f}" for k, v in self.stages.items())
+
+async def run_cpu(stage: str, fn: Callable, *args) -> Tuple[Any, float, float]:
+    # Ejecuta fn en el executor y devuelve (resultado, espera en cola, ejecución)
+    submitted = time.perf_counter()
+
+    def job():
+        started = time.perf_counter()
+        out = fn(*args)
+        return out, started - submitted, time.perf_counter() - started
+
+    out, queued, ran = await asyncio.get_running_loop().run_in_executor(executor, job)
+    EXECUTOR_QUEUE_SECONDS.labels(stage).observe(queued)
+    EXECUTOR_RUN_SECONDS.labels(stage).observe(ran)
+    return out, queued, ran
+
+class AdmissionGate:
+    # Cola de admisión acotada: cuenta imágenes en proceso (decode + inferencia)
+    # y rechaza con 503 + Retry-After en vez de acumular latencia. Solo se usa
+    # desde el event loop, no necesita lock.
+
+    def __init__(self, capacity: int):
+        self.capacity = max(1, capacity)
+        self.pending = 0
+
+    @asynccontextmanager
+    async def admit(self, n: int = 1):
+        # Un lote más grande que la capacidad se admite solo con la cola vacía
+        if self.pending and self.pending + n > self.capacity:
+            ADMISSION_REJECTED.inc()
+            raise HTTPException(
+                status_code=503,
+                detail="Servicio saturado, reintente en unos segundos.",
+                headers={"Retry-After": str(RETRY_AFTER_S)},
+            )
+        self.pending += n
+        ADMISSION_PENDING.set(self.pending)
+        try:
+            yield
+        finally:
+            self.pending -= n
+            ADMISSION_PENDING.set(self.pending)
+
+admission = AdmissionGate(INFER_MAX_PENDING)
+
+# -------------------------------
+# Micro-batching de inferencias
+# -------------------------------
+
+BATCH_QUEUE_DEPTH = Gauge("batch_queue_depth", "Peticiones esperando a entrar en un lote", multiprocess_mode="livesum")
+BATCH_SIZE = Histogram(
+    "batch_size", "Imágenes por lote ejecutado",
+    buckets=[1, 2, 4, 8, 16, 32, 64],
+)
+BATCH_WAIT_SECONDS = Histogram(
+    "batch_wait_seconds", "Tiempo en cola antes de ejecutar el lote",
+    buckets=[0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0],
+)
+
+class MicroBatcher:
+    # Agrupa peticiones concurrentes hasta max_batch imágenes o max_wait_ms,
+    # ejecuta un único predict (N,224,224,3) y reparte las filas a cada llamador.
+    # Una petición puede aportar varias filas (POST /predict/batch); nunca se parte.
+    # Los lotes se arman en un búfer propio preasignado: se ejecuta uno a la vez.
+
+    def __init__(self, predict_fn: Callable[[np.ndarray], np.ndarray], max_batch: int, max_wait_ms: float):
+        self.predict_fn = predict_fn
+        self.max_batch = max(1, max_batch)
+        self.max_wait = max(0.0, max_wait_ms) / 1000.0
+        self.queue: Optional[asyncio.Queue] = None
+        self._task: Optional[asyncio.Task] = None
+        self._buf = np.empty((self.max_batch, *IMG_SIZE, 3), dtype=np.float32)
+
+    def start(self) -> None:
+        self.queue = asyncio.Queue()
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def submit(self, x: Union[np.ndarray, List[np.ndarray]]) -> Tuple[np.ndarray, float, float]:
+        # x: tensor (n,224,224,3) ya preprocesado, o lista de tensores que suman n
+        # filas (se copian directo al búfer del lote). Devuelve probabilidades
+        # (n, clases), espera total en cola (lote + executor) y tiempo del modelo.
+        parts = x if isinstance(x, list) else [x]
+        fut = asyncio.get_running_loop().create_future()
+        self.queue.put_nowait((parts, sum(len(p) for p in parts), fut, time.perf_counter()))
+        BATCH_QUEUE_DEPTH.set(self.queue.qsize())
+        return await fut
+
+    async def _collect(self) -> list:
+        loop = asyncio.get_running_loop()
+        batch = [await self.queue.get()]
+        rows = batch[0][1]
+        deadline = loop.time() + self.max_wait
+        while rows < self.max_batch:
+            # Primero lo que ya está en cola, luego esperar hasta el deadline
+            if not self.queue.empty():
+                item = self.queue.get_nowait()
+            else:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    item = await asyncio.wait_for(self.queue.get(), timeout)
+                except asyncio.TimeoutError:
+                    break
+            batch.append(item)
+            rows += item[1]
+        return batch
+
+    async def _run(self) -> None:
+        while True:
+            batch = await self._collect()
+            BATCH_QUEUE_DEPTH.set(self.queue.qsize())
+            collected = time.perf_counter()
+            for _, _, _, enqueued in batch:
+                BATCH_WAIT_SECONDS.observe(collected - enqueued)
+            parts = [p for item in batch for p in item[0]]
+            rows = sum(item[1] for item in batch)
+            if len(parts) == 1:
+                x = parts[0]
+            elif rows <= len(self._buf):
+                x = np.concatenate(parts, axis=0, out=self._buf[:rows])
+            else:
+                # Una sola petición con más filas que max_batch
+                x = np.concatenate(parts, axis=0)
+            BATCH_SIZE.observe(rows)
+
+            try:
+                out, queued, ran = await run_cpu("model", self.predict_fn, x)
+            except Exception as e:
+                for _, _, fut, _ in batch:
+                    if not fut.done():
+                        fut.set_exception(e)
+                continue
+
+            offset = 0
+            for _, n, fut, enqueued in batch:
+                # El llamador pudo haber cancelado (cliente desconectado)
+                if not fut.done():
+                    # predict_fn puede devolver varias salidas (probabilidades, embedding)
+                    rows = tuple(o[offset:offset + n] for o in out) if isinstance(out, tuple) else out[offset:offset + n]
+                    fut.set_result((rows, collected - enqueued + queued, ran))
+                offset += n
+
+
+# ------------------------------
+# Caché de predicciones
+# ------------------------------
+
+CACHE_HITS = Counter("prediction_cache_hits_total", "Predicciones servidas desde caché")
+CACHE_MISSES = Counter("prediction_cache_misses_total", "Búsquedas en caché sin resultado")
+CACHE_EVICTIONS = Counter("prediction_cache_evictions_total", "Entradas descartadas", ["reason"])
+CACHE_ENTRIES = Gauge("prediction_cache_entries", "Entradas en caché", multiprocess_mode="livesum")
+
+class PredictionCache:
+    # LRU con TTL indexada por hash de los bytes subidos + versión del modelo.
+    # Guarda el vector de probabilidades completo, así cualquier top_k/lang se
+    # sirve sin decodificar ni ejecutar el modelo. Solo se usa desde el event loop.
+
+    def __init__(self, max_entries: int, ttl_s: float):
+        self.max_entries = max(0, max_entries)
+        self.ttl = ttl_s
+        self._data: "OrderedDict[str, Tuple[np.ndarray, float]]" = OrderedDict()
+
+    @staticmethod
+    def key(contents: bytes, version: str) -> str:
+        return f"{version}:{hashlib.blake2b(contents, digest_size=16).hexdigest()}"
+
+    def get(self, key: str) -> Optional[np.ndarray]:
+        if not self.max_entries:
+            return None
+        item = self._data.get(key)
+        if item is not None and item[1] < time.monotonic():
+            del self._data[key]
+            CACHE_EVICTIONS.labels("ttl").inc()
+            CACHE_ENTRIES.set(len(self._data))
+            item = None
+        if item is None:
+            CACHE_MISSES.inc()
+            return None
+        self._data.move_to_end(key)
+        CACHE_HITS.inc()
+        return item[0]
+
+    def put(self, key: str, probs: np.ndarray) -> None:
+        if not self.max_entries:
+            return
+        # Copia: probs suele ser una fila de la salida del lote completo
+        self._data[key] = (np.array(probs, copy=True), time.monotonic() + self.ttl)
+        self._data.move_to_end(key)
+        while len(self._data) > self.max_entries:
+            self._data.popitem(last=False)
+            CACHE_EVICTIONS.labels("lru").inc()
+        CACHE_ENTRIES.set(len(self._data))
+
+cache = PredictionCache(CACHE_MAX_ENTRIES, CACHE_TTL_S)
+# Entrada del embedding de una imagen (POST /predict?embedding=true), junto a sus probabilidades
+EMBED_KEY_SUFFIX = ":emb"
+
+# -----------------------------
+# Registro de modelos
+# -----------------------------
+
+CASCADE_ANSWERS = Counter("cascade_answers_total", "Imágenes respondidas por cada nivel de la cascada", ["tier"])
+CASCADE_ESCALATIONS = Counter("cascade_escalations_total", "Imágenes escaladas al modelo principal", ["reason"])
+
+def encode_embedding(vec: np.ndarray) -> Dict[str, Any]:
+    # float16 little-endian en base64: 576 dimensiones -> 1152 bytes
+    return {
+        "dim": int(vec.size),
+        "dtype": "float16",
+        "data": base64.b64encode(vec.astype("<f2").tobytes()).decode("ascii"),
+    }
+
+class ModelBundle:
+    # Una versión servible: motor + clases EN/ES + recomendaciones, con su
+    # propio micro-batcher (y opcionalmente el motor barato de la cascada con
+    # el suyo). No se modifica una vez cargada.
+
+    def __init__(self, version: str, engine: InferenceEngine, class_names_en: List[str],
+                 class_names_es: List[str], advice: Dict[str, Dict[str, Any]],
+                 fast_engine: Optional[InferenceEngine] = None):
+        self.version = version
+        self.engine = engine
+        self.class_names_en = class_names_en
+        self.class_names_es = class_names_es
+        self.advice = advice
+        self.loaded_at = time.time()
+        # Peticiones en curso sobre esta versión (solo desde el event loop)
+        self.inflight = 0
+        self.batcher = MicroBatcher(engine.predict, max_batch=BATCH_MAX_SIZE, max_wait_ms=BATCH_MAX_WAIT_MS)
+        self.fast_engine = fast_engine
+        self.fast_batcher = None
+        if fast_engine is not None:
+            self.fast_batcher = MicroBatcher(fast_engine.predict, max_batch=BATCH_MAX_SIZE, max_wait_ms=BATCH_MAX_WAIT_MS)
+        self.embed_batcher = None
+        if engine.embedding_dim:
+            self.embed_batcher = MicroBatcher(engine.predict_with_embedding, max_batch=BATCH_MAX_SIZE, max_wait_ms=BATCH_MAX_WAIT_MS)
+
+    @property
+    def num_classes(self) -> int:
+        return self.engine.num_classes
+
+    def _batchers(self) -> List[MicroBatcher]:
+        return [b for b in (self.batcher, self.fast_batcher, self.embed_batcher) if b is not None]
+
+    def start(self) -> None:
+        for b in self._batchers():
+            b.start()
+
+    async def stop(self) -> None:
+        for b in self._batchers():
+            await b.stop()
+
+    async def predict_with_embedding(self, x: Union[np.ndarray, List[np.ndarray]], timings: "Timings") -> Tuple[np.ndarray, np.ndarray]:
+        # Siempre con el motor principal (la cascada no aplica): el embedding
+        # debe venir de la misma base que las cabezas que lo van a re-puntuar
+        (probs, emb), queued, ran = await self.embed_batcher.submit(x)
+        timings.add("model_queue", queued)
+        timings.add("model", ran)
+        return probs, emb
+
+    async def predict(self, x: Union[np.ndarray, List[np.ndarray]], timings: "Timings") -> Tuple[np.ndarray, List[str]]:
+        # Probabilidades (n, clases) y el nivel que respondió cada fila: "fast"
+        # (motor de la cascada) o "full" (motor principal)
+        if self.fast_batcher is None:
+            probs, queued, ran = await self.batcher.submit(x)
+            timings.add("model_queue", queued)
+            timings.add("model", ran)
+            return probs, ["full"] * len(probs)
+
+        probs, queued, ran = await self.fast_batcher.submit(x)
+        timings.add("fast_queue", queued)
+        timings.add("fast", ran)
+        top2 = np.sort(probs, axis=1)[:, -2:]
+        low_prob = top2[:, 1] < CASCADE_MIN_PROB
+        low_margin = top2[:, 1] - top2[:, 0] < CASCADE_MIN_MARGIN
+        doubt = np.flatnonzero(low_prob | low_margin)
+        tiers = ["fast"] * len(probs)
+        CASCADE_ANSWERS.labels("fast").inc(len(probs) - len(doubt))
+        if len(doubt) == 0:
+            return probs, tiers
+
+        CASCADE_ANSWERS.labels("full").inc(len(doubt))
+        CASCADE_ESCALATIONS.labels("low_prob").inc(int(low_prob.sum()))
+        CASCADE_ESCALATIONS.labels("low_margin").inc(int((low_margin & ~low_prob).sum()))
+        # Solo las filas dudosas, como vistas (siguen en los búferes del llamador)
+        rows = [p[j:j + 1] for p in (x if isinstance(x, list) else [x]) for j in range(len(p))]
+        full, queued, ran = await self.batcher.submit([rows[i] for i in doubt])
+        timings.add("model_queue", queued)
+        timings.add("model", ran)
+        # probs es una vista del resultado del lote compartido: se copia antes de escribir
+        probs = np.array(probs)
+        probs[doubt] = full
+        for i in doubt:
+            tiers[i] = "full"
+        return probs, tiers
+
+    def get_recomendation(self, label_en: str) -> Dict[str, Any]:
+        # Devuelve bloque de recomendación. Fallback genérico si no hay entrada.
+        return self.advice.get(
+            label_en,
+            {
+                "title": label_en,
+                "severity":"desconocida",
+                "advice":[
+                    "Monitorear evolución de síntomas",
+                    "Mejorar ventilación y evitar mojado foliar",
+                    "Consultar asesoría técnica local si progresa"
+                ]
+            }
+        )
+
+    def format_topk(self, probs: np.ndarray, top_k: int, lang: str) -> List[Dict[str, Any]]:
+        k = int(max(1, min(top_k, probs.size)))
+        idxs = np.argsort(probs)[-k:][::-1]
+        out: List[Dict[str, Any]] = []
+        for i in idxs:
+            label_en = self.class_names_en[i]
+            item: Dict[str, Any] = {
+                "index": int(i),
+                "label_en": label_en,
+                "probability": float(probs[i]),
+                "recomendation":self.get_recomendation(label_en)
+            }
+            if lang == "es":
+                item["label_es"] = self.class_names_es[i]
+            out.append(item)
+        return out
+
+    def describe(self) -> Dict[str, Any]:
+        return {
+            "version": self.version,
+            "backend": self.engine.name,
+            "artifact": self.engine.version,
+            "cascade": None if self.fast_engine is None else {
+                "backend": self.fast_engine.name,
+                "artifact": self.fast_engine.version,
+                "min_prob": CASCADE_MIN_PROB,
+                "min_margin": CASCADE_MIN_MARGIN,
+            },
+            "num_classes": self.num_classes,
+            "embedding_dim": self.engine.embedding_dim,
+            "loaded_at": self.loaded_at,
+            "inflight": self.inflight,
         }
-        if lang == "es":
-            item["label_es"] = class_names_es[i]
-        out.append(item)
-    return out
+
+def load_bundle_from_dir(version: str) -> ModelBundle:
+    model_dir = os.path.join(MODELS_DIR, version)
+    if not os.path.isdir(model_dir):
+        raise RuntimeError(f"No existe {model_dir}")
+    class_names = load_class_map(os.path.join(model_dir, "class_map_es.json"))
+    advice_path = os.path.join(model_dir, "advice.json")
+    if not os.path.exists(advice_path):
+        advice_path = ADVICE_PATH
+    return load_bundle(version, model_dir, class_names, load_advice(advice_path, class_names[0]))
+
+class ModelRegistry:
+    # Versiones cargadas y cuál es la activa. El cambio de versión activa es una
+    # sola asignación en el event loop; cada petición toma su bundle al empezar
+    # (use), así las que están en curso terminan con la versión anterior.
+
+    def __init__(self):
+        self.bundles: Dict[str, ModelBundle] = {}
+        self.active: Optional[str] = None
+        # versión -> "loading" o "failed: <error>"
+        self.loading: Dict[str, str] = {}
+        # Cargas en segundo plano: el loop solo guarda referencias débiles a las tareas
+        self._tasks: set = set()
+
+    def add(self, bundle: ModelBundle, activate: bool) -> None:
+        bundle.start()
+        self.bundles[bundle.version] = bundle
+        if activate or self.active is None:
+            self.active = bundle.version
+
+    def get(self, version: Optional[str] = None) -> ModelBundle:
+        if version is None:
+            if self.active is None:
+                require_ready()
+            return self.bundles[self.active]
+        bundle = self.bundles.get(version)
+        if bundle is None:
+            raise HTTPException(status_code=404, detail=f"Versión de modelo no cargada: {version}")
+        return bundle
+
+    @asynccontextmanager
+    async def use(self, version: Optional[str] = None):
+        bundle = self.get(version)
+        bundle.inflight += 1
+        try:
+            yield bundle
+        finally:
+            bundle.inflight -= 1
+
+    def start_load(self, version: str, activate: bool) -> None:
+        # Carga en segundo plano (POST /models/{version}/load); el resultado queda en loading
+        self.loading[version] = "loading"
+        task = asyncio.create_task(self.load(version, activate))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def load(self, version: str, activate: bool) -> None:
+        self.loading[version] = "loading"
+        try:
+            bundle = await asyncio.to_thread(load_bundle_from_dir, version)
+            self.add(bundle, activate)
+        except Exception as e:
+            self.loading[version] = f"failed: {e}"
+            print(f"Modelo {version}: error al cargar: {e}")
+            return
+        del self.loading[version]
+        print(f"Modelo {version}: cargado{' y activo' if activate else ''}")
+
+    def activate(self, version: str) -> None:
+        self.active = self.get(version).version
+
+    async def unload(self, version: str) -> None:
+        if version == self.active:
+            raise HTTPException(status_code=409, detail="No se puede descargar la versión activa.")
+        bundle = self.get(version)
+        del self.bundles[version]
+        # Las peticiones que ya la tomaron terminan antes de detener su batcher
+        while bundle.inflight:
+            await asyncio.sleep(0.05)
+        await bundle.stop()
+
+    async def shutdown(self) -> None:
+        for task in list(self._tasks):
+            task.cancel()
+        for bundle in list(self.bundles.values()):
+            await bundle.stop()
+
+registry = ModelRegistry()
+
+def check_admin(x_admin_token: Optional[str] = Header(None)) -> None:
+    if not MODEL_ADMIN_TOKEN:
+        raise HTTPException(status_code=403, detail="Administración de modelos desactivada (MODEL_ADMIN_TOKEN).")
+    if x_admin_token != MODEL_ADMIN_TOKEN:
+        raise HTTPException(status_code=401, detail="Token inválido.")
 
 # ----------
 # Rutas
@@ -131,63 +1109,349 @@ def format_topk(probs: np.ndarray, top_k: int, lang: str) -> List[Dict[str, Any]
 
 @app.get("/")
 def home():
+    active = registry.bundles.get(registry.active) if registry.active else None
     return {
         "message": "Ok. Post imagen a /predict",
-        "model_ outputs": num_classes_model,
+        "backend": INFERENCE_BACKEND,
+        "ready": startup.ready,
+        "model_version": registry.active,
+        "model_ outputs": active.num_classes if active else None,
         "img_size": IMG_SIZE,
         "top_k_defaults": TOP_K
     }
 
+@app.get("/livez")
+def livez():
+    # El proceso responde; solo falla si la carga del modelo terminó en error
+    if startup.phase == "failed":
+        return JSONResponse({"status": "failed", "error": startup.error}, status_code=500)
+    return {"status": "ok"}
+
+@app.get("/readyz")
+def readyz():
+    body = {"status": startup.phase, "startup_seconds": startup.timings}
+    if not startup.ready:
+        return JSONResponse(body, status_code=503, headers={"Retry-After": str(RETRY_AFTER_S)})
+    return body
+
+@app.get("/metrics")
+def metrics():
+    # Con WEB_WORKERS > 1 cada proceso escribe sus métricas en PROMETHEUS_MULTIPROC_DIR
+    # y aquí se agregan; sin esa variable se exporta el registro del proceso.
+    if os.getenv("PROMETHEUS_MULTIPROC_DIR"):
+        prom_registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(prom_registry)
+        return Response(generate_latest(prom_registry), media_type=CONTENT_TYPE_LATEST)
+    return Response(generate_latest(), media_type=CONTENT_TYPE_LATEST)
+
+VERSION_QUERY = Query(None, description="Fijar una versión cargada (ver GET /models); por defecto la activa")
+
 @app.get("/classes")
-def classes(lang:str = Query(LANG_DEF, pattern="^(es|en)$")):
+async def classes(lang:str = Query(LANG_DEF, pattern="^(es|en)$"), version: Optional[str] = VERSION_QUERY):
+    bundle = registry.get(version)
     data = []
-    for i, en in enumerate(class_names_en):
+    for i, en in enumerate(bundle.class_names_en):
         row = {"index": i, "label_en":en}
         if lang == "es":
-            row["label_es"] = class_names_es[i]
+            row["label_es"] = bundle.class_names_es[i]
         data.append(row)
-    return {"count": len(data), "lang": lang, "classes": data}
+    return {"count": len(data), "lang": lang, "model_version": bundle.version, "classes": data}
 
 @app.get("/advice")
-def advice(label:str = Query(..., description = "Nombre exacto de clase en inglés (class_names_en)")):
-    if label not in class_names_en:
+async def advice(label:str = Query(..., description = "Nombre exacto de clase en inglés (class_names_en)"), version: Optional[str] = VERSION_QUERY):
+    bundle = registry.get(version)
+    if label not in bundle.class_names_en:
         raise HTTPException(status_code=404, detail=f"Clase desconocida: {label}")
-    idx = class_names_en.index(label)
+    idx = bundle.class_names_en.index(label)
     return {
         "index": idx,
         "label_en": label,
-        "label_es": class_names_es[idx],
-        "recomendation": get_recomendation(label)
+        "label_es": bundle.class_names_es[idx],
+        "recomendation": bundle.get_recomendation(label)
     }
 
+@app.get("/models")
+async def list_models():
+    return {
+        "active": registry.active,
+        "versions": [
+            {**b.describe(), "active": v == registry.active} for v, b in registry.bundles.items()
+        ],
+        "loading": registry.loading,
+    }
+
+VERSION_PATH = Path(..., pattern=r"^[A-Za-z0-9][A-Za-z0-9._-]*$")
+
+@app.post("/models/{version}/load", status_code=202, dependencies=[Depends(check_admin)])
+async def load_version(version: str = VERSION_PATH, activate: bool = Query(False)):
+    # Carga MODELS_DIR/<version> en segundo plano; validar con GET /models
+    if version in registry.bundles or registry.loading.get(version) == "loading":
+        raise HTTPException(status_code=409, detail=f"La versión {version} ya está cargada o cargándose.")
+    registry.start_load(version, activate)
+    return {"version": version, "status": "loading", "activate": activate}
+
+@app.post("/models/{version}/activate", dependencies=[Depends(check_admin)])
+async def activate_version(version: str = VERSION_PATH):
+    registry.activate(version)
+    return {"active": registry.active}
+
+@app.delete("/models/{version}", dependencies=[Depends(check_admin)])
+async def unload_version(version: str = VERSION_PATH):
+    await registry.unload(version)
+    return {"unloaded": version}
+
 @app.post("/predict")
-async def predict(file: UploadFile = File(...), top_k: int = Query(TOP_K, ge = 1, le = 10), lang: str = Query(LANG_DEF, pattern="^(es|en)$")):
+async def predict(response: Response, file: UploadFile = File(...), top_k: int = Query(TOP_K, ge = 1, le = 10), lang: str = Query(LANG_DEF, pattern="^(es|en)$"), version: Optional[str] = VERSION_QUERY, embedding: bool = Query(False, description="Incluir el embedding float16 de la base (requiere EMBEDDINGS=1)")):
+    with count_request("predict") as outcome:
+        return await _predict(response, file, top_k, lang, version, embedding, outcome)
+
+async def _predict(response: Response, file: UploadFile, top_k: int, lang: str, version: Optional[str], embedding: bool, outcome: Dict[str, Any]):
     if file.content_type not in ALLOWED_MIMES:
         raise HTTPException(status_code=415, detail = f"Tipo no soportado: {file.content_type}")
-    
-    try:
+
+    async with registry.use(version) as bundle:
+        outcome["model_version"] = bundle.version
+        if embedding and bundle.embed_batcher is None:
+            raise HTTPException(status_code=400, detail=f"Embeddings no disponibles: requieren EMBEDDINGS=1 y el motor keras (actual: {bundle.engine.name}).")
+        timings = Timings(bundle.version)
+        started = time.perf_counter()
         contents = await file.read()
-        img = Image.open(io.BytesIO(contents))
-    except UnidentifiedImageError:
-        raise HTTPException(status_code=400, detail="Archivo no es una imagen válida.")
-    except Exception:
-        raise HTTPException(status_code=400, detail="No se pudo leer la imagen.")
-    
-    x = prepare_image(img)
+        timings.add("read", time.perf_counter() - started)
+        IMAGE_BYTES.observe(len(contents))
+
+        key = cache.key(contents, bundle.version)
+        probs = cache.get(key)
+        # El embedding se guarda en la caché junto a las probabilidades (clave aparte):
+        # con embedding=true solo es hit si están los dos
+        emb_row = cache.get(key + EMBED_KEY_SUFFIX) if embedding else None
+        if embedding and emb_row is None:
+            probs = None
+        response.headers["X-Cache"] = "miss" if probs is None else "hit"
+        # Nivel que respondió: "fast" / "full" (cascada) o "cache"
+        tier = "cache"
+
+        if probs is None:
+            async with admission.admit():
+                buf = input_pool.acquire()
+                try:
+                    x, queued, _ = await run_cpu("decode", load_image, contents, timings, buf)
+                except HTTPException:
+                    input_pool.release(buf)
+                    raise
+                timings.add("decode_queue", queued)
+
+                try:
+                    if embedding:
+                        # La base completa corre igual para sacar el embedding: sus
+                        # probabilidades reemplazan a las de la cascada
+                        probs, emb = await bundle.predict_with_embedding(x, timings)
+                        emb_row = emb[0]
+                        cache.put(key + EMBED_KEY_SUFFIX, emb_row)
+                        tiers = ["full"]
+                    else:
+                        probs, tiers = await bundle.predict(x, timings)
+                except Exception as e:
+                    input_pool.release(buf)
+                    raise HTTPException(status_code=500, detail=f"Error en inferencia: {e}")
+                input_pool.release(buf)
+
+            probs, tier = probs[0], tiers[0]
+            cache.put(key, probs)
+
+        started = time.perf_counter()
+        predictions = bundle.format_topk(probs, top_k, lang)
+        timings.add("format", time.perf_counter() - started)
+        response.headers["Server-Timing"] = timings.header()
+        outcome["top_class"] = predictions[0]["label_en"]
+
+    out = {
+        "model_version": bundle.version,
+        "top_k": int(top_k),
+        "lang": lang,
+        "tier": tier,
+        "predictions": predictions,
+        "disclaimer": "Siga regulaciones locales y etiquetas de productos; consulte asesoría técnica si es necesario."
+    }
+    if emb_row is not None:
+        out["embedding"] = encode_embedding(emb_row)
+    return out
+
+@app.post("/predict/batch")
+async def predict_batch(response: Response, files: List[UploadFile] = File(...), top_k: int = Query(TOP_K, ge = 1, le = 10), lang: str = Query(LANG_DEF, pattern="^(es|en)$"), version: Optional[str] = VERSION_QUERY):
+    with count_request("predict_batch") as outcome:
+        return await _predict_batch(response, files, top_k, lang, version, outcome)
+
+async def _predict_batch(response: Response, files: List[UploadFile], top_k: int, lang: str, version: Optional[str], outcome: Dict[str, Any]):
+    if len(files) > BATCH_MAX_FILES:
+        raise HTTPException(status_code=413, detail=f"Máximo {BATCH_MAX_FILES} archivos por petición.")
+
+    async with registry.use(version) as bundle:
+        outcome["model_version"] = bundle.version
+        timings = Timings(bundle.version)
+        # per_file[i]: vector de probabilidades o la excepción de ese archivo
+        per_file: List[Any] = [None] * len(files)
+        tier_of: Dict[int, str] = {}
+        keys: Dict[int, str] = {}
+        pending: Dict[int, bytes] = {}
+        for i, file in enumerate(files):
+            if file.content_type not in ALLOWED_MIMES:
+                per_file[i] = HTTPException(status_code=415, detail = f"Tipo no soportado: {file.content_type}")
+                continue
+            started = time.perf_counter()
+            contents = await file.read()
+            timings.add("read", time.perf_counter() - started)
+            IMAGE_BYTES.observe(len(contents))
+            keys[i] = cache.key(contents, bundle.version)
+            per_file[i] = cache.get(keys[i])
+            if per_file[i] is None:
+                pending[i] = contents
+
+        async def decode(contents: bytes) -> np.ndarray:
+            buf = input_pool.acquire()
+            try:
+                x, queued, _ = await run_cpu("decode", load_image, contents, timings, buf)
+            except HTTPException:
+                input_pool.release(buf)
+                raise
+            timings.add("decode_queue", queued)
+            return x
+
+        if pending:
+            async with admission.admit(len(pending)):
+                # Decodificación en paralelo; un archivo malo no invalida al resto
+                idxs = list(pending)
+                decoded = await asyncio.gather(*(decode(pending[i]) for i in idxs), return_exceptions=True)
+                ok = []
+                for i, d in zip(idxs, decoded):
+                    if isinstance(d, np.ndarray):
+                        ok.append((i, d))
+                    else:
+                        per_file[i] = d
+
+                if ok:
+                    bufs = [d for _, d in ok]
+                    try:
+                        probs, tiers = await bundle.predict(bufs, timings)
+                    except Exception as e:
+                        input_pool.release(*bufs)
+                        raise HTTPException(status_code=500, detail=f"Error en inferencia: {e}")
+                    input_pool.release(*bufs)
+                    for (i, _), p, t in zip(ok, probs, tiers):
+                        per_file[i] = p
+                        tier_of[i] = t
+                        cache.put(keys[i], p)
+
+        results: List[Dict[str, Any]] = []
+        errors = 0
+        started = time.perf_counter()
+        for i, (file, o) in enumerate(zip(files, per_file)):
+            row: Dict[str, Any] = {"index": i, "filename": file.filename}
+            if isinstance(o, np.ndarray):
+                row["tier"] = tier_of.get(i, "cache")
+                row["predictions"] = bundle.format_topk(o, top_k, lang)
+                PREDICT_REQUESTS.labels("predict_batch_file", "200", row["predictions"][0]["label_en"], bundle.version).inc()
+            else:
+                if isinstance(o, HTTPException):
+                    row["error"] = {"status_code": o.status_code, "detail": o.detail}
+                else:
+                    row["error"] = {"status_code": 400, "detail": f"No se pudo procesar el archivo: {o}"}
+                PREDICT_REQUESTS.labels("predict_batch_file", str(row["error"]["status_code"]), "none", bundle.version).inc()
+                errors += 1
+            results.append(row)
+        timings.add("format", time.perf_counter() - started)
+        response.headers["Server-Timing"] = timings.header()
 
-    try:
-        probs = model.predict(x, verbose=0)[0]
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Error en inferencia: {e}")
-    
     return {
-        "model_version": os.path.basename(MODEL_PATH),
+        "model_version": bundle.version,
         "top_k": int(top_k),
         "lang": lang,
-        "predictions": format_topk(probs, top_k, lang),
+        "count": len(results),
+        "errors": errors,
+        "results": results,
         "disclaimer": "Siga regulaciones locales y etiquetas de productos; consulte asesoría técnica si es necesario."
     }
 
+@app.post("/predict/tensor")
+async def predict_tensor(request: Request, response: Response, top_k: int = Query(TOP_K, ge = 1, le = 10), lang: str = Query(LANG_DEF, pattern="^(es|en)$"), version: Optional[str] = VERSION_QUERY):
+    with count_request("predict_tensor") as outcome:
+        return await _predict_tensor(request, response, top_k, lang, version, outcome)
+
+async def _predict_tensor(request: Request, response: Response, top_k: int, lang: str, version: Optional[str], outcome: Dict[str, Any]):
+    content_type = request.headers.get("content-type", "").split(";")[0].strip()
+    if content_type not in TENSOR_MIMES:
+        raise HTTPException(status_code=415, detail = f"Tipo no soportado: {content_type}")
+    # float32 más holgura para la cabecera .npy
+    max_bytes = BATCH_MAX_FILES * int(np.prod(TENSOR_IMAGE_SHAPE)) * 4 + 4096
+    too_large = f"Máximo {BATCH_MAX_FILES} imágenes por petición."
+    if int(request.headers.get("content-length") or 0) > max_bytes:
+        raise HTTPException(status_code=413, detail=too_large)
+    # Se lee antes de tomar el modelo: una subida lenta no retiene la versión
+    started = time.perf_counter()
+    body = await read_body_capped(request, max_bytes, too_large)
+    read_seconds = time.perf_counter() - started
+
+    async with registry.use(version) as bundle:
+        outcome["model_version"] = bundle.version
+        timings = Timings(bundle.version)
+        timings.add("read", read_seconds)
+        IMAGE_BYTES.observe(len(body))
+
+        arr = parse_tensor(body, content_type)
+        single = arr.ndim == 3
+        x = arr[None] if single else arr
+        if len(x) > BATCH_MAX_FILES:
+            raise HTTPException(status_code=413, detail=too_large)
+
+        # Cada imagen es una vista contigua: se hashea sin copiarla
+        keys = [cache.key(row, bundle.version) for row in x]
+        per_image: List[Optional[np.ndarray]] = [cache.get(k) for k in keys]
+        tier_of: Dict[int, str] = {}
+        pending = [i for i, p in enumerate(per_image) if p is None]
+        response.headers["X-Cache"] = "hit" if not pending else "miss" if len(pending) == len(x) else "partial"
+
+        if pending:
+            async with admission.admit(len(pending)):
+                # uint8 -> float32 directo a búferes del pool; float32 pasa como vista, sin copia
+                started = time.perf_counter()
+                if x.dtype == np.float32:
+                    bufs: List[np.ndarray] = []
+                    parts = [x[i:i + 1] for i in pending]
+                else:
+                    bufs = parts = [input_pool.acquire() for _ in pending]
+                    for buf, i in zip(bufs, pending):
+                        buf[0] = x[i]
+                timings.add("prepare", time.perf_counter() - started)
+
+                try:
+                    probs, tiers = await bundle.predict(parts, timings)
+                except Exception as e:
+                    input_pool.release(*bufs)
+                    raise HTTPException(status_code=500, detail=f"Error en inferencia: {e}")
+                input_pool.release(*bufs)
+            for i, p, t in zip(pending, probs, tiers):
+                per_image[i] = p
+                tier_of[i] = t
+                cache.put(keys[i], p)
+
+        started = time.perf_counter()
+        predictions = [bundle.format_topk(p, top_k, lang) for p in per_image]
+        timings.add("format", time.perf_counter() - started)
+        response.headers["Server-Timing"] = timings.header()
+        if single:
+            outcome["top_class"] = predictions[0][0]["label_en"]
+
+    out: Dict[str, Any] = {"model_version": bundle.version, "top_k": int(top_k), "lang": lang}
+    if single:
+        out["tier"] = tier_of.get(0, "cache")
+        out["predictions"] = predictions[0]
+    else:
+        out["count"] = len(predictions)
+        out["results"] = [{"index": i, "tier": tier_of.get(i, "cache"), "predictions": p} for i, p in enumerate(predictions)]
+    out["disclaimer"] = "Siga regulaciones locales y etiquetas de productos; consulte asesoría técnica si es necesario."
+    return out
+
 
 if __name__ == "__main__":
-    uvicorn.run(app, host = "0.0.0.0", port  = 8000)
\ No newline at end of file
+    # Con WEB_WORKERS > 1 uvicorn abre el socket en este proceso y lanza N workers
+    # que lo comparten; cada uno importa app y carga su propio modelo en el lifespan.
+    uvicorn.run("app:app", host = "0.0.0.0", port = PORT, workers = WEB_WORKERS)
\ No newline at end of file
@@ -0,0 +1,104 @@
+import os
+os.environ.setdefault("CUDA_VISIBLE_DEVICES", "-1")
+os.environ.setdefault("TF_CPP_MIN_LOG_LEVEL", "2")
+
+# Compara decode+resize completo vs decode JPEG reducido (draft) y la
+# coincidencia top-1 del modelo entre ambos caminos.
+#
+# Uso:
+#   python bench_decode.py --images ../MobileNetV3/tomato/val --limit 200
+#   python bench_decode.py --synthetic 20 --size 4000x3000
+
+import argparse
+import io
+import statistics
+import sys
+import time
+from typing import Callable, List, Tuple
+
+import numpy as np
+from PIL import Image
+
+import app
+
+IMG_EXTS = (".jpg", ".jpeg", ".png")
+
+
+def read_images(root: str, limit: int) -> List[bytes]:
+    paths: List[str] = []
+    for dirpath, _, files in os.walk(root):
+        paths.extend(os.path.join(dirpath, f) for f in sorted(files) if f.lower().endswith(IMG_EXTS))
+    out = []
+    for p in sorted(paths)[:limit]:
+        with open(p, "rb") as f:
+            out.append(f.read())
+    return out
+
+
+def synthetic_jpegs(n: int, size: Tuple[int, int], quality: int = 90) -> List[bytes]:
+    # Ruido suavizado: comprime como una foto real, no como un color plano
+    rng = np.random.default_rng(0)
+    out = []
+    for _ in range(n):
+        small = rng.integers(0, 256, (size[1] // 16, size[0] // 16, 3), dtype=np.uint8)
+        img = Image.fromarray(small).resize(size, Image.BICUBIC)
+        buf = io.BytesIO()
+        img.save(buf, format="JPEG", quality=quality)
+        out.append(buf.getvalue())
+    return out
+
+
+def time_path(images: List[bytes], fn: Callable[[bytes], np.ndarray]) -> Tuple[np.ndarray, List[float]]:
+    arrays, times = [], []
+    for contents in images:
+        t0 = time.perf_counter()
+        arrays.append(fn(contents))
+        times.append(time.perf_counter() - t0)
+    return np.concatenate(arrays, axis=0), times
+
+
+def summary(name: str, times: List[float]) -> str:
+    ms = sorted(t * 1000 for t in times)
+    p95 = ms[min(len(ms) - 1, int(0.95 * len(ms)))]
+    return f"{name:8s} media {statistics.mean(ms):7.2f} ms  p50 {statistics.median(ms):7.2f} ms  p95 {p95:7.2f} ms"
+
+
+def main() -> int:
+    ap = argparse.ArgumentParser(description="Benchmark de decode JPEG reducido vs completo.")
+    ap.add_argument("--images", help="Carpeta con imágenes (se recorre recursivamente)")
+    ap.add_argument("--limit", type=int, default=200)
+    ap.add_argument("--synthetic", type=int, default=0, help="Generar N JPEG sintéticos en vez de leer --images")
+    ap.add_argument("--size", default="4000x3000", help="Resolución de los JPEG sintéticos")
+    ap.add_argument("--no-model", action="store_true", help="Omitir la comparación top-1")
+    args = ap.parse_args()
+
+    if args.synthetic:
+        w, h = (int(v) for v in args.size.lower().split("x"))
+        images = synthetic_jpegs(args.synthetic, (w, h))
+    elif args.images:
+        images = read_images(args.images, args.limit)
+    else:
+        ap.error("indicar --images o --synthetic")
+    if not images:
+        print("Sin imágenes.")
+        return 1
+
+    full_x, full_t = time_path(images, lambda c: app.prepare_image(app.open_image(c, draft=False)))
+    draft_x, draft_t = time_path(images, lambda c: app.prepare_image(app.open_image(c, draft=True)))
+
+    print(f"{len(images)} imágenes")
+    print(summary("completo", full_t))
+    print(summary("draft", draft_t))
+    print(f"speedup  {sum(full_t) / sum(draft_t):.2f}x")
+    print(f"|diff| medio por píxel: {float(np.mean(np.abs(full_x - draft_x))):.2f} (escala 0-255)")
+
+    if not args.no_model:
+        engine = app.load_model().engine
+        full_top1 = np.argmax(engine.predict(full_x), axis=1)
+        draft_top1 = np.argmax(engine.predict(draft_x), axis=1)
+        print(f"coincidencia top-1: {float(np.mean(full_top1 == draft_top1)):.2%}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,217 @@
+# Prueba de carga reproducible para POST /predict: genera hojas sintéticas
+# JPEG/PNG en varias resoluciones, las envía a una tasa de llegada fija (lazo
+# abierto) y reporta throughput, p50/p95/p99 y tasa de errores por consola y
+# en JSON. El JSON no lleva marcas de tiempo y usa claves ordenadas, para
+# poder comparar resultados entre commits con un simple diff.
+#
+# Uso (con el servicio ya levantado, idealmente con CACHE_MAX_ENTRIES=0):
+#   python bench_load.py --rate 20 --duration 30 --json bench/load_main.json
+#   python bench_load.py --sizes 640x480 4000x3000 --formats jpeg --rate 5 --concurrency 8
+
+import argparse
+import asyncio
+import io
+import json
+import sys
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+import httpx
+import numpy as np
+from PIL import Image, ImageDraw, ImageFilter
+
+DEFAULT_SIZES = ["640x480", "1280x960", "4000x3000"]
+MIME = {"jpeg": "image/jpeg", "png": "image/png"}
+
+
+def synthetic_leaf(rng: np.random.Generator, size: Tuple[int, int]) -> Image.Image:
+    # Hoja verde con nervadura y manchas sobre fondo de tierra con ruido:
+    # comprime como una foto real y no como un color plano.
+    w, h = size
+    noise = rng.integers(0, 256, (max(h // 16, 1), max(w // 16, 1), 3), dtype=np.uint8)
+    bg = np.asarray(Image.fromarray(noise).resize(size, Image.BICUBIC), dtype=np.float32)
+    bg = bg * 0.35 + np.array([95, 70, 45], dtype=np.float32) * 0.65
+    img = Image.fromarray(bg.astype(np.uint8))
+
+    draw = ImageDraw.Draw(img)
+    cx, cy = w * rng.uniform(0.4, 0.6), h * rng.uniform(0.4, 0.6)
+    rx, ry = w * rng.uniform(0.25, 0.4), h * rng.uniform(0.2, 0.35)
+    green = tuple(int(v) for v in rng.integers([30, 110, 20], [80, 180, 60]))
+    draw.ellipse([cx - rx, cy - ry, cx + rx, cy + ry], fill=green)
+    draw.line([cx - rx, cy, cx + rx, cy], fill=(150, 190, 110), width=max(w // 200, 1))
+    for _ in range(int(rng.integers(3, 12))):
+        sx, sy = cx + rx * rng.uniform(-0.7, 0.7), cy + ry * rng.uniform(-0.7, 0.7)
+        r = min(w, h) * rng.uniform(0.01, 0.04)
+        draw.ellipse([sx - r, sy - r, sx + r, sy + r], fill=(110, 80, 30))
+    return img.filter(ImageFilter.GaussianBlur(radius=max(min(w, h) / 800, 0.5)))
+
+
+def synthetic_images(n: int, sizes: List[Tuple[int, int]], formats: List[str],
+                     quality: int = 90, seed: int = 0) -> List[Dict[str, Any]]:
+    # n imágenes distintas por combinación tamaño x formato (distintas para no
+    # acertar en la caché de predicciones). Semilla fija: mismos bytes siempre.
+    rng = np.random.default_rng(seed)
+    out = []
+    for size in sizes:
+        for fmt in formats:
+            for _ in range(n):
+                buf = io.BytesIO()
+                synthetic_leaf(rng, size).save(buf, format=fmt.upper(), **({"quality": quality} if fmt == "jpeg" else {}))
+                out.append({
+                    "variant": f"{fmt}_{size[0]}x{size[1]}",
+                    "mime": MIME[fmt],
+                    "filename": f"leaf.{'jpg' if fmt == 'jpeg' else 'png'}",
+                    "body": buf.getvalue(),
+                })
+    return out
+
+
+def synthetic_jpegs(n: int, size=(1280, 960)) -> List[bytes]:
+    return [img["body"] for img in synthetic_images(n, [size], ["jpeg"])]
+
+
+def percentile(values: List[float], q: float) -> float:
+    return float(np.percentile(values, q)) if values else 0.0
+
+
+def parse_server_timing(header: Optional[str]) -> Dict[str, float]:
+    # "read;dur=0.3, model;dur=31.2" -> {"read": 0.3, "model": 31.2} (ms)
+    stages: Dict[str, float] = {}
+    for part in (header or "").split(","):
+        name, _, rest = part.strip().partition(";")
+        if rest.startswith("dur="):
+            stages[name] = float(rest[4:])
+    return stages
+
+
+def latency_stats(latencies: List[float]) -> Dict[str, float]:
+    return {
+        "p50_ms": round(percentile(latencies, 50) * 1000, 1),
+        "p95_ms": round(percentile(latencies, 95) * 1000, 1),
+        "p99_ms": round(percentile(latencies, 99) * 1000, 1),
+    }
+
+
+async def open_loop(url: str, images: List[Dict[str, Any]], rate: float, duration: float,
+                    concurrency: int, timeout: float = 60) -> Dict[str, Any]:
+    # Lazo abierto: la petición i se programa en t0 + i/rate sin esperar a las
+    # anteriores. Si las `concurrency` conexiones están ocupadas la petición
+    # espera, y esa espera cuenta en la latencia (medida desde la hora
+    # programada), así un servidor lento no reduce la carga que recibe.
+    total = int(rate * duration)
+    slots = asyncio.Semaphore(concurrency)
+    records: List[Dict[str, Any]] = []
+
+    async def one(i: int, scheduled: float, http: httpx.AsyncClient) -> None:
+        img = images[i % len(images)]
+        rec: Dict[str, Any] = {"variant": img["variant"], "status": 0, "cache": None, "stages": {}}
+        async with slots:
+            try:
+                resp = await http.post(url, files={"file": (img["filename"], img["body"], img["mime"])})
+                rec["status"] = resp.status_code
+                rec["cache"] = resp.headers.get("X-Cache")
+                rec["stages"] = parse_server_timing(resp.headers.get("Server-Timing"))
+            except httpx.HTTPError:
+                pass
+        rec["latency"] = time.perf_counter() - scheduled
+        records.append(rec)
+
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    async with httpx.AsyncClient(timeout=timeout, limits=limits) as http:
+        started = time.perf_counter()
+        tasks = []
+        for i in range(total):
+            scheduled = started + i / rate
+            delay = scheduled - time.perf_counter()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            tasks.append(asyncio.create_task(one(i, scheduled, http)))
+        await asyncio.gather(*tasks)
+        elapsed = time.perf_counter() - started
+
+    return summarize(records, elapsed, rate)
+
+
+def summarize(records: List[Dict[str, Any]], elapsed: float, rate: float) -> Dict[str, Any]:
+    ok = [r for r in records if r["status"] == 200]
+    statuses: Dict[str, int] = {}
+    for r in records:
+        statuses[str(r["status"])] = statuses.get(str(r["status"]), 0) + 1
+
+    stages: Dict[str, List[float]] = {}
+    for r in ok:
+        for name, ms in r["stages"].items():
+            stages.setdefault(name, []).append(ms)
+
+    per_variant: Dict[str, Dict[str, Any]] = {}
+    for variant in sorted({r["variant"] for r in records}):
+        rs = [r for r in records if r["variant"] == variant]
+        rs_ok = [r["latency"] for r in rs if r["status"] == 200]
+        per_variant[variant] = {"requests": len(rs), "errors": len(rs) - len(rs_ok), **latency_stats(rs_ok)}
+
+    return {
+        "offered_rps": rate,
+        "requests": len(records),
+        "ok": len(ok),
+        "error_rate": round(1 - len(ok) / len(records), 4) if records else 0.0,
+        "status_counts": statuses,
+        "throughput_rps": round(len(ok) / elapsed, 2) if elapsed else 0.0,
+        "cache_hit_ratio": round(sum(r["cache"] == "hit" for r in ok) / len(ok), 4) if ok else 0.0,
+        **latency_stats([r["latency"] for r in ok]),
+        "server_stage_p50_ms": {k: round(percentile(v, 50), 1) for k, v in sorted(stages.items())},
+        "variants": per_variant,
+    }
+
+
+def print_report(result: Dict[str, Any]) -> None:
+    print(f"ofrecido {result['offered_rps']} rps  completado {result['throughput_rps']} rps  "
+          f"peticiones {result['requests']}  errores {result['error_rate']:.2%}  "
+          f"caché {result['cache_hit_ratio']:.0%}")
+    print(f"latencia  p50 {result['p50_ms']} ms  p95 {result['p95_ms']} ms  p99 {result['p99_ms']} ms")
+    if result["server_stage_p50_ms"]:
+        print("servidor p50: " + "  ".join(f"{k} {v} ms" for k, v in result["server_stage_p50_ms"].items()))
+    print(f"{'variante':>16} {'n':>6} {'err':>5} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8}")
+    for name, v in result["variants"].items():
+        print(f"{name:>16} {v['requests']:>6} {v['errors']:>5} {v['p50_ms']:>8} {v['p95_ms']:>8} {v['p99_ms']:>8}")
+
+
+def main() -> int:
+    ap = argparse.ArgumentParser(description="Prueba de carga en lazo abierto para POST /predict.")
+    ap.add_argument("--url", default="http://127.0.0.1:8000")
+    ap.add_argument("--rate", type=float, default=10.0, help="Peticiones por segundo ofrecidas")
+    ap.add_argument("--duration", type=float, default=30.0, help="Segundos de carga medida")
+    ap.add_argument("--warmup", type=float, default=5.0, help="Segundos de carga previa no medida")
+    ap.add_argument("--concurrency", type=int, default=32, help="Máximo de peticiones en vuelo")
+    ap.add_argument("--sizes", nargs="+", default=DEFAULT_SIZES, help="Resoluciones AnchoxAlto")
+    ap.add_argument("--formats", nargs="+", default=["jpeg", "png"], choices=list(MIME))
+    ap.add_argument("--quality", type=int, default=90, help="Calidad JPEG (controla el tamaño del archivo)")
+    ap.add_argument("--images", type=int, default=8, help="Imágenes distintas por resolución y formato")
+    ap.add_argument("--seed", type=int, default=0)
+    ap.add_argument("--json", help="Guardar resultados en este archivo")
+    args = ap.parse_args()
+
+    sizes = [tuple(int(v) for v in s.lower().split("x")) for s in args.sizes]
+    images = synthetic_images(args.images, sizes, args.formats, args.quality, args.seed)
+    # Orden intercalado y fijo: la mezcla de variantes es la misma en cada corrida
+    images = [images[i] for i in np.random.default_rng(args.seed).permutation(len(images))]
+    url = args.url.rstrip("/") + "/predict"
+
+    if args.warmup > 0:
+        asyncio.run(open_loop(url, images, args.rate, args.warmup, args.concurrency))
+    result = asyncio.run(open_loop(url, images, args.rate, args.duration, args.concurrency))
+    print_report(result)
+
+    if args.json:
+        config = {k: v for k, v in vars(args).items() if k not in ("json", "url")}
+        config["image_bytes"] = {
+            name: int(np.mean([len(img["body"]) for img in images if img["variant"] == name]))
+            for name in sorted({img["variant"] for img in images})
+        }
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump({"config": config, "result": result}, f, indent=2, sort_keys=True)
+            f.write("\n")
+    return 0 if result["ok"] else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,110 @@
+import os
+os.environ.setdefault("CUDA_VISIBLE_DEVICES", "-1")
+os.environ.setdefault("TF_CPP_MIN_LOG_LEVEL", "2")
+
+# Memoria de la ruta de entrada (decode -> tensor float32 -> lote) por cada
+# 1000 peticiones: camino anterior (un arreglo nuevo por imagen y otro por
+# lote) vs búferes preasignados (InputBufferPool + búfer del MicroBatcher).
+# No ejecuta el modelo: mide solo lo que cambia entre ambos caminos.
+#
+# Uso:
+#   python bench_memory.py --requests 1000 --size 1280x960
+#   python bench_memory.py --images ../MobileNetV3/tomato/val --requests 2000
+
+import argparse
+import resource
+import sys
+import time
+import tracemalloc
+from typing import Callable, Dict, List
+
+import numpy as np
+
+import app
+from bench_decode import read_images, synthetic_jpegs
+
+
+def rss_mb() -> float:
+    with open("/proc/self/statm") as f:
+        return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 2**20
+
+
+def legacy_prepare(contents: bytes) -> np.ndarray:
+    # prepare_image antes de los búferes: RGB, resize, float32 y expand_dims
+    img = app.open_image(contents).convert("RGB").resize(app.IMG_SIZE)
+    return app.preprocess(np.expand_dims(np.asarray(img, dtype=np.float32), axis=0))
+
+
+def run_legacy(images: List[bytes], n: int, batch: int) -> None:
+    for start in range(0, n, batch):
+        xs = [legacy_prepare(images[i % len(images)]) for i in range(start, min(start + batch, n))]
+        np.concatenate(xs, axis=0)
+
+
+def run_pooled(images: List[bytes], n: int, batch: int) -> None:
+    pool = app.InputBufferPool(batch)
+    batch_buf = np.empty((batch, *app.IMG_SIZE, 3), dtype=np.float32)
+    for start in range(0, n, batch):
+        bufs = [app.load_image(images[i % len(images)], out=pool.acquire())
+                for i in range(start, min(start + batch, n))]
+        np.concatenate(bufs, axis=0, out=batch_buf[:len(bufs)])
+        pool.release(*bufs)
+
+
+def measure(fn: Callable[[], None], requests: int) -> Dict[str, float]:
+    # Fallos de página menores: cada arreglo grande (>128 KB) se pide con mmap
+    # y se toca página por página; reutilizar búferes los elimina.
+    faults_start = resource.getrusage(resource.RUSAGE_SELF).ru_minflt
+    rss_start = rss_mb()
+    tracemalloc.start()
+    t0 = time.perf_counter()
+    fn()
+    elapsed = time.perf_counter() - t0
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    faults = (resource.getrusage(resource.RUSAGE_SELF).ru_minflt - faults_start) * 1000 / requests
+    return {
+        "page_faults_per_1k": faults,
+        "page_fault_mb_per_1k": faults * os.sysconf("SC_PAGE_SIZE") / 2**20,
+        "peak_traced_mb": peak / 2**20,
+        "rss_delta_mb": rss_mb() - rss_start,
+        "ms_per_request": elapsed / requests * 1000,
+    }
+
+
+def main() -> int:
+    ap = argparse.ArgumentParser(description="Memoria de la ruta de entrada: arreglos nuevos vs búferes reutilizables.")
+    ap.add_argument("--images", help="Carpeta con imágenes (se recorre recursivamente)")
+    ap.add_argument("--limit", type=int, default=64)
+    ap.add_argument("--size", default="1280x960", help="Resolución de los JPEG sintéticos")
+    ap.add_argument("--requests", type=int, default=1000)
+    ap.add_argument("--batch", type=int, default=app.BATCH_MAX_SIZE, help="Imágenes por lote")
+    args = ap.parse_args()
+
+    if args.images:
+        images = read_images(args.images, args.limit)
+    else:
+        w, h = (int(v) for v in args.size.lower().split("x"))
+        images = synthetic_jpegs(16, (w, h))
+    if not images:
+        print("Sin imágenes.")
+        return 1
+
+    # Una pasada corta de cada camino para que el allocator y PIL lleguen a régimen
+    run_legacy(images, args.batch * 4, args.batch)
+    run_pooled(images, args.batch * 4, args.batch)
+
+    rows = {
+        "antes": measure(lambda: run_legacy(images, args.requests, args.batch), args.requests),
+        "después": measure(lambda: run_pooled(images, args.requests, args.batch), args.requests),
+    }
+    cols = ["page_faults_per_1k", "page_fault_mb_per_1k", "peak_traced_mb", "rss_delta_mb", "ms_per_request"]
+    print(f"{args.requests} peticiones, lotes de {args.batch}; valores por 1000 peticiones salvo picos/deltas")
+    print(f"{'':9s}" + "".join(f"{c:>22s}" for c in cols))
+    for name, r in rows.items():
+        print(f"{name:9s}" + "".join(f"{r[c]:>22.2f}" for c in cols))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,130 @@
+# Barrido de procesos uvicorn x hilos de TensorFlow: para cada combinación
+# levanta el servicio, lo carga con N clientes concurrentes durante unos
+# segundos y reporta throughput, p50 y p99.
+#
+# Uso:
+#   python bench_workers.py --workers 1 2 4 8 --threads 1 2 --concurrency 16 --duration 20
+
+import argparse
+import asyncio
+import json
+import os
+import subprocess
+import sys
+import time
+from typing import Any, Dict, List
+
+import httpx
+
+from bench_load import percentile, synthetic_jpegs
+
+
+async def drive(url: str, images: List[bytes], concurrency: int, duration: float) -> Dict[str, Any]:
+    # Carga en lazo cerrado: cada cliente envía la siguiente petición al recibir la anterior
+    latencies: List[float] = []
+    errors = 0
+    deadline = time.perf_counter() + duration
+
+    async def client(worker_id: int, http: httpx.AsyncClient) -> None:
+        nonlocal errors
+        i = worker_id
+        while time.perf_counter() < deadline:
+            body = images[i % len(images)]
+            i += concurrency
+            t0 = time.perf_counter()
+            try:
+                resp = await http.post(url, files={"file": ("leaf.jpg", body, "image/jpeg")})
+                ok = resp.status_code == 200
+            except httpx.HTTPError:
+                ok = False
+            if ok:
+                latencies.append(time.perf_counter() - t0)
+            else:
+                errors += 1
+
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    async with httpx.AsyncClient(timeout=60, limits=limits) as http:
+        started = time.perf_counter()
+        await asyncio.gather(*(client(i, http) for i in range(concurrency)))
+        elapsed = time.perf_counter() - started
+
+    return {
+        "requests": len(latencies),
+        "errors": errors,
+        "throughput_rps": round(len(latencies) / elapsed, 2),
+        "p50_ms": round(percentile(latencies, 50) * 1000, 1),
+        "p99_ms": round(percentile(latencies, 99) * 1000, 1),
+    }
+
+
+def wait_ready(base_url: str, proc: subprocess.Popen, timeout: float = 180) -> None:
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        if proc.poll() is not None:
+            raise RuntimeError(f"El servidor terminó con código {proc.returncode}")
+        try:
+            if httpx.get(base_url + "/readyz", timeout=2).status_code == 200:
+                return
+        except httpx.HTTPError:
+            pass
+        time.sleep(1)
+    raise RuntimeError("El servidor no respondió a tiempo")
+
+
+def run_combo(workers: int, threads: int, args) -> Dict[str, Any]:
+    env = dict(
+        os.environ,
+        TF_INTRA_OP_THREADS=str(threads),
+        TF_INTER_OP_THREADS=str(threads),
+        CACHE_MAX_ENTRIES="0",
+    )
+    cmd = [
+        sys.executable, "-m", "uvicorn", "app:app",
+        "--host", "127.0.0.1", "--port", str(args.port),
+        "--workers", str(workers), "--log-level", "warning",
+    ]
+    base_url = f"http://127.0.0.1:{args.port}"
+    proc = subprocess.Popen(cmd, env=env, cwd=os.path.dirname(os.path.abspath(__file__)))
+    try:
+        wait_ready(base_url, proc)
+        images = synthetic_jpegs(args.images)
+        # Calentamiento: que todos los workers hayan trazado el grafo
+        asyncio.run(drive(base_url + "/predict", images, args.concurrency, args.warmup))
+        stats = asyncio.run(drive(base_url + "/predict", images, args.concurrency, args.duration))
+    finally:
+        proc.terminate()
+        proc.wait(timeout=30)
+    return {"workers": workers, "threads": threads, **stats}
+
+
+def main() -> int:
+    ap = argparse.ArgumentParser(description="Barrido workers x hilos TF del servicio de inferencia.")
+    ap.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4])
+    ap.add_argument("--threads", type=int, nargs="+", default=[1, 2])
+    ap.add_argument("--concurrency", type=int, default=16)
+    ap.add_argument("--duration", type=float, default=20.0, help="Segundos medidos por combinación")
+    ap.add_argument("--warmup", type=float, default=5.0)
+    ap.add_argument("--images", type=int, default=64, help="JPEG sintéticos distintos a enviar")
+    ap.add_argument("--port", type=int, default=8765)
+    ap.add_argument("--json", help="Guardar resultados en este archivo")
+    args = ap.parse_args()
+
+    cpus = os.cpu_count() or 1
+    results = []
+    print(f"{'workers':>7} {'threads':>7} {'rps':>8} {'p50 ms':>8} {'p99 ms':>8} {'errores':>7}")
+    for w in args.workers:
+        for t in args.threads:
+            if w * t > 2 * cpus:
+                continue  # sobresuscripción evidente, no aporta
+            r = run_combo(w, t, args)
+            results.append(r)
+            print(f"{w:>7} {t:>7} {r['throughput_rps']:>8} {r['p50_ms']:>8} {r['p99_ms']:>8} {r['errors']:>7}")
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump({"cpus": cpus, "results": results}, f, indent=2, sort_keys=True)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
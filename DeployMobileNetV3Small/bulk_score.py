@@ -0,0 +1,201 @@
+import os
+os.environ.setdefault("CUDA_VISIBLE_DEVICES", "-1")
+os.environ.setdefault("TF_CPP_MIN_LOG_LEVEL", "2")
+# Sin servidor web que comparta la CPU: por defecto TF usa todos los núcleos
+os.environ.setdefault("TF_INTRA_OP_THREADS", str(os.cpu_count() or 1))
+
+# Clasificación offline de carpetas o tarballs completos con el mismo modelo,
+# class map y recomendaciones que el servicio (app.load_model / ModelBundle).
+# Lee los archivos en orden, los decodifica en paralelo directo a búferes de
+# lote preasignados (prefetch de varios lotes), ejecuta un predict por lote y
+# escribe cada lote al terminar. La memoria queda acotada por --batch x
+# --prefetch. Si se interrumpe, al volver a correr con la misma salida se
+# saltan los archivos ya escritos.
+#
+# Uso:
+#   python bulk_score.py ../encuesta_2025/ --out encuesta.csv
+#   python bulk_score.py fotos.tar.gz --out fotos.ndjson --batch 64 --workers 8
+
+import argparse
+import csv
+import io
+import json
+import sys
+import tarfile
+import time
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Dict, Iterator, List, Optional, Set, Tuple
+
+import numpy as np
+
+import app
+
+IMG_EXTS = (".jpg", ".jpeg", ".png")
+CSV_FIELDS = ["path", "label_en", "label_es", "probability", "title", "severity", "model_version", "error"]
+
+
+def iter_dir(root: str, skip: Set[str]) -> Iterator[Tuple[str, bytes]]:
+    for dirpath, dirnames, files in os.walk(root):
+        dirnames.sort()
+        for name in sorted(files):
+            if not name.lower().endswith(IMG_EXTS):
+                continue
+            path = os.path.join(dirpath, name)
+            key = os.path.relpath(path, root)
+            if key in skip:
+                continue
+            with open(path, "rb") as f:
+                yield key, f.read()
+
+
+def iter_tar(path: str, skip: Set[str]) -> Iterator[Tuple[str, bytes]]:
+    # Modo stream ("r|*"): se lee una sola vez, sin índice ni saltos en el archivo
+    with tarfile.open(path, "r|*") as tar:
+        for member in tar:
+            if not member.isfile() or not member.name.lower().endswith(IMG_EXTS) or member.name in skip:
+                continue
+            f = tar.extractfile(member)
+            if f is not None:
+                yield member.name, f.read()
+
+
+def batches(source: Iterator[Tuple[str, bytes]], size: int) -> Iterator[List[Tuple[str, bytes]]]:
+    batch: List[Tuple[str, bytes]] = []
+    for item in source:
+        batch.append(item)
+        if len(batch) == size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def decode_into(contents: bytes, out: np.ndarray) -> Optional[str]:
+    # Mismo decode que el servicio (draft JPEG, límite de píxeles); devuelve el error o None
+    try:
+        app.prepare_image(app.open_image(contents), out)
+        return None
+    except Exception as e:
+        detail = getattr(e, "detail", None)
+        return str(detail or e) or type(e).__name__
+
+
+def completed_keys(path: str, fmt: str) -> Set[str]:
+    # Claves ya escritas. Una última línea cortada (interrupción a mitad de
+    # escritura) se descarta truncando el archivo hasta la última línea completa.
+    if not os.path.exists(path):
+        return set()
+    with open(path, "rb+") as f:
+        data = f.read()
+        end = data.rfind(b"\n") + 1
+        if end < len(data):
+            f.truncate(end)
+    text = data[:end].decode("utf-8")
+    if fmt == "csv":
+        return {row["path"] for row in csv.DictReader(io.StringIO(text))}
+    return {json.loads(line)["path"] for line in text.splitlines() if line.strip()}
+
+
+class Writer:
+    def __init__(self, path: str, fmt: str):
+        new = not os.path.exists(path) or os.path.getsize(path) == 0
+        self.fmt = fmt
+        self.f = open(path, "a", encoding="utf-8", newline="")
+        self.csv = csv.DictWriter(self.f, fieldnames=CSV_FIELDS) if fmt == "csv" else None
+        if self.csv is not None and new:
+            self.csv.writeheader()
+
+    def write(self, rows: List[Dict[str, Any]]) -> None:
+        for row in rows:
+            if self.csv is not None:
+                top = row["predictions"][0] if row.get("predictions") else {}
+                rec = top.get("recomendation", {})
+                self.csv.writerow({
+                    "path": row["path"],
+                    "label_en": top.get("label_en", ""),
+                    "label_es": top.get("label_es", ""),
+                    "probability": f"{top['probability']:.6f}" if top else "",
+                    "title": rec.get("title", ""),
+                    "severity": rec.get("severity", ""),
+                    "model_version": row["model_version"],
+                    "error": row.get("error", ""),
+                })
+            else:
+                self.f.write(json.dumps(row, ensure_ascii=False) + "\n")
+        # Un lote completo por flush: al reanudar a lo más se repite el lote en curso
+        self.f.flush()
+        os.fsync(self.f.fileno())
+
+    def close(self) -> None:
+        self.f.close()
+
+
+def main() -> int:
+    ap = argparse.ArgumentParser(description="Clasificación offline de una carpeta o tarball de imágenes.")
+    ap.add_argument("source", help="Carpeta (se recorre recursivamente) o archivo .tar / .tar.gz")
+    ap.add_argument("--out", required=True, help="Salida .csv o .ndjson (se reanuda si existe)")
+    ap.add_argument("--format", choices=["csv", "ndjson"], help="Por defecto según la extensión de --out")
+    ap.add_argument("--batch", type=int, default=32, help="Imágenes por predict")
+    ap.add_argument("--prefetch", type=int, default=3, help="Lotes decodificándose por adelantado")
+    ap.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="Hilos de decodificación")
+    ap.add_argument("--top-k", type=int, default=app.TOP_K)
+    ap.add_argument("--lang", choices=["es", "en"], default=app.LANG_DEF)
+    args = ap.parse_args()
+
+    fmt = args.format or ("csv" if args.out.lower().endswith(".csv") else "ndjson")
+    skip = completed_keys(args.out, fmt)
+    if skip:
+        print(f"Reanudando: {len(skip)} archivos ya en {args.out}", file=sys.stderr)
+
+    bundle = app.load_model()
+    source = iter_dir(args.source, skip) if os.path.isdir(args.source) else iter_tar(args.source, skip)
+    prefetch = max(1, args.prefetch)
+    # Un búfer por lote en vuelo: el lote n reutiliza el del n - prefetch, ya procesado
+    bufs = [np.empty((args.batch, *app.IMG_SIZE, 3), dtype=np.float32) for _ in range(prefetch)]
+    writer = Writer(args.out, fmt)
+    pending: "deque[Tuple[List[str], List[Future], np.ndarray]]" = deque()
+    done = errors = 0
+    started = last_report = time.perf_counter()
+
+    def process(keys: List[str], futs: List[Future], buf: np.ndarray) -> None:
+        nonlocal done, errors
+        errs = [f.result() for f in futs]
+        ok = [i for i, e in enumerate(errs) if e is None]
+        rows: List[Dict[str, Any]] = [{"path": k, "model_version": bundle.version} for k in keys]
+        if ok:
+            x = buf[:len(keys)] if len(ok) == len(keys) else buf[ok]
+            for i, p in zip(ok, bundle.engine.predict(x)):
+                rows[i]["predictions"] = bundle.format_topk(p, args.top_k, args.lang)
+        for i, e in enumerate(errs):
+            if e is not None:
+                rows[i]["error"] = e
+        writer.write(rows)
+        done += len(keys)
+        errors += len(keys) - len(ok)
+
+    try:
+        with ThreadPoolExecutor(max_workers=args.workers) as pool:
+            for n, batch in enumerate(batches(source, args.batch)):
+                buf = bufs[n % prefetch]
+                futs = [pool.submit(decode_into, data, buf[i:i + 1]) for i, (_, data) in enumerate(batch)]
+                pending.append(([k for k, _ in batch], futs, buf))
+                if len(pending) >= prefetch:
+                    process(*pending.popleft())
+                now = time.perf_counter()
+                if now - last_report >= 10:
+                    print(f"{done} imágenes  {done / (now - started):.1f} img/s  errores {errors}", file=sys.stderr)
+                    last_report = now
+            while pending:
+                process(*pending.popleft())
+    finally:
+        writer.close()
+
+    elapsed = time.perf_counter() - started
+    print(f"Listo: {done} imágenes en {elapsed:.1f} s ({done / elapsed if elapsed else 0:.1f} img/s), "
+          f"errores {errors}, salida {args.out}", file=sys.stderr)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
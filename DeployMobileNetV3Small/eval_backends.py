@@ -0,0 +1,165 @@
+import os
+os.environ.setdefault("CUDA_VISIBLE_DEVICES", "-1")
+os.environ.setdefault("TF_CPP_MIN_LOG_LEVEL", "2")
+
+# Precisión vs latencia de cada configuración de inferencia sobre el split de
+# validación (tomato/val del notebook): motores Keras (original y serving) y
+# TFLite (fp32/fp16/int8) que existan, resoluciones de entrada e hilos.
+# Cada configuración corre en un subproceso aparte (hilos de TF y RSS máximo
+# propios) y el reporte compara todo contra la línea base (la primera
+# configuración: keras original, 224, primer valor de --threads).
+#
+# Uso:
+#   python eval_backends.py --samples ../MobileNetV3/tomato/val --threads 1 2 --resolutions 224 192 160 --out eval.json
+#
+# Keras tiene la entrada fija en 224x224; las otras resoluciones solo se
+# evalúan en TFLite (el intérprete redimensiona la entrada).
+
+import argparse
+import json
+import resource
+import subprocess
+import sys
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+
+IMG_EXTS = (".jpg", ".jpeg", ".png")
+
+
+def list_val(root: str, limit: int = 0) -> List[Tuple[str, str]]:
+    # (ruta, clase EN); las subcarpetas son las clases, como en image_dataset_from_directory
+    items = []
+    for cls in sorted(os.listdir(root)):
+        d = os.path.join(root, cls)
+        if os.path.isdir(d):
+            items.extend((os.path.join(d, f), cls) for f in sorted(os.listdir(d)) if f.lower().endswith(IMG_EXTS))
+    return items[:limit] if limit else items
+
+
+def artifacts() -> List[Tuple[str, str]]:
+    # (motor, ruta) de los artefactos presentes junto a app.py
+    import app
+    out = [("keras", app.MODEL_PATH), ("keras", app.SERVING_MODEL_PATH)]
+    out += [(name, path) for name, path in app.TFLITE_PATHS.items()]
+    return [(b, p) for b, p in out if os.path.exists(p)]
+
+
+def run_config(backend: str, path: str, resolution: int, samples: str, limit: int) -> Dict[str, Any]:
+    # Dentro del subproceso: TF_INTRA_OP_THREADS ya viene en el entorno
+    import app
+    engine = app.KerasEngine(path) if backend == "keras" else app.TFLiteEngine(path, backend)
+    items = list_val(samples, limit)
+    size = (resolution, resolution)
+
+    def load(p: str) -> np.ndarray:
+        # Mismo decode que el servicio, redimensionando a la resolución evaluada
+        img = app.open_image(open(p, "rb").read()).convert("RGB").resize(size)
+        return np.asarray(img, dtype=np.float32)[None]
+
+    engine.predict(load(items[0][0]))  # trazado / asignación de tensores
+    preds, times = [], []
+    for p, _ in items:
+        x = load(p)
+        t0 = time.perf_counter()
+        probs = engine.predict(x)
+        times.append(time.perf_counter() - t0)
+        preds.append(int(np.argmax(probs[0])))
+    ms = np.array(times) * 1000
+    return {
+        "preds": preds,
+        "mean_ms": round(float(ms.mean()), 2),
+        "p99_ms": round(float(np.percentile(ms, 99)), 2),
+        # ru_maxrss está en KB en Linux
+        "peak_rss_mb": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+        "size_mb": round(os.path.getsize(path) / 1e6, 2),
+    }
+
+
+def confusion(y_true: List[int], y_pred: List[int], n: int) -> np.ndarray:
+    m = np.zeros((n, n), dtype=np.int64)
+    np.add.at(m, (y_true, y_pred), 1)
+    return m
+
+
+def summarize(name: str, res: Dict[str, Any], y_true: List[int], classes: List[str],
+              base_cm: Optional[np.ndarray] = None) -> Dict[str, Any]:
+    cm = confusion(y_true, res["preds"], len(classes))
+    support = cm.sum(axis=1)
+    per_class = {c: round(float(cm[i, i] / support[i]), 4) if support[i] else None for i, c in enumerate(classes)}
+    out = {
+        "config": name,
+        "accuracy": round(float(np.trace(cm) / cm.sum()), 4),
+        "per_class_accuracy": per_class,
+        "confusion": cm.tolist(),
+        **{k: res[k] for k in ("mean_ms", "p99_ms", "peak_rss_mb", "size_mb")},
+    }
+    if base_cm is not None:
+        delta = cm - base_cm
+        off = [(int(delta[i, j]), classes[i], classes[j]) for i in range(len(classes))
+               for j in range(len(classes)) if i != j and delta[i, j]]
+        off.sort(key=lambda t: -abs(t[0]))
+        out["confusion_delta"] = delta.tolist()
+        # Cambios más grandes fuera de la diagonal: (delta, clase real, clase predicha)
+        out["top_confusion_changes"] = off[:5]
+    return out
+
+
+def main() -> int:
+    ap = argparse.ArgumentParser(description="Precisión vs latencia por motor, resolución e hilos.")
+    ap.add_argument("--samples", required=True, help="Carpeta de validación con subcarpetas por clase")
+    ap.add_argument("--limit", type=int, default=0, help="Máximo de imágenes (0 = todas)")
+    ap.add_argument("--resolutions", type=int, nargs="+", default=[224])
+    ap.add_argument("--threads", type=int, nargs="+", default=[1])
+    ap.add_argument("--out", default="eval_backends.json")
+    ap.add_argument("--run-config", nargs=3, metavar=("MOTOR", "RUTA", "RES"), help=argparse.SUPPRESS)
+    args = ap.parse_args()
+
+    if args.run_config:
+        backend, path, res = args.run_config
+        print(json.dumps(run_config(backend, path, int(res), args.samples, args.limit)))
+        return 0
+
+    with open("./class_map_es.json", "r", encoding="utf-8") as f:
+        classes = json.load(f)["class_names_en"]
+    items = list_val(args.samples, args.limit)
+    unknown = sorted({c for _, c in items} - set(classes))
+    if not items or unknown:
+        print(f"Sin imágenes o clases desconocidas en {args.samples}: {unknown}")
+        return 1
+    y_true = [classes.index(c) for _, c in items]
+
+    configs = [(b, p, r, t) for b, p in artifacts() for r in args.resolutions for t in args.threads
+               if b != "keras" or r == 224]
+    report: List[Dict[str, Any]] = []
+    base_cm = None
+    print(f"{len(items)} imágenes, {len(configs)} configuraciones")
+    print(f"{'configuración':48s} {'acc':>7} {'media ms':>9} {'p99 ms':>8} {'RSS MB':>8} {'MB':>7}")
+    for backend, path, res, threads in configs:
+        name = f"{backend}:{os.path.basename(path)}@{res}/t{threads}"
+        env = dict(os.environ, TF_INTRA_OP_THREADS=str(threads), TF_INTER_OP_THREADS="1")
+        proc = subprocess.run(
+            [sys.executable, os.path.abspath(__file__), "--samples", args.samples, "--limit", str(args.limit),
+             "--run-config", backend, path, str(res)],
+            env=env, capture_output=True, text=True,
+        )
+        if proc.returncode != 0:
+            print(f"{name:48s} falló: {proc.stderr.strip().splitlines()[-1:]}")
+            continue
+        res_json = json.loads(proc.stdout.strip().splitlines()[-1])
+        row = summarize(name, res_json, y_true, classes, base_cm)
+        if base_cm is None:
+            base_cm = np.array(row["confusion"])
+        report.append(row)
+        print(f"{name:48s} {row['accuracy']:>7.2%} {row['mean_ms']:>9} {row['p99_ms']:>8} {row['peak_rss_mb']:>8} {row['size_mb']:>7}")
+
+    with open(args.out, "w", encoding="utf-8") as f:
+        json.dump({"samples": len(items), "classes": classes, "baseline": report[0]["config"] if report else None,
+                   "results": report}, f, indent=2, ensure_ascii=False)
+    print(f"Reporte en {args.out}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,87 @@
+import os
+os.environ.setdefault("CUDA_VISIBLE_DEVICES", "-1")
+os.environ.setdefault("TF_CPP_MIN_LOG_LEVEL", "2")
+
+# Exporta la cabeza de clasificación (capas Dense después del
+# GlobalAveragePooling) de un modelo reentrenado a un .npz que se aplica con
+# NumPy sobre los embeddings guardados (backend/app/tasks/rescore.py), sin
+# TensorFlow ni la CNN. Válido mientras la base no cambie entre entrenamientos.
+#
+# Uso:
+#   python export_head.py --model models/v2/mobileNetV3Small.keras --version v2 --out head_v2.npz
+
+import argparse
+import json
+import sys
+from typing import Any, Dict, List
+
+import numpy as np
+from tensorflow import keras
+
+ACTIVATIONS = ("linear", "relu", "softmax")
+
+
+def head_layers(model: keras.Model) -> List[Any]:
+    pool = next(i for i, l in enumerate(model.layers) if isinstance(l, keras.layers.GlobalAveragePooling2D))
+    layers = [l for l in model.layers[pool + 1:] if isinstance(l, keras.layers.Dense)]
+    for l in layers:
+        act = l.get_config()["activation"]
+        if act not in ACTIVATIONS:
+            raise RuntimeError(f"Activación no soportada en {l.name}: {act}")
+    return layers
+
+
+def labels(class_map_path: str, advice_path: str) -> List[Dict[str, Any]]:
+    # Lo mismo que guarda el backend por predicción: título (recomendación o
+    # nombre ES), severidad y consejos
+    with open(class_map_path, "r", encoding="utf-8") as f:
+        cmap = json.load(f)
+    with open(advice_path, "r", encoding="utf-8") as f:
+        advice = json.load(f)
+    out = []
+    for en, es in zip(cmap["class_names_en"], cmap["class_names_es"]):
+        rec = advice.get(en, {})
+        out.append({
+            "label_en": en,
+            "title": rec.get("title") or es,
+            "severity": rec.get("severity"),
+            "advice": rec.get("advice", []),
+        })
+    return out
+
+
+def main() -> int:
+    ap = argparse.ArgumentParser(description="Exporta la cabeza Dense de un modelo a .npz para re-puntuar embeddings.")
+    ap.add_argument("--model", default="./mobileNetV3Small.keras")
+    ap.add_argument("--class-map", default="./class_map_es.json")
+    ap.add_argument("--advice", default="./advice.json")
+    ap.add_argument("--version", required=True, help="model_version que quedará en los registros re-puntuados")
+    ap.add_argument("--out", required=True)
+    args = ap.parse_args()
+
+    model = keras.models.load_model(args.model)
+    layers = head_layers(model)
+    classes = labels(args.class_map, args.advice)
+    if int(layers[-1].units) != len(classes):
+        print(f"Desalineación: salidas cabeza={layers[-1].units}, clases={len(classes)}")
+        return 1
+
+    arrays: Dict[str, np.ndarray] = {}
+    for i, l in enumerate(layers):
+        kernel, bias = l.get_weights()
+        arrays[f"kernel_{i}"] = kernel.astype(np.float32)
+        arrays[f"bias_{i}"] = bias.astype(np.float32)
+    np.savez(
+        args.out,
+        activations=np.array([l.get_config()["activation"] for l in layers]),
+        labels=np.array(json.dumps(classes, ensure_ascii=False)),
+        model_version=np.array(args.version),
+        **arrays,
+    )
+    dims = [int(layers[0].get_weights()[0].shape[0])] + [int(l.units) for l in layers]
+    print(f"{args.out}: {len(layers)} capas Dense {' -> '.join(map(str, dims))}, versión {args.version}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
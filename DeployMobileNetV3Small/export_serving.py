@@ -0,0 +1,205 @@
+import os
+os.environ.setdefault("CUDA_VISIBLE_DEVICES", "-1")
+os.environ.setdefault("TF_CPP_MIN_LOG_LEVEL", "2")
+
+# Reconstruye mobileNetV3Small.keras como un grafo solo de inferencia y lo
+# guarda como mobileNetV3Small_serving.keras (el artefacto que carga app.py):
+#   * sin el bloque de augmentation "auf" ni el Dropout de la cabeza,
+#   * un solo paso de preprocesamiento (la capa Rescaling de MobileNetV3),
+#   * BatchNormalization fusionada en la Conv2D / DepthwiseConv2D anterior.
+# Verifica que las salidas coincidan y reporta parámetros, tamaño, RSS y
+# latencia antes y después (cada modelo se mide en un subproceso aparte).
+#
+# Uso:
+#   python export_serving.py --samples ../MobileNetV3/tomato/val --limit 300
+#   python export_serving.py --measure mobileNetV3Small_serving.keras
+
+import argparse
+import json
+import resource
+import subprocess
+import sys
+import time
+from typing import Any, Dict, List, Tuple
+
+import numpy as np
+import tensorflow as tf
+from tensorflow import keras
+
+from export_tflite import IMG_SIZE, MODEL_PATH, list_samples, load_samples, top1_agreement
+
+SERVING_PATH = "./mobileNetV3Small_serving.keras"
+
+
+def producer(layer) -> Any:
+    # Capa que produce la entrada de `layer` (Keras 2 y 3 guardan la historia
+    # en el tensor como (operación, nodo, índice))
+    return layer.input._keras_history[0]
+
+
+def find_foldable(base: keras.Model) -> Dict[str, Any]:
+    # {nombre de la conv: BatchNormalization que la sigue}. Solo se fusiona si
+    # la BN lee directamente de una Conv2D/DepthwiseConv2D sin activación.
+    pairs: Dict[str, Any] = {}
+    for layer in base.layers:
+        if not isinstance(layer, keras.layers.BatchNormalization):
+            continue
+        conv = producer(layer)
+        if not isinstance(conv, (keras.layers.Conv2D, keras.layers.DepthwiseConv2D)):
+            continue
+        if conv.get_config().get("activation") not in (None, "linear"):
+            continue
+        if layer.axis not in (-1, [-1], 3, [3]):
+            continue
+        pairs[conv.name] = layer
+    return pairs
+
+
+def fold(conv, bn) -> List[np.ndarray]:
+    # y = gamma * (conv(x) + b - mean) / sqrt(var + eps) + beta
+    #   = conv'(x) + b'  con  W' = W * s,  b' = (b - mean) * s + beta
+    weights = conv.get_weights()
+    kernel = weights[0]
+    bias = weights[1] if len(weights) > 1 else 0.0
+    mean = np.asarray(bn.moving_mean)
+    var = np.asarray(bn.moving_variance)
+    gamma = np.asarray(bn.gamma) if bn.scale else np.ones_like(mean)
+    beta = np.asarray(bn.beta) if bn.center else np.zeros_like(mean)
+
+    s = gamma / np.sqrt(var + bn.epsilon)
+    if isinstance(conv, keras.layers.DepthwiseConv2D):
+        # kernel (kh, kw, canales, multiplicador); canal de salida = c * mult + m
+        kernel = kernel * s.reshape(kernel.shape[2], kernel.shape[3])
+    else:
+        kernel = kernel * s
+    return [kernel.astype(np.float32), ((bias - mean) * s + beta).astype(np.float32)]
+
+
+def fold_batchnorm(base: keras.Model) -> Tuple[keras.Model, int]:
+    pairs = find_foldable(base)
+    folded_bns = {bn.name for bn in pairs.values()}
+
+    def clone(layer):
+        if layer.name in folded_bns:
+            return keras.layers.Identity(name=layer.name)
+        cfg = layer.get_config()
+        if layer.name in pairs:
+            cfg["use_bias"] = True
+        return layer.__class__.from_config(cfg)
+
+    fused = keras.models.clone_model(base, clone_function=clone)
+    for layer in fused.layers:
+        if layer.name in folded_bns or not layer.weights:
+            continue
+        orig = base.get_layer(layer.name)
+        layer.set_weights(fold(orig, pairs[layer.name]) if layer.name in pairs else orig.get_weights())
+    return fused, len(pairs)
+
+
+def build_serving(model: keras.Model) -> Tuple[keras.Model, int]:
+    # Grafo del notebook: Input -> auf -> [preprocess_input] -> MobileNetV3Small
+    # -> GAP -> Dropout -> Dense(256) -> Dense(clases). Se conservan la base y
+    # las capas de la cabeza con pesos; el resto no hace nada en inferencia.
+    base = next(l for l in model.layers if isinstance(l, keras.Model) and l.name != "auf")
+    head = [l for l in model.layers[model.layers.index(base) + 1:]
+            if isinstance(l, (keras.layers.GlobalAveragePooling2D, keras.layers.Dense))]
+
+    fused, n_folded = fold_batchnorm(base)
+    inputs = keras.Input(shape=IMG_SIZE + (3,), name="image")
+    x = fused(inputs)
+    for layer in head:
+        new = layer.__class__.from_config(layer.get_config())
+        x = new(x)
+        new.set_weights(layer.get_weights())
+    return keras.Model(inputs, x, name="mobilenet_v3_small_serving"), n_folded
+
+
+def measure(path: str, runs: int) -> Dict[str, Any]:
+    # Se llama en un subproceso limpio: el RSS máximo corresponde solo a este modelo
+    rss_before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    model = keras.models.load_model(path)
+    out: Dict[str, Any] = {
+        "params": int(model.count_params()),
+        "size_mb": round(os.path.getsize(path) / 1e6, 2),
+    }
+    rng = np.random.default_rng(0)
+    for n in (1, 8):
+        x = rng.uniform(0, 255, (n, *IMG_SIZE, 3)).astype(np.float32)
+        model.predict(x, verbose=0)  # trazado
+        times = []
+        for _ in range(runs):
+            t0 = time.perf_counter()
+            model.predict(x, verbose=0)
+            times.append(time.perf_counter() - t0)
+        out[f"b{n}_p50_ms"] = round(float(np.median(times)) * 1000, 2)
+    # ru_maxrss está en KB en Linux
+    out["rss_mb"] = round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1)
+    out["rss_model_mb"] = round((resource.getrusage(resource.RUSAGE_SELF).ru_maxrss - rss_before) / 1024, 1)
+    return out
+
+
+def measure_in_subprocess(path: str, runs: int) -> Dict[str, Any]:
+    res = subprocess.run(
+        [sys.executable, os.path.abspath(__file__), "--measure", path, "--runs", str(runs)],
+        capture_output=True, text=True, check=True,
+    )
+    return json.loads(res.stdout.strip().splitlines()[-1])
+
+
+def main() -> int:
+    ap = argparse.ArgumentParser(description="Exporta un modelo Keras solo de inferencia (sin augmentation, BN fusionada).")
+    ap.add_argument("--model", default=MODEL_PATH)
+    ap.add_argument("--out", default=SERVING_PATH)
+    ap.add_argument("--samples", help="Carpeta con subcarpetas por clase; sin ella se usan entradas aleatorias")
+    ap.add_argument("--limit", type=int, default=300)
+    ap.add_argument("--max-diff", type=float, default=1e-3, help="Máxima diferencia absoluta aceptada en probabilidades")
+    ap.add_argument("--runs", type=int, default=30, help="Repeticiones para medir latencia")
+    ap.add_argument("--measure", help="Solo medir este artefacto y escribir JSON (uso interno)")
+    args = ap.parse_args()
+
+    tf.config.threading.set_intra_op_parallelism_threads(1)
+    tf.config.threading.set_inter_op_parallelism_threads(1)
+
+    if args.measure:
+        print(json.dumps(measure(args.measure, args.runs), sort_keys=True))
+        return 0
+
+    model = keras.models.load_model(args.model)
+    serving, n_folded = build_serving(model)
+    # Se guarda aparte y solo reemplaza a --out si pasa la validación: app.py
+    # prefiere el _serving.keras apenas existe
+    root, ext = os.path.splitext(args.out)
+    tmp = f"{root}.tmp{ext}"
+    try:
+        serving.save(tmp)
+        print(f"{tmp}: {n_folded} BatchNorm fusionadas en sus convoluciones")
+
+        if args.samples:
+            x = load_samples(list_samples(args.samples, args.limit))
+        else:
+            x = np.random.default_rng(0).uniform(0, 255, (32, *IMG_SIZE, 3)).astype(np.float32)
+        ref = model.predict(x, verbose=0)
+        got = keras.models.load_model(tmp).predict(x, verbose=0)
+        max_diff = float(np.max(np.abs(ref - got)))
+        agreement = top1_agreement(ref, got)
+        print(f"{len(x)} entradas  |diff| máx {max_diff:.2e}  top-1 = original: {agreement:.2%}")
+
+        rows = {"original": measure_in_subprocess(args.model, args.runs),
+                "serving": measure_in_subprocess(tmp, args.runs)}
+        cols = ["params", "size_mb", "rss_mb", "rss_model_mb", "b1_p50_ms", "b8_p50_ms"]
+        print(f"{'':10s}" + "".join(f"{c:>14s}" for c in cols))
+        for name, r in rows.items():
+            print(f"{name:10s}" + "".join(f"{r[c]:>14}" for c in cols))
+
+        if max_diff > args.max_diff or agreement < 1.0:
+            print(f"El modelo exportado no reproduce al original; no se escribe {args.out}.")
+            return 1
+        os.replace(tmp, args.out)
+        print(f"{args.out} escrito")
+        return 0
+    finally:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,157 @@
+import os
+os.environ.setdefault("CUDA_VISIBLE_DEVICES", "-1")
+os.environ.setdefault("TF_CPP_MIN_LOG_LEVEL", "2")
+
+# Exporta mobileNetV3Small.keras a TFLite (fp32, fp16 e int8 post-training)
+# y verifica que el top-1 coincida con el modelo Keras en un conjunto de muestras.
+#
+# Uso:
+#   python export_tflite.py --samples ../MobileNetV3/tomato/val --limit 300
+
+import argparse
+import sys
+import tempfile
+from typing import Dict, List
+
+import numpy as np
+from PIL import Image
+import tensorflow as tf
+from tensorflow import keras
+
+# Mismos nombres de artefacto que espera app.py (TFLITE_PATHS)
+MODEL_PATH = "./mobileNetV3Small.keras"
+TFLITE_PATHS = {
+    "tflite": "./mobileNetV3Small_fp32.tflite",
+    "tflite_fp16": "./mobileNetV3Small_fp16.tflite",
+    "tflite_int8": "./mobileNetV3Small_int8.tflite",
+}
+IMG_SIZE = (224, 224)
+IMG_EXTS = (".jpg", ".jpeg", ".png")
+
+
+def list_samples(root: str, limit: int) -> List[str]:
+    # Recorre las subcarpetas por clase de forma intercalada para que el
+    # subconjunto cubra todas las clases aunque limit sea pequeño.
+    per_class: List[List[str]] = []
+    for cls in sorted(os.listdir(root)):
+        d = os.path.join(root, cls)
+        if os.path.isdir(d):
+            files = sorted(f for f in os.listdir(d) if f.lower().endswith(IMG_EXTS))
+            per_class.append([os.path.join(d, f) for f in files])
+    paths: List[str] = []
+    i = 0
+    while len(paths) < limit and any(i < len(c) for c in per_class):
+        paths.extend(c[i] for c in per_class if i < len(c))
+        i += 1
+    return paths[:limit]
+
+
+def load_samples(paths: List[str]) -> np.ndarray:
+    # Igual que prepare_image en app.py: RGB, 224x224, float32 en [0,255]
+    return np.stack([
+        np.asarray(Image.open(p).convert("RGB").resize(IMG_SIZE), dtype=np.float32)
+        for p in paths
+    ])
+
+
+def run_tflite(path: str, x: np.ndarray) -> np.ndarray:
+    interpreter = tf.lite.Interpreter(model_path=path)
+    inp = interpreter.get_input_details()[0]
+    interpreter.resize_tensor_input(inp["index"], list(x.shape))
+    interpreter.allocate_tensors()
+    inp = interpreter.get_input_details()[0]
+    out = interpreter.get_output_details()[0]
+
+    scale, zero = inp["quantization"]
+    if scale:
+        info = np.iinfo(inp["dtype"])
+        x = np.clip(np.round(x / scale + zero), info.min, info.max)
+    interpreter.set_tensor(inp["index"], x.astype(inp["dtype"]))
+    interpreter.invoke()
+    y = interpreter.get_tensor(out["index"])
+
+    scale, zero = out["quantization"]
+    if scale:
+        return (y.astype(np.float32) - zero) * scale
+    return y
+
+
+def convert(saved_model_dir: str, variant: str, calib: np.ndarray) -> bytes:
+    converter = tf.lite.TFLiteConverter.from_saved_model(saved_model_dir)
+    if variant == "tflite_fp16":
+        converter.optimizations = [tf.lite.Optimize.DEFAULT]
+        converter.target_spec.supported_types = [tf.float16]
+    elif variant == "tflite_int8":
+        def representative_dataset():
+            for i in range(len(calib)):
+                yield [calib[i:i + 1]]
+
+        converter.optimizations = [tf.lite.Optimize.DEFAULT]
+        converter.representative_dataset = representative_dataset
+        converter.target_spec.supported_ops = [tf.lite.OpsSet.TFLITE_BUILTINS_INT8]
+        converter.inference_input_type = tf.int8
+        converter.inference_output_type = tf.int8
+    return converter.convert()
+
+
+def top1_agreement(ref: np.ndarray, other: np.ndarray) -> float:
+    return float(np.mean(np.argmax(ref, axis=1) == np.argmax(other, axis=1)))
+
+
+def main() -> int:
+    ap = argparse.ArgumentParser(description="Exporta el modelo Keras a TFLite y valida el top-1.")
+    ap.add_argument("--model", default=MODEL_PATH)
+    ap.add_argument("--samples", required=True, help="Carpeta con subcarpetas por clase (p. ej. tomato/val)")
+    ap.add_argument("--limit", type=int, default=300, help="Máximo de imágenes de muestra")
+    ap.add_argument("--calib", type=int, default=100, help="Imágenes para calibrar int8")
+    ap.add_argument("--calib-samples", help="Carpeta para calibrar int8 (p. ej. tomato/train); por defecto otras imágenes de --samples")
+    ap.add_argument("--variants", nargs="+", default=list(TFLITE_PATHS), choices=list(TFLITE_PATHS))
+    ap.add_argument("--min-agreement", type=float, default=0.98, help="Coincidencia top-1 mínima aceptada")
+    args = ap.parse_args()
+
+    # La calibración int8 nunca usa imágenes de la validación: si no, la
+    # coincidencia top-1 de int8 saldría optimista
+    if args.calib_samples:
+        paths = list_samples(args.samples, args.limit)
+        seen = {os.path.abspath(p) for p in paths}
+        calib_paths = [p for p in list_samples(args.calib_samples, args.calib + args.limit)
+                       if os.path.abspath(p) not in seen][:args.calib]
+    else:
+        both = list_samples(args.samples, args.limit + args.calib)
+        paths, calib_paths = both[:args.limit], both[args.limit:]
+    if not paths:
+        print(f"No se encontraron imágenes en {args.samples}")
+        return 1
+    if "tflite_int8" in args.variants and not calib_paths:
+        print("No quedan imágenes para calibrar int8 aparte de las de validación: baje --limit o use --calib-samples")
+        return 1
+    x = load_samples(paths)
+    x_calib = load_samples(calib_paths) if calib_paths else x[:0]
+    print(f"Muestras: {len(x)} imágenes de {args.samples}; calibración int8: {len(x_calib)} distintas")
+
+    model = keras.models.load_model(args.model)
+    ref = model.predict(x, verbose=0)
+
+    results: Dict[str, float] = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        # Keras 3 exporta un SavedModel de inferencia (capas de augmentation inactivas)
+        model.export(tmp)
+        for variant in args.variants:
+            out_path = TFLITE_PATHS[variant]
+            with open(out_path, "wb") as f:
+                f.write(convert(tmp, variant, x_calib))
+
+            probs = run_tflite(out_path, x)
+            results[variant] = top1_agreement(ref, probs)
+            size_mb = os.path.getsize(out_path) / 1e6
+            print(f"{variant:12s} {out_path}  {size_mb:6.2f} MB  top-1 = Keras: {results[variant]:.2%}")
+
+    failed = [v for v, a in results.items() if a < args.min_agreement]
+    if failed:
+        print(f"Coincidencia top-1 bajo {args.min_agreement:.0%} en: {failed}")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,110 @@
+import asyncio
+
+import pytest
+
+pytest.importorskip("numpy")
+pytest.importorskip("fastapi")
+pytest.importorskip("prometheus_client")
+pytest.importorskip("PIL")
+
+import numpy as np
+
+import app as service
+
+
+def rows(*values: int) -> np.ndarray:
+    # Una fila (1,224,224,3) por valor; el stub la identifica por x[:, 0, 0, 0]
+    x = np.zeros((len(values), *service.TENSOR_IMAGE_SHAPE), dtype=np.float32)
+    x[:, 0, 0, 0] = values
+    return x
+
+
+class StubModel:
+    # predict_fn de prueba: registra el tamaño de cada lote y devuelve el id de cada fila
+    def __init__(self, fail: bool = False):
+        self.calls = []
+        self.fail = fail
+
+    def __call__(self, x: np.ndarray) -> np.ndarray:
+        self.calls.append(len(x))
+        if self.fail:
+            raise RuntimeError("modelo caído")
+        return x[:, 0, 0, 0:1].copy()
+
+
+async def run_batcher(model, max_batch: int, max_wait_ms: float, requests, timeout: float = 2.0):
+    batcher = service.MicroBatcher(model, max_batch=max_batch, max_wait_ms=max_wait_ms)
+    batcher.start()
+    try:
+        coros = [batcher.submit(x) for x in requests]
+        return await asyncio.wait_for(asyncio.gather(*coros, return_exceptions=True), timeout)
+    finally:
+        await batcher.stop()
+
+
+def test_flushes_when_batch_is_full():
+    # max_wait de un minuto: solo puede salir porque se llenó el lote
+    model = StubModel()
+    results = asyncio.run(run_batcher(model, 4, 60_000, [rows(i) for i in range(4)]))
+    assert model.calls == [4]
+    assert all(not isinstance(r, Exception) for r in results)
+
+
+def test_flushes_partial_batch_after_max_wait():
+    model = StubModel()
+    results = asyncio.run(run_batcher(model, 8, 20, [rows(1), rows(2)]))
+    assert model.calls == [2]
+    assert len(results) == 2
+
+
+def test_overflow_goes_to_next_batch():
+    model = StubModel()
+    asyncio.run(run_batcher(model, 4, 60_000, [rows(i) for i in range(8)]))
+    assert model.calls == [4, 4]
+
+
+def test_scatters_rows_to_each_caller():
+    model = StubModel()
+    results = asyncio.run(run_batcher(model, 8, 20, [rows(1), rows(2, 3, 4), rows(5)]))
+    got = [out[:, 0].tolist() for out, _, _ in results]
+    assert got == [[1.0], [2.0, 3.0, 4.0], [5.0]]
+    assert model.calls == [5]
+
+
+def test_scatters_tuple_outputs():
+    # predict_with_embedding devuelve (probabilidades, embedding)
+    def predict(x):
+        ids = x[:, 0, 0, 0:1].copy()
+        return ids, ids * 10
+
+    results = asyncio.run(run_batcher(predict, 8, 20, [rows(1, 2), rows(3)]))
+    (probs_a, emb_a), _, _ = results[0]
+    (probs_b, emb_b), _, _ = results[1]
+    assert probs_a[:, 0].tolist() == [1.0, 2.0]
+    assert emb_a[:, 0].tolist() == [10.0, 20.0]
+    assert probs_b[:, 0].tolist() == [3.0]
+    assert emb_b[:, 0].tolist() == [30.0]
+
+
+def test_exception_reaches_every_caller_and_batcher_keeps_running():
+    model = StubModel(fail=True)
+
+    async def scenario():
+        batcher = service.MicroBatcher(model, max_batch=8, max_wait_ms=20)
+        batcher.start()
+        try:
+            first = await asyncio.gather(
+                *(batcher.submit(rows(i)) for i in range(3)), return_exceptions=True
+            )
+            # El error de un lote no mata el loop: el siguiente lote se ejecuta
+            model.fail = False
+            second = await asyncio.wait_for(batcher.submit(rows(7)), 2.0)
+        finally:
+            await batcher.stop()
+        return first, second
+
+    first, (out, _, _) = asyncio.run(scenario())
+    assert len(first) == 3
+    assert all(isinstance(r, RuntimeError) for r in first)
+    assert out[:, 0].tolist() == [7.0]
+    assert model.calls == [3, 1]
@@ -0,0 +1,75 @@
+import pytest
+
+pytest.importorskip("numpy")
+pytest.importorskip("fastapi")
+pytest.importorskip("prometheus_client")
+pytest.importorskip("PIL")
+
+import numpy as np
+
+import app as service
+
+
+class Clock:
+    # Reemplazo de time.monotonic controlado por el test
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    c = Clock()
+    monkeypatch.setattr(service.time, "monotonic", c)
+    return c
+
+
+def probs(value: float) -> np.ndarray:
+    return np.full(4, value, dtype=np.float32)
+
+
+def test_evicts_least_recently_used(clock):
+    cache = service.PredictionCache(max_entries=2, ttl_s=60)
+    cache.put("a", probs(1))
+    cache.put("b", probs(2))
+    # Leer "a" la vuelve la más reciente: la que sale es "b"
+    assert cache.get("a") is not None
+    cache.put("c", probs(3))
+    assert cache.get("b") is None
+    assert cache.get("a")[0] == 1
+    assert cache.get("c")[0] == 3
+
+
+def test_expires_after_ttl(clock):
+    cache = service.PredictionCache(max_entries=8, ttl_s=10)
+    cache.put("a", probs(1))
+    clock.now += 9.9
+    assert cache.get("a") is not None
+    clock.now += 0.2
+    assert cache.get("a") is None
+    # La entrada vencida se borra, no solo se oculta
+    assert "a" not in cache._data
+
+
+def test_put_copies_the_row(clock):
+    # put recibe una vista de la salida del lote, que se reutiliza
+    cache = service.PredictionCache(max_entries=8, ttl_s=60)
+    batch = np.stack([probs(1), probs(2)])
+    cache.put("a", batch[0])
+    batch[0] = 9
+    assert cache.get("a")[0] == 1
+
+
+def test_disabled_with_zero_entries(clock):
+    cache = service.PredictionCache(max_entries=0, ttl_s=60)
+    cache.put("a", probs(1))
+    assert cache.get("a") is None
+
+
+def test_key_depends_on_bytes_and_version():
+    key = service.PredictionCache.key
+    assert key(b"img", "v1") == key(b"img", "v1")
+    assert key(b"img", "v1") != key(b"img", "v2")
+    assert key(b"img", "v1") != key(b"otra", "v1")
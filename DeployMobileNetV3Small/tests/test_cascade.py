@@ -0,0 +1,102 @@
+import asyncio
+
+import pytest
+
+pytest.importorskip("numpy")
+pytest.importorskip("fastapi")
+pytest.importorskip("prometheus_client")
+pytest.importorskip("PIL")
+
+import numpy as np
+
+import app as service
+
+# Salida del motor barato según el id de la fila (x[:, 0, 0, 0])
+FAST_OUTPUTS = {
+    0: [0.95, 0.03, 0.02, 0.00],  # segura
+    1: [0.40, 0.30, 0.20, 0.10],  # probabilidad baja
+    2: [0.55, 0.45, 0.00, 0.00],  # margen bajo
+    3: [0.70, 0.10, 0.10, 0.10],  # pasa ambos umbrales
+}
+FULL_OUTPUT = [0.0, 0.0, 0.0, 1.0]
+
+
+class StubEngine(service.InferenceEngine):
+    name = "stub"
+
+    def __init__(self, path: str, outputs):
+        super().__init__(path)
+        self.num_classes = 4
+        self.outputs = outputs
+        self.seen = []
+
+    def predict(self, x: np.ndarray) -> np.ndarray:
+        ids = [int(v) for v in x[:, 0, 0, 0]]
+        self.seen.append(ids)
+        return np.array([self.outputs(i) for i in ids], dtype=np.float32)
+
+
+@pytest.fixture
+def thresholds(monkeypatch):
+    monkeypatch.setattr(service, "CASCADE_MIN_PROB", 0.5)
+    monkeypatch.setattr(service, "CASCADE_MIN_MARGIN", 0.2)
+
+
+def rows(*ids: int) -> np.ndarray:
+    x = np.zeros((len(ids), *service.TENSOR_IMAGE_SHAPE), dtype=np.float32)
+    x[:, 0, 0, 0] = ids
+    return x
+
+
+def make_bundle(with_fast: bool = True) -> service.ModelBundle:
+    full = StubEngine("full.keras", lambda i: FULL_OUTPUT)
+    fast = StubEngine("fast.tflite", lambda i: FAST_OUTPUTS[i]) if with_fast else None
+    names = [f"c{i}" for i in range(4)]
+    return service.ModelBundle("v-test", full, names, names, {}, fast_engine=fast)
+
+
+def run_predict(bundle: service.ModelBundle, x):
+    async def scenario():
+        bundle.start()
+        try:
+            return await asyncio.wait_for(bundle.predict(x, service.Timings("v-test")), 2.0)
+        finally:
+            await bundle.stop()
+
+    return asyncio.run(scenario())
+
+
+def test_confident_rows_stay_on_fast_engine(thresholds):
+    bundle = make_bundle()
+    probs, tiers = run_predict(bundle, rows(0, 3))
+    assert tiers == ["fast", "fast"]
+    assert np.allclose(probs, [FAST_OUTPUTS[0], FAST_OUTPUTS[3]])
+    assert bundle.engine.seen == []
+
+
+def test_doubtful_rows_escalate_to_full_engine(thresholds):
+    bundle = make_bundle()
+    probs, tiers = run_predict(bundle, rows(0, 1, 2, 3))
+    assert tiers == ["fast", "full", "full", "fast"]
+    # Solo las filas dudosas llegan al motor principal
+    assert bundle.engine.seen == [[1, 2]]
+    assert probs[0].tolist() == pytest.approx(FAST_OUTPUTS[0])
+    assert probs[1].tolist() == FULL_OUTPUT
+    assert probs[2].tolist() == FULL_OUTPUT
+    assert probs[3].tolist() == pytest.approx(FAST_OUTPUTS[3])
+
+
+def test_escalation_keeps_row_order_across_parts(thresholds):
+    # /predict/batch envía una lista de tensores; el orden de las filas se conserva
+    bundle = make_bundle()
+    probs, tiers = run_predict(bundle, [rows(1), rows(0), rows(2)])
+    assert tiers == ["full", "fast", "full"]
+    assert bundle.engine.seen == [[1, 2]]
+    assert probs[1].tolist() == pytest.approx(FAST_OUTPUTS[0])
+
+
+def test_without_fast_engine_everything_is_full(thresholds):
+    bundle = make_bundle(with_fast=False)
+    probs, tiers = run_predict(bundle, rows(0, 1))
+    assert tiers == ["full", "full"]
+    assert bundle.engine.seen == [[0, 1]]
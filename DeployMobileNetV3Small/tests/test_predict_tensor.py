@@ -0,0 +1,75 @@
+import pytest
+
+pytest.importorskip("numpy")
+pytest.importorskip("fastapi")
+pytest.importorskip("httpx")
+pytest.importorskip("prometheus_client")
+pytest.importorskip("PIL")
+pytest.importorskip("uvicorn")
+
+from fastapi.testclient import TestClient
+
+import app as service
+
+# Sin "with": no corre el lifespan, así que no se carga ningún modelo; el límite
+# se aplica antes de tomar una versión
+client = TestClient(service.app)
+
+
+def max_tensor_bytes() -> int:
+    return service.BATCH_MAX_FILES * int(service.np.prod(service.TENSOR_IMAGE_SHAPE)) * 4 + 4096
+
+
+def chunked(total: int, size: int = 64 * 1024):
+    # Cuerpo como generador: httpx lo envía sin Content-Length
+    sent = 0
+    while sent < total:
+        n = min(size, total - sent)
+        sent += n
+        yield b"\x00" * n
+
+
+def test_chunked_oversize_tensor_gets_413():
+    resp = client.post(
+        "/predict/tensor",
+        content=chunked(max_tensor_bytes() + 1),
+        headers={"content-type": "application/octet-stream"},
+    )
+    assert resp.status_code == 413
+
+
+def test_declared_oversize_tensor_gets_413():
+    resp = client.post(
+        "/predict/tensor",
+        content=b"\x00" * (max_tensor_bytes() + 1),
+        headers={"content-type": "application/octet-stream"},
+    )
+    assert resp.status_code == 413
+
+
+def npy_bytes(arr) -> bytearray:
+    f = service.io.BytesIO()
+    service.np.save(f, arr)
+    return bytearray(f.getvalue())
+
+
+def test_parse_tensor_is_a_view_over_the_body():
+    # read_body_capped entrega el bytearray; el tensor no debe copiarlo
+    np = service.np
+    raw = bytearray(np.arange(2 * 224 * 224 * 3, dtype=np.uint32).astype(np.uint8).tobytes())
+    arr = service.parse_tensor(raw, "application/octet-stream")
+    assert arr.shape == (2, 224, 224, 3)
+    assert np.shares_memory(arr, np.frombuffer(raw, dtype=np.uint8))
+
+    body = npy_bytes(np.full((2, 224, 224, 3), 7, dtype=np.float32))
+    arr = service.parse_tensor(body, "application/x-npy")
+    assert arr.dtype == np.float32 and arr.shape == (2, 224, 224, 3)
+    assert float(arr[1, 223, 223, 2]) == 7.0
+    assert np.shares_memory(arr, np.frombuffer(body, dtype=np.uint8))
+
+
+def test_parse_tensor_rejects_truncated_npy():
+    body = npy_bytes(service.np.zeros((224, 224, 3), dtype=service.np.uint8))
+    with pytest.raises(service.HTTPException) as e:
+        service.parse_tensor(body[:-1], "application/x-npy")
+    assert e.value.status_code == 400
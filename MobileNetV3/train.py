@@ -0,0 +1,327 @@
+import os
+os.environ.setdefault("TF_CPP_MIN_LOG_LEVEL", "2")
+
+# Entrenamiento + fine-tuning de MobileNetV3 Small desde la línea de comandos
+# (mismo flujo que mobile_net_v3_small.ipynb: fase 1 solo la cabeza, fase 2
+# base liberada con BatchNormalization congelada).
+#
+# Tubería de datos:
+#   * La primera corrida decodifica y redimensiona cada imagen una sola vez
+#     (en paralelo) y guarda los píxeles uint8 en shards TFRecord bajo
+#     --cache-dir. La clave del caché depende de la lista de archivos (ruta,
+#     tamaño, mtime) y de IMG_SIZE: si el dataset cambia, se regenera.
+#   * Cada época lee los shards intercalados en paralelo, mezcla, arma lotes,
+#     aplica la augmentation ("auf" del notebook) en tf.data con
+#     num_parallel_calls=AUTOTUNE y hace prefetch AUTOTUNE. Sin los límites de
+#     hilos del notebook.
+#
+# Por época se imprime images/s de entrenamiento; queda también en
+# train_history.json. Salida: mobileNetV3Small.keras y class_map_es.json, los
+# artefactos que carga DeployMobileNetV3Small/app.py.
+#
+# Uso:
+#   python train.py --data-dir tomato --out-dir ../DeployMobileNetV3Small/models/v2
+#   python train.py --batch 32 --epochs-head 15 --epochs-ft 10 --shards 16
+
+import argparse
+import hashlib
+import json
+import shutil
+import sys
+import time
+from typing import Any, Dict, List, Tuple
+
+import tensorflow as tf
+from tensorflow import keras
+from tensorflow.keras import layers
+from tensorflow.keras.layers import BatchNormalization
+
+IMG_SIZE = (224, 224)
+IMG_EXTS = (".jpg", ".jpeg", ".png")
+AUTOTUNE = tf.data.AUTOTUNE
+
+CLASS_MAP_ES = {
+    'Tomato___Bacterial_spot': 'Mancha bacteriana',
+    'Tomato___Early_blight': 'Tizón temprano',
+    'Tomato___healthy': 'Sano',
+    'Tomato___Late_blight': 'Tizón tardío',
+    'Tomato___Leaf_Mold': 'Moho de la hoja',
+    'Tomato___Septoria_leaf_spot': 'Mancha foliar por Septoria',
+    'Tomato___Spider_mites Two-spotted_spider_mite': 'Ácaro rojo de dos manchas',
+    'Tomato___Target_Spot': 'Mancha de tiro',
+    'Tomato___Tomato_mosaic_virus': 'Virus del mosaico del tomate',
+    'Tomato___Tomato_Yellow_Leaf_Curl_Virus': 'Virus del rizado amarillo de la hoja del tomate',
+}
+
+
+# --------------
+# DATOS Y CACHÉ
+# --------------
+
+def list_split(root: str) -> Tuple[List[str], List[int], List[str]]:
+    # Mismo orden de clases que image_dataset_from_directory (subcarpetas ordenadas)
+    classes = sorted(d for d in os.listdir(root) if os.path.isdir(os.path.join(root, d)))
+    paths, labels = [], []
+    for i, cls in enumerate(classes):
+        d = os.path.join(root, cls)
+        for f in sorted(os.listdir(d)):
+            if f.lower().endswith(IMG_EXTS):
+                paths.append(os.path.join(d, f))
+                labels.append(i)
+    return paths, labels, classes
+
+
+def cache_key(paths: List[str], labels: List[int]) -> str:
+    h = hashlib.blake2b(repr(IMG_SIZE).encode(), digest_size=8)
+    for p, y in zip(paths, labels):
+        st = os.stat(p)
+        h.update(f"{p}\0{y}\0{st.st_size}\0{st.st_mtime_ns}\n".encode())
+    return h.hexdigest()
+
+
+def decode(path: tf.Tensor, label: tf.Tensor) -> Tuple[tf.Tensor, tf.Tensor]:
+    # Igual que image_dataset_from_directory (bilineal, sin conservar aspecto),
+    # redondeado a uint8 como los píxeles que recibe el servicio
+    img = tf.io.decode_image(tf.io.read_file(path), channels=3, expand_animations=False)
+    img = tf.image.resize(img, IMG_SIZE)
+    return tf.saturate_cast(tf.round(img), tf.uint8), label
+
+
+def write_shards(paths: List[str], labels: List[int], out_dir: str, shards: int) -> None:
+    # Se escribe en <out_dir>.tmp y se renombra al final: un caché a medias
+    # (corrida interrumpida) nunca se confunde con uno completo
+    tmp = out_dir + ".tmp"
+    shutil.rmtree(tmp, ignore_errors=True)
+    os.makedirs(tmp)
+    writers = [tf.io.TFRecordWriter(os.path.join(tmp, f"shard-{i:05d}-of-{shards:05d}.tfrecord"))
+               for i in range(shards)]
+    ds = tf.data.Dataset.from_tensor_slices((paths, labels)).map(decode, num_parallel_calls=AUTOTUNE)
+    t0 = time.perf_counter()
+    for i, (img, y) in enumerate(ds.as_numpy_iterator()):
+        ex = tf.train.Example(features=tf.train.Features(feature={
+            "image": tf.train.Feature(bytes_list=tf.train.BytesList(value=[img.tobytes()])),
+            "label": tf.train.Feature(int64_list=tf.train.Int64List(value=[int(y)])),
+        }))
+        writers[i % shards].write(ex.SerializeToString())
+    for w in writers:
+        w.close()
+    os.replace(tmp, out_dir)
+    elapsed = time.perf_counter() - t0
+    print(f"Caché {out_dir}: {len(paths)} imágenes en {elapsed:.1f} s ({len(paths) / elapsed:.1f} img/s)")
+
+
+def cached_split(root: str, cache_dir: str, name: str, shards: int) -> Tuple[List[str], int, List[str]]:
+    # (shards, número de imágenes, clases EN)
+    paths, labels, classes = list_split(root)
+    if not paths:
+        raise SystemExit(f"Sin imágenes en {root}")
+    out_dir = os.path.join(cache_dir, f"{name}-{cache_key(paths, labels)}")
+    if not os.path.isdir(out_dir):
+        write_shards(paths, labels, out_dir, min(shards, len(paths)))
+    files = sorted(os.path.join(out_dir, f) for f in os.listdir(out_dir))
+    return files, len(paths), classes
+
+
+def parse_batch(serialized: tf.Tensor) -> Tuple[tf.Tensor, tf.Tensor]:
+    # Un parse_example por lote en vez de uno por imagen
+    feats = tf.io.parse_example(serialized, {
+        "image": tf.io.FixedLenFeature([], tf.string),
+        "label": tf.io.FixedLenFeature([], tf.int64),
+    })
+    img = tf.reshape(tf.io.decode_raw(feats["image"], tf.uint8), (-1, *IMG_SIZE, 3))
+    return tf.cast(img, tf.float32), feats["label"]
+
+
+def make_dataset(files: List[str], batch: int, training: bool, shuffle_buffer: int, seed: int) -> tf.data.Dataset:
+    ds = tf.data.Dataset.from_tensor_slices(files)
+    if training:
+        ds = ds.shuffle(len(files), seed=seed, reshuffle_each_iteration=True)
+    ds = ds.interleave(tf.data.TFRecordDataset, cycle_length=len(files),
+                       num_parallel_calls=AUTOTUNE, deterministic=not training)
+    if training:
+        ds = ds.shuffle(shuffle_buffer, seed=seed, reshuffle_each_iteration=True)
+    ds = ds.batch(batch).map(parse_batch, num_parallel_calls=AUTOTUNE)
+    if training:
+        # Augmentation del notebook, fuera del modelo: corre en los hilos de
+        # tf.data, en paralelo con el paso de entrenamiento
+        auf = keras.Sequential([
+            layers.RandomFlip("horizontal", seed=seed),
+            layers.RandomRotation(0.05, seed=seed),
+            layers.RandomZoom(0.1, seed=seed),
+        ], name="auf")
+        ds = ds.map(lambda x, y: (auf(x, training=True), y), num_parallel_calls=AUTOTUNE)
+    return ds.prefetch(AUTOTUNE)
+
+
+# ---------------------
+# MODELO Y THROUGHPUT
+# ---------------------
+
+def build_model(num_classes: int) -> Tuple[keras.Model, keras.Model]:
+    base = keras.applications.MobileNetV3Small(
+        input_shape = IMG_SIZE + (3,),
+        include_top = False,
+        weights = 'imagenet',
+        alpha = 1.0,
+        minimalistic = False
+    )
+    base.trainable = False
+    preprocess = keras.applications.mobilenet_v3.preprocess_input
+
+    inputs = keras.Input(shape = IMG_SIZE + (3,))
+    x = preprocess(inputs)
+    x = base(x, training = False)
+    x = layers.GlobalAveragePooling2D()(x)
+    x = layers.Dropout(0.2)(x)
+    x = layers.Dense(256, activation='relu')(x)
+    # Salida en float32 aunque la política sea mixed_float16: softmax y pérdida
+    # estables, y el modelo guardado entrega probabilidades float32
+    outputs = layers.Dense(num_classes, activation="softmax", dtype="float32")(x)
+    return keras.Model(inputs, outputs), base
+
+
+class Throughput(keras.callbacks.Callback):
+    # images/s de la parte de entrenamiento de cada época (sin la validación)
+    def __init__(self, images: int, phase: str):
+        super().__init__()
+        self.images = images
+        self.phase = phase
+        self._t0 = 0.0
+        self._train_s = None
+
+    def on_epoch_begin(self, epoch, logs=None):
+        self._t0 = time.perf_counter()
+        self._train_s = None
+
+    def on_test_begin(self, logs=None):
+        if self._train_s is None:
+            self._train_s = time.perf_counter() - self._t0
+
+    def on_epoch_end(self, epoch, logs=None):
+        total = time.perf_counter() - self._t0
+        train_s = self._train_s or total
+        ips = self.images / train_s
+        if logs is not None:
+            # Antes del History (se agrega al final): queda en history.history
+            logs["images_per_sec"] = ips
+            logs["epoch_seconds"] = total
+        print(f"[{self.phase}] época {epoch + 1}: {ips:.1f} img/s entrenamiento, {total:.1f} s con validación")
+
+
+def compile_model(model: keras.Model, lr: float) -> None:
+    model.compile(
+        optimizer = keras.optimizers.Adam(lr),
+        loss = keras.losses.SparseCategoricalCrossentropy(),
+        metrics = ["accuracy"]
+    )
+
+
+def main() -> int:
+    ap = argparse.ArgumentParser(description="Entrena MobileNetV3 Small (cabeza + fine-tuning) para hojas de tomate.")
+    ap.add_argument("--data-dir", default="tomato", help="Carpeta con train/ y val/ (subcarpetas por clase)")
+    ap.add_argument("--out-dir", default=".", help="Dónde dejar mobileNetV3Small.keras y class_map_es.json")
+    ap.add_argument("--cache-dir", default="temp/tfrecords")
+    ap.add_argument("--shards", type=int, default=16, help="Shards TFRecord por split")
+    ap.add_argument("--batch", type=int, default=16)
+    ap.add_argument("--epochs-head", type=int, default=15)
+    ap.add_argument("--epochs-ft", type=int, default=10)
+    ap.add_argument("--shuffle-buffer", type=int, default=2048)
+    ap.add_argument("--seed", type=int, default=0)
+    ap.add_argument("--threads", type=int, default=0, help="Hilos intra-op de TF (0 = todos los núcleos)")
+    ap.add_argument("--mixed-precision", action="store_true", help="mixed_float16 (solo con GPU)")
+    args = ap.parse_args()
+
+    if args.threads:
+        tf.config.threading.set_intra_op_parallelism_threads(args.threads)
+    gpus = tf.config.list_physical_devices('GPU')
+    for g in gpus:
+        try:
+            tf.config.experimental.set_memory_growth(g, True)
+        except Exception:
+            pass
+    if args.mixed_precision and gpus:
+        keras.mixed_precision.set_global_policy('mixed_float16')
+    keras.utils.set_random_seed(args.seed)
+
+    train_files, n_train, class_names_en = cached_split(
+        os.path.join(args.data_dir, 'train'), args.cache_dir, "train", args.shards)
+    val_files, n_val, val_classes = cached_split(
+        os.path.join(args.data_dir, 'val'), args.cache_dir, "val", args.shards)
+    if val_classes != class_names_en:
+        print(f"Clases distintas en train y val: {class_names_en} vs {val_classes}")
+        return 1
+
+    # ----------------
+    # CLASES Y MAPEO
+    # ----------------
+    missing = [c for c in class_names_en if c not in CLASS_MAP_ES]
+    extra = [k for k in CLASS_MAP_ES if k not in class_names_en]
+    if missing:
+        print(f"Faltan traducciones en CLASS_MAP_ES: {missing}")
+        return 1
+    if extra:
+        print(f"Advertencia: hay entradas extra en CLASS_MAP_ES que no están en los datos: {extra}")
+    IDX2ES = [CLASS_MAP_ES[c] for c in class_names_en]
+    print(f"{n_train} imágenes de entrenamiento, {n_val} de validación, {len(class_names_en)} clases")
+
+    train_ds = make_dataset(train_files, args.batch, True, args.shuffle_buffer, args.seed)
+    val_ds = make_dataset(val_files, args.batch, False, args.shuffle_buffer, args.seed)
+
+    model, base = build_model(len(class_names_en))
+    compile_model(model, 1e-3)
+    cbs_head = [
+        Throughput(n_train, "cabeza"),
+        keras.callbacks.EarlyStopping(monitor = "val_loss", patience = 1, restore_best_weights= True),
+        keras.callbacks.ReduceLROnPlateau(monitor = "val_loss", factor = 0.5, patience= 1, min_lr=1e-6)
+    ]
+    print("\n--- Entrenamiento Fase 1 (cabeza) ----")
+    t0 = time.perf_counter()
+    hist_head = model.fit(train_ds, validation_data = val_ds, epochs = args.epochs_head, callbacks=cbs_head)
+
+    # Fine-tuning: congelar BN y liberar el resto de la base
+    for layer in base.layers:
+        if not isinstance(layer, BatchNormalization):
+            layer.trainable = True
+    compile_model(model, 1e-4)
+    cbs_ft = [
+        Throughput(n_train, "fine-tuning"),
+        keras.callbacks.EarlyStopping(monitor = "val_loss", patience = 1, restore_best_weights= True),
+        keras.callbacks.ReduceLROnPlateau(monitor = "val_loss", factor = 0.5, patience= 1)
+    ]
+    print("\n---- Entrenamiento Fase 2 (fine-tuning) ----")
+    hist_ft = model.fit(train_ds, validation_data = val_ds, epochs = args.epochs_ft, callbacks = cbs_ft)
+    train_seconds = time.perf_counter() - t0
+
+    print("\n---- Evaluación en validación ----")
+    validation_loss, validation_acc = model.evaluate(val_ds)
+    print(f"Pérdida en validación: {validation_loss:.4f}; Precisión en validación: {validation_acc:.4f}")
+
+    # ----------------------
+    # GUARDAR MODELO Y MAPEO
+    # ----------------------
+    os.makedirs(args.out_dir, exist_ok=True)
+    model.save(os.path.join(args.out_dir, 'mobileNetV3Small.keras'))
+    with open(os.path.join(args.out_dir, 'class_map_es.json'), 'w', encoding='utf-8') as f:
+        json.dump({"class_names_en": class_names_en, "class_names_es": IDX2ES}, f, ensure_ascii=False, indent=2)
+
+    def epochs(h: keras.callbacks.History) -> List[Dict[str, Any]]:
+        keys = list(h.history)
+        return [{k: float(h.history[k][i]) for k in keys} for i in range(len(h.epoch))]
+
+    with open(os.path.join(args.out_dir, 'train_history.json'), 'w', encoding='utf-8') as f:
+        json.dump({
+            "batch": args.batch,
+            "train_images": n_train,
+            "val_images": n_val,
+            "train_seconds": round(train_seconds, 1),
+            "val_loss": float(validation_loss),
+            "val_accuracy": float(validation_acc),
+            "head": epochs(hist_head),
+            "fine_tuning": epochs(hist_ft),
+        }, f, indent=2)
+    print(f"Artefactos en {args.out_dir} (entrenamiento: {train_seconds / 60:.1f} min)")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
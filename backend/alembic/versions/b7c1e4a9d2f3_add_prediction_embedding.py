@@ -0,0 +1,28 @@
+"""add prediction embedding
+
+Revision ID: b7c1e4a9d2f3
+Revises: 654837d51a4d
+Create Date: 2026-10-18 12:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'b7c1e4a9d2f3'
+down_revision: Union[str, Sequence[str], None] = '654837d51a4d'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column('prediction_record', sa.Column('embedding', sa.LargeBinary(), nullable=True))
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_column('prediction_record', 'embedding')
@@ -0,0 +1,44 @@
+"""add daily_usage
+
+Revision ID: c3d8f1a6e5b2
+Revises: b7c1e4a9d2f3
+Create Date: 2026-10-18 15:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'c3d8f1a6e5b2'
+down_revision: Union[str, Sequence[str], None] = 'b7c1e4a9d2f3'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table('daily_usage',
+    sa.Column('user_id', sa.UUID(), nullable=False),
+    sa.Column('day', sa.Date(), nullable=False),
+    sa.Column('used', sa.Integer(), nullable=False),
+    sa.ForeignKeyConstraint(['user_id'], ['users.id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('user_id', 'day')
+    )
+    # carry over today's predictions so nobody gets a fresh quota mid-day
+    op.execute(
+        """
+        INSERT INTO daily_usage (user_id, day, used)
+        SELECT user_id, (date_created AT TIME ZONE 'UTC')::date, count(*)
+        FROM prediction_record
+        WHERE date_created >= date_trunc('day', now() AT TIME ZONE 'UTC') AT TIME ZONE 'UTC'
+        GROUP BY 1, 2
+        """
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_table('daily_usage')
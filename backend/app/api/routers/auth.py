@@ -5,6 +5,8 @@ from fastapi.security import OAuth2PasswordBearer
 from fastapi_mail import FastMail, MessageSchema, MessageType
 from itsdangerous import SignatureExpired, BadSignature
 from pydantic import EmailStr
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
 from jose import JWTError
 from urllib.parse import urljoin
@@ -19,8 +21,9 @@ from app.schemas.auth import (
     RegisterInit,
 )
 from app.core.security import digest_hash, make_email_token, load_email_token
-from app.db.session import SessionLocal
+from app.db.session import AsyncSessionLocal, SessionLocal
 from app.db.models import User, UserWeatherPrefs
+from app.services.context_service import RequestContext, load_context
 from app.core.security import (
     get_password_hash,
     verify_password,
@@ -41,6 +44,12 @@ def get_db():
         db.close()
 
 
+# same, for `async def` routes: a sync query in there would block the whole event loop
+async def get_async_db():
+    async with AsyncSessionLocal() as db:
+        yield db
+
+
 # OAuth2 bearer (para leer Authorization: Bearer <token>)
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/api/auth/login")
 
@@ -61,9 +70,44 @@ def get_current_user(
     return user
 
 
+async def get_current_user_async(
+    token: str = Depends(oauth2_scheme),
+    db: AsyncSession = Depends(get_async_db),
+) -> User:
+    # get_current_user for async routes that write to the user (same session as the route)
+    try:
+        data = decode_token(token)
+        user_id = data.get("sub")
+    except JWTError:
+        raise HTTPException(status_code=401, detail="Token inválido o expirado")
+
+    user = await db.get(User, user_id) if user_id else None
+    if not user:
+        raise HTTPException(status_code=401, detail="Usuario no encontrado")
+    return user
+
+
+async def get_request_context(
+    token: str = Depends(oauth2_scheme),
+    db: AsyncSession = Depends(get_async_db),
+) -> RequestContext:
+    # read-only endpoints: user + subscription + weather prefs in one (cached) query.
+    # anything that modifies the user should keep using get_current_user
+    try:
+        data = decode_token(token)
+        user_id = data.get("sub")
+    except JWTError:
+        raise HTTPException(status_code=401, detail="Token inválido o expirado")
+
+    ctx = await load_context(db, user_id) if user_id else None
+    if ctx is None:
+        raise HTTPException(status_code=401, detail="Usuario no encontrado")
+    return ctx
+
+
 @router.post("/register")
-async def register(payload: RegisterInit, db: Session = Depends(get_db)):
-    if db.query(User).filter(User.email == payload.email).first():
+async def register(payload: RegisterInit, db: AsyncSession = Depends(get_async_db)):
+    if await db.scalar(select(User.id).where(User.email == payload.email)):
         raise HTTPException(status_code=409, detail="El email ya está registrado.")
 
     pw_hash = get_password_hash(payload.password)
@@ -144,12 +188,12 @@ def verify_account(token: str, db: Session = Depends(get_db)):
 
 
 @router.post("/verify/resend")
-async def resend_verify(email: EmailStr, db: Session = Depends(get_db)):
+async def resend_verify(email: EmailStr, db: AsyncSession = Depends(get_async_db)):
     fm = FastMail(conf)
     generic = {
         "message": "Recibirás un correo de verificación en breve. Revisa tu carpeta de SPAM en caso de no encontrarlo en tu inbox."
     }
-    user = db.query(User).filter(User.email == str(email).lower()).first()
+    user = await db.scalar(select(User.id).where(User.email == str(email).lower()))
     if user:
         return generic
     token = make_email_token(
@@ -210,9 +254,9 @@ def login(payload: UserLogin, db: Session = Depends(get_db)):
 
 
 @router.post("/refresh", response_model=TokenOut)
-def refresh(current_user: User = Depends(get_current_user)):
+def refresh(ctx: RequestContext = Depends(get_request_context)):
     # Si el token actual es válido, emite uno nuevo
-    token = create_access_token(sub=str(current_user.id))
+    token = create_access_token(sub=str(ctx.user_id))
     return TokenOut(access_token=token)
 
 
@@ -234,12 +278,12 @@ def me(current_user: User = Depends(get_current_user)):
 
 @router.post("/password/reset/init", status_code=200)
 async def password_reset_init(
-    payload: PasswordResetInit, db: Session = Depends(get_db)
+    payload: PasswordResetInit, db: AsyncSession = Depends(get_async_db)
 ):
     generic = {
         "message": "Si corresponde, recibirás un correo para restablecer tu contraseña."
     }
-    user = db.query(User).filter(User.email == str(payload.email).lower()).first()
+    user = await db.scalar(select(User).where(User.email == str(payload.email).lower()))
 
     if not user:
         return generic
@@ -4,13 +4,15 @@ from datetime import datetime, timedelta, timezone
 from decimal import Decimal
 from fastapi import APIRouter, BackgroundTasks, HTTPException, Depends, Query, Request
 from fastapi_mail import FastMail, MessageSchema, MessageType
+from fastapi.concurrency import run_in_threadpool
 from fastapi.responses import RedirectResponse
-from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
 
 from app.api.routers.mail import conf
 from app.schemas.payment import PurchaseInitResponse
 from app.db.models import PurchaseOrder, User, Subscription
-from app.api.routers.auth import get_current_user, get_db
+from app.api.routers.auth import get_async_db, get_request_context
+from app.services.context_service import RequestContext
 from app.api.services.tbk import create_tx, update_status
 from app.utils.utils import activate_subscription
 
@@ -61,14 +63,13 @@ async def send_welcome_email(email: str, name: str, expiry_date: str):
 @router.post("/start", response_model=PurchaseInitResponse)
 async def create_transaction(
     request: Request,
-    user: User = Depends(get_current_user),
-    db: Session = Depends(get_db),
+    ctx: RequestContext = Depends(get_request_context),
+    db: AsyncSession = Depends(get_async_db),
 ):
     now = datetime.now(timezone.utc)
-    existing_sub = (
-        db.execute(sa.select(Subscription).where(Subscription.user_id == user.id))
-        .scalars()
-        .first()
+    # straight from the db, not the (cached) context: this is the double-payment guard
+    existing_sub = await db.scalar(
+        sa.select(Subscription).where(Subscription.user_id == ctx.user_id)
     )
 
     if existing_sub and existing_sub.is_active:
@@ -76,37 +77,35 @@ async def create_transaction(
             raise HTTPException(status_code=400, detail="active_subscription_exists")
 
     pending_order = (
-        db.execute(
+        await db.scalars(
             sa.select(PurchaseOrder).where(
                 sa.and_(
-                    PurchaseOrder.user_id == user.id, PurchaseOrder.status == "pending"
+                    PurchaseOrder.user_id == ctx.user_id, PurchaseOrder.status == "pending"
                 )
             )
         )
-        .scalars()
-        .first()
-    )
+    ).first()
     if pending_order:
         pending_order.status = "expired"
         db.add(pending_order)
-        db.flush()
+        await db.flush()
 
     order = PurchaseOrder(
-        user_id=user.id,
+        user_id=ctx.user_id,
         amount=PAYMENT_AMOUNT,
         token_ts=datetime.now(timezone.utc),
     )
     db.add(order)
-    db.flush()
+    await db.flush()
 
-    result = create_tx(order, request)
+    # the transbank sdk is blocking (requests), keep it off the event loop
+    result = await run_in_threadpool(create_tx, order, request)
     if not result or "url" not in result:
         raise HTTPException(status_code=500, detail="webpay_resp_missing")
 
     order.payment_url = result['url']
     order.token = result['token']
-    db.commit()
-    db.refresh(order)
+    await db.commit()
 
     return {"payment_url": order.payment_url, "token": order.token}
 
@@ -119,9 +118,9 @@ async def transaction_return(
     tbk_token: str | None = Query(None, alias="TBK_TOKEN"),
     tbk_orden_compra: str | None = Query(None, alias="TBK_ORDEN_COMPRA"),
     tbk_id_sesion: str | None = Query(None, alias="TBK_ID_SESION"),
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
 ):
-    order = db.get(PurchaseOrder, order_id)
+    order = await db.get(PurchaseOrder, order_id)
     if not order:
         return RedirectResponse(
             url=f"{FRONTEND_URL}/membresia/estado?status=failed", status_code=303
@@ -129,7 +128,7 @@ async def transaction_return(
 
     if tbk_token and not token_ws:
         order.status = "failed"
-        db.commit()
+        await db.commit()
         return RedirectResponse(
             url=f"{FRONTEND_URL}/membresia/estado?status=failed&order_id={order.id}",
             status_code=303,
@@ -142,7 +141,7 @@ async def transaction_return(
                 status_code=303,
             )
         try:
-            result = update_status(token_ws)
+            result = await run_in_threadpool(update_status, token_ws)
             if not result:
                 return RedirectResponse(
                     url=f"{FRONTEND_URL}/membresia/estado?status=failed",
@@ -156,17 +155,8 @@ async def transaction_return(
                 and result.get("status") == "AUTHORIZED"
             ):
                 order.status = "paid"
-                activate_subscription(order.user_id, order, db)
-                user = db.get(User, order.user_id)
-                sub = (
-                    db.execute(
-                        sa.select(Subscription).where(
-                            Subscription.user_id == order.user_id
-                        )
-                    )
-                    .scalars()
-                    .first()
-                )
+                sub = await activate_subscription(order.user_id, order, db)
+                user = await db.get(User, order.user_id)
 
                 if user and sub:
                     clean_date = sub.expiry_date.strftime("%Y-%m-%d")
@@ -179,13 +169,12 @@ async def transaction_return(
             else:
                 order.status = "failed"
 
-            db.commit()
-            db.refresh(order)
+            await db.commit()
 
         except Exception as e:
             print(f"CRITICAL PAYMENT ERROR: {e}")
             order.status = "failed"
-            db.commit()
+            await db.commit()
             return RedirectResponse(
                 url=f"{FRONTEND_URL}/membresia/estado?status=failed", status_code=303
             )
@@ -201,14 +190,17 @@ async def transaction_return(
 
 
 @router.get("/status/{order_id}")
-async def get_transaction_status(order_id: int, db: Session = Depends(get_db)):
-    order = db.query(PurchaseOrder).filter_by(id=order_id).first()
+async def get_transaction_status(
+    order_id: int, db: AsyncSession = Depends(get_async_db)
+):
+    order = await db.get(PurchaseOrder, order_id)
     if not order:
         raise HTTPException(status_code=404, detail="order_not_found")
 
     if order.can_update_payment():
-        order.update_status(order.token, as_get=True)
-        db.commit()
+        # may call transbank (blocking), only touches already loaded columns
+        await run_in_threadpool(order.update_status, order.token, as_get=True)
+        await db.commit()
 
     return {
         "status": order.status,
@@ -1,24 +1,61 @@
 import os
+import time
+import logging
+import base64
 import httpx
 from datetime import datetime, timezone
-from typing import Any, Dict, List
-from sqlalchemy import and_, func, case, select
+from typing import Any, Dict, List, Optional
+from sqlalchemy import func, case, select
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
-from fastapi import APIRouter, Query, UploadFile, File, HTTPException, Request, Depends
+from fastapi import APIRouter, Query, HTTPException, Request, Depends
+from fastapi.concurrency import run_in_threadpool
+from starlette.datastructures import UploadFile
+from starlette.requests import ClientDisconnect
 from app.schemas.plant import (
     PredictionOut,
     PredictOut,
     PredictionRecordOut,
     PredictSummaryOut,
 )
-from app.db.models import PredictionRecord, Subscription, User
-from app.api.routers.auth import get_current_user, get_db
+from app.db.models import PredictionRecord
+from app.api.routers.auth import get_async_db, get_request_context, get_db
+from app.services.context_service import RequestContext
+from app.core.http import http_clients
+from app.services.usage_service import FREE_DAILY_LIMIT, release, reserve
+from app.services.image_service import (
+    PREDICT_JPEG_QUALITY,
+    PREDICT_MAX_SIDE,
+    downscale_jpeg,
+    predict_stats,
+)
 
 router = APIRouter(prefix="/plant", tags=["plant"])
 PREDICT_URL = os.getenv("PREDICT_URL")
-PREDICT_TIMEOUT = float(os.getenv("PREDICT_TIMEOUT", "60"))
 PROB_CUT = 0.01
-FREE_DAILY_LIMIT = 5
+# ask the model service for the pooled embedding and keep it next to the record,
+# so a retrained head can rescore history without the cnn (app/tasks/rescore.py)
+PREDICT_EMBEDDINGS = os.getenv("PREDICT_EMBEDDINGS", "0") == "1"
+# the model service's 400 when it runs without EMBEDDINGS=1 (or on tflite): a config mismatch
+EMBEDDINGS_UNAVAILABLE = "Embeddings no disponibles"
+logger = logging.getLogger("uvicorn")
+# model service answers about the upload itself (bad image, unsupported type, too big)
+UPSTREAM_CLIENT_ERRORS = {400, 413, 415, 422}
+# the upload is streamed as-is, so the multipart body is only declared here for the docs
+UPLOAD_OPENAPI = {
+    "requestBody": {
+        "required": True,
+        "content": {
+            "multipart/form-data": {
+                "schema": {
+                    "type": "object",
+                    "required": ["file"],
+                    "properties": {"file": {"type": "string", "format": "binary"}},
+                }
+            }
+        },
+    }
+}
 
 
 def _as_list(x) -> List[str]:
@@ -29,58 +66,97 @@ def _as_list(x) -> List[str]:
     return [str(x)]
 
 
-@router.post("/predict", response_model=PredictOut)
+def _embedding_bytes(raw: Dict[str, Any]) -> Optional[bytes]:
+    # {"dim": 576, "dtype": "float16", "data": base64} -> raw float16 bytes, anything off is just skipped
+    emb = raw.get("embedding")
+    if not isinstance(emb, dict) or emb.get("dtype") != "float16":
+        return None
+    try:
+        data = base64.b64decode(emb["data"], validate=True)
+        dim = int(emb["dim"])
+    except (KeyError, TypeError, ValueError):
+        return None
+    return data if len(data) == 2 * dim else None
+
+
+# switched off for this process the first time the model service says it can't give embeddings
+_embeddings_on = PREDICT_EMBEDDINGS
+
+
+def _disable_embeddings(detail: str) -> None:
+    global _embeddings_on
+    if _embeddings_on:
+        logger.warning("PREDICT_EMBEDDINGS=1 but the model service has no embeddings, turning them off: %s", detail)
+    _embeddings_on = False
+
+
+async def _forward_upload(request: Request, content_type: str) -> httpx.Response:
+    params = {"embedding": "true"} if _embeddings_on else None
+    client = http_clients.get("predict")  # pooled client (app/core/http.py)
+
+    if PREDICT_MAX_SIDE:
+        # downscale mode: starlette spools the part to a temp file past 1 MB, and the decode
+        # + resize runs in a worker thread so the event loop never waits on pillow
+        async with request.form(max_files=1, max_fields=10) as form:
+            upload = form.get("file")
+            if not isinstance(upload, UploadFile):
+                raise HTTPException(status_code=400, detail="file_required")
+            t0 = time.perf_counter()
+            small = await run_in_threadpool(downscale_jpeg, upload.file, PREDICT_MAX_SIDE, PREDICT_JPEG_QUALITY)
+            if small is not None:
+                body, mime = small, "image/jpeg"
+            else:
+                await upload.seek(0)
+                body, mime = await upload.read(), upload.content_type or "image/jpeg"
+            predict_stats.record_downscale(upload.size or len(body), len(body), time.perf_counter() - t0, small is not None)
+            return await client.post(PREDICT_URL, params=params, files={"file": (upload.filename, body, mime)})
+
+    # the multipart body goes to the model chunk by chunk as it arrives (same boundary,
+    # same "file" field), so we never hold the whole photo. the size cap is enforced
+    # before this, in app/core/body_limit.py
+    headers = {"content-type": content_type}
+    if "content-length" in request.headers:
+        headers["content-length"] = request.headers["content-length"]
+    return await client.post(PREDICT_URL, params=params, content=request.stream(), headers=headers)
+
+
+@router.post("/predict", response_model=PredictOut, openapi_extra=UPLOAD_OPENAPI)
 async def proxy_predict(
     request: Request,
-    file: UploadFile = File(...),
-    current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db),
+    ctx: RequestContext = Depends(get_request_context),
+    db: AsyncSession = Depends(get_async_db),
 ):
-    active_sub = (
-        db.execute(
-            select(Subscription).where(
-                and_(
-                    Subscription.user_id == current_user.id,
-                    Subscription.is_active == True,
-                )
-            )
-        )
-        .scalars()
-        .first()
-    )
-
-    if not active_sub:
-        today_start = datetime.now(timezone.utc).replace(
-            hour=0, minute=0, second=0, microsecond=0
-        )
-
-        usage_count = db.scalar(
-            select(func.count())
-            .select_from(PredictionRecord)
-            .where(
-                and_(
-                    PredictionRecord.user_id == current_user.id,
-                    PredictionRecord.date_created >= today_start,
-                )
-            )
-        )
+    started = time.perf_counter()
+    content_type = request.headers.get("content-type", "")
+    if not content_type.startswith("multipart/form-data"):
+        raise HTTPException(status_code=400, detail="multipart_required")
 
-        if usage_count >= FREE_DAILY_LIMIT:
+    # free users take a slot of today's quota up front (atomic check + increment on
+    # daily_usage), and hand it back below if the prediction doesn't get saved
+    reserved = False
+    if not ctx.has_active_subscription:
+        if not await reserve(db, ctx.user_id, FREE_DAILY_LIMIT):
             raise HTTPException(status_code=403, detail="daily_limit_reached")
+        reserved = True
 
+    saved = False
     try:
-        contents = await file.read()
-        if await request.is_disconnected():
-            raise HTTPException(status_code=499, detail="client_closed_request")
-
-        async with httpx.AsyncClient(timeout=PREDICT_TIMEOUT) as client:
-            resp = await client.post(
-                PREDICT_URL,
-                files={
-                    "file": (file.filename, contents, file.content_type or "image/jpeg")
-                },
-            )
+        resp = await _forward_upload(request, content_type)
 
+        if resp.status_code in UPSTREAM_CLIENT_ERRORS:
+            # the streamed part goes as the client sent it (no image/jpeg default), so a bad
+            # or untyped file is the client's fault: same status back, not a 502.
+            # the quota slot is handed back in the finally below
+            try:
+                body = resp.json()
+            except ValueError:
+                body = None
+            detail = body.get("detail") if isinstance(body, dict) else None
+            if isinstance(detail, str) and detail.startswith(EMBEDDINGS_UNAVAILABLE):
+                # our config, not the user's upload: 502, and stop asking for them
+                _disable_embeddings(detail)
+                raise HTTPException(status_code=502, detail="upstream_embeddings_unavailable")
+            raise HTTPException(status_code=resp.status_code, detail=detail or resp.text)
         if resp.status_code >= 400:
             raise HTTPException(
                 status_code=502,
@@ -130,42 +206,51 @@ async def proxy_predict(
             top1 = out.predictions[0]
             db.add(
                 PredictionRecord(
-                    user_id=current_user.id,
+                    user_id=ctx.user_id,
                     title=top1.title,
                     severity=top1.severity,
                     advice=top1.advice,
                     probability=float(top1.probability),
                     model_version=out.model_version,
+                    embedding=_embedding_bytes(raw),
                 )
             )
-            db.commit()
+            await db.commit()
+            saved = True
+        predict_stats.record_request(time.perf_counter() - started)
         return out
+    except ClientDisconnect:
+        raise HTTPException(status_code=499, detail="client_closed_request")
     except httpx.HTTPError as e:
         raise HTTPException(status_code=502, detail=f"fetch_failed: {e!s}")
+    finally:
+        # only saved predictions count, same as when the quota was a count of records
+        if reserved and not saved:
+            await db.rollback()
+            await release(db, ctx.user_id)
 
 
 @router.get("/predict/history", response_model=List[PredictionRecordOut])
 async def get_predict_history(
     limit: int = Query(50, ge=1, le=200),
     offset: int = Query(0, ge=0),
-    db: Session = Depends(get_db),
-    current_user=Depends(get_current_user),
+    db: AsyncSession = Depends(get_async_db),
+    ctx: RequestContext = Depends(get_request_context),
 ):
-    rows = (
-        db.query(PredictionRecord)
-        .filter(PredictionRecord.user_id == current_user.id)
+    rows = await db.scalars(
+        select(PredictionRecord)
+        .where(PredictionRecord.user_id == ctx.user_id)
         .order_by(PredictionRecord.date_created.desc())
         .offset(offset)
         .limit(limit)
-        .all()
     )
-    return rows
+    return rows.all()
 
 
 @router.get("/predict/summary", response_model=PredictSummaryOut)
 def get_predict_summary(
     db: Session = Depends(get_db),
-    current_user=Depends(get_current_user),
+    ctx: RequestContext = Depends(get_request_context),
 ):
     # this entire call is only for the home section, to finally remove the static stuff
     # this could be a boolean, but i dont feel like changing the db again currently, so this will do.
@@ -177,7 +262,7 @@ def get_predict_summary(
         func.count(PredictionRecord.id),
         func.sum(healthy_case),
         func.avg(PredictionRecord.probability),
-    ).filter(PredictionRecord.user_id == current_user.id)
+    ).filter(PredictionRecord.user_id == ctx.user_id)
     # simple math to fill up our summary schema
     total_count, healthy_sum, avg_conf = query.one()
     total_count = int(total_count or 0)
@@ -189,7 +274,7 @@ def get_predict_summary(
     # make sure we always get the latest params of the current user
     last = (
         db.query(PredictionRecord)
-        .filter(PredictionRecord.user_id == current_user.id)
+        .filter(PredictionRecord.user_id == ctx.user_id)
         .order_by(PredictionRecord.date_created.desc())
         .limit(1)
         .one_or_none()
@@ -1,24 +1,21 @@
 from fastapi import APIRouter, Depends
-from sqlalchemy import select
-from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
 
 from app.schemas.payment import SubscriptionStatusResponse
-from app.db.models import User, Subscription
-from app.api.routers.auth import get_current_user, get_db
+from app.api.routers.auth import get_async_db, get_request_context
+from app.services.context_service import RequestContext
+from app.services.usage_service import FREE_DAILY_LIMIT, used_today
 
 router = APIRouter(prefix="/subscription", tags=["subscription"])
 
 
 @router.get("/status", response_model=SubscriptionStatusResponse)
 async def get_subscription_status(
-    user: User = Depends(get_current_user),
-    db: Session = Depends(get_db),
+    ctx: RequestContext = Depends(get_request_context),
+    db: AsyncSession = Depends(get_async_db),
 ):
-    sub = (
-        db.execute(select(Subscription).where(Subscription.user_id == user.id))
-        .scalars()
-        .first()
-    )
+    # already joined in by the request context, no extra query
+    sub = ctx.user.subscription_status
 
     response = {"plan_name": "Free", "is_active": False, "expiry_date": None}
 
@@ -27,5 +24,8 @@ async def get_subscription_status(
         response["is_active"] = True
         if sub.expiry_date:
             response["expiry_date"] = sub.expiry_date.strftime("%Y-%m-%d")
+    else:
+        response["daily_used"] = await used_today(db, ctx.user_id)
+        response["daily_limit"] = FREE_DAILY_LIMIT
 
     return response
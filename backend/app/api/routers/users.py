@@ -9,6 +9,7 @@ import time
 
 from urllib.parse import urljoin
 from fastapi import APIRouter, Depends, HTTPException, Request, UploadFile, File
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
 
 from app.schemas.user import UserOut, UserProfileUpdate
@@ -18,8 +19,14 @@ from app.schemas.weather_prefs import (
     WeatherPrefsOut,
 )
 from app.api.services.weather_service import get_prefs_or_404
-from app.api.routers.auth import get_current_user, get_db
+from app.api.routers.auth import (
+    get_async_db,
+    get_current_user,
+    get_current_user_async,
+    get_db,
+)
 from app.db.models import User, UserWeatherPrefs
+from app.services.context_service import invalidate
 from app.core.config import settings
 
 
@@ -45,6 +52,7 @@ def update_me(
         setattr(current, field, value)
     db.add(current)
     db.commit()
+    invalidate(current.id)
     db.refresh(current)
 
     # construir avatar_url si hay avatar_path
@@ -62,6 +70,7 @@ def Update_my_theme(
     current.theme = payload.theme
     db.add(current)
     db.commit()
+    invalidate(current.id)
     db.refresh(current)
     return UserOut.model_validate(
         {**current.__dict__, "avatar_url": current.avatar_path}
@@ -75,8 +84,8 @@ MAX_BYTES = 2 * 1024 * 1024  # 2MB
 @router.post("/me/avatar", response_model=UserOut)
 async def upload_avatar(
     file: UploadFile = File(...),
-    db: Session = Depends(get_db),
-    current: User = Depends(get_current_user),
+    db: AsyncSession = Depends(get_async_db),
+    current: User = Depends(get_current_user_async),
 ):
     if file.content_type not in ALLOWED_MIME:
         raise HTTPException(
@@ -109,8 +118,9 @@ async def upload_avatar(
     # guarda ruta pública
     current.avatar_path = f"{settings.MEDIA_URL_PREFIX}/{fname}"  # ej. "/media/xxx.jpg"
     db.add(current)
-    db.commit()
-    db.refresh(current)
+    await db.commit()
+    invalidate(current.id)
+    await db.refresh(current)
     return UserOut.model_validate(
         {**current.__dict__, "avatar_url": current.avatar_path}
     )
@@ -147,6 +157,7 @@ def put_weather_prefs(
 
     db.add(prefs)
     db.commit()
+    invalidate(current.id)
     db.refresh(prefs)
     return WeatherPrefsOut.model_validate(
         {
@@ -172,6 +183,7 @@ def patch_weather_prefs(
 
     db.add(prefs)
     db.commit()
+    invalidate(current.id)
     db.refresh(prefs)
 
     return WeatherPrefsOut.model_validate(
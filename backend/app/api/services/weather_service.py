@@ -1,4 +1,3 @@
-import httpx
 import os
 from fastapi import Depends, HTTPException
 from dotenv import load_dotenv
@@ -8,6 +7,7 @@ from sqlalchemy import select
 from sqlalchemy.orm import Session
 
 from app.utils.utils import fetch_json
+from app.core.http import http_clients
 from app.db.models import User, UserWeatherPrefs
 
 load_dotenv()
@@ -36,8 +36,7 @@ async def get_current_weather(lat: float, lon: float):
     }
 
     # Hacemos la llamada a la API externa
-    async with httpx.AsyncClient() as client:
-        response = await client.get(OPENWEATHER_URL, params=params)
+    response = await http_clients.get("openweather").get(OPENWEATHER_URL, params=params)
 
     if response.status_code != 200:
         # Si algo salió mal en la llamada externa
@@ -71,7 +70,7 @@ async def get_forecast(lat: float, lon: float, for_alerts: bool = True):
     if not OPENWEATHER_API_KEY:
         return {"error": "Weather API key not configured"}
 
-    data = await fetch_json(OPENWEATHER_URL_FORECAST, params)
+    data = await fetch_json(OPENWEATHER_URL_FORECAST, params, "openweather")
 
     if "list" not in data:
         return {"error": "Unexpected response format", "raw": data}
@@ -160,7 +159,7 @@ async def get_lat_lon(address: str):
     if not GOOGLE_MAPS_API_KEY:
         return {"error": "API_KEY_MISSING"}
 
-    data = await fetch_json(GEOCODE_URL, params)
+    data = await fetch_json(GEOCODE_URL, params, "google")
 
     if "error" in data:
         return data
@@ -0,0 +1,90 @@
+"""
+ASGI middleware that caps request bodies on the upload routes before anything gets to buffer them.
+
+Only the paths given in `limits` are checked (photo for the model, avatar); everything else
+goes through untouched. A declared Content-Length over the limit gets a 413 right away, and
+chunked (or lying) clients are cut off as soon as the received bytes go past it. So a streamed
+upload (plant.proxy_predict) or a form parse never holds more than the limit per request.
+"""
+
+import os
+from typing import Dict
+
+from fastapi import FastAPI, HTTPException, Request
+from fastapi.responses import JSONResponse
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+MAX_UPLOAD_MB = float(os.getenv("MAX_UPLOAD_MB", os.getenv("MAX_IMAGE_MB", "10")))
+# room for the multipart boundary and part headers on top of the photo itself
+MULTIPART_OVERHEAD = 64 * 1024
+MAX_BODY_BYTES = int(MAX_UPLOAD_MB * 1024 * 1024) + MULTIPART_OVERHEAD
+
+
+def multipart_limit(file_bytes: int) -> int:
+    return file_bytes + MULTIPART_OVERHEAD
+
+
+class BodyTooLarge(HTTPException):
+    # an HTTPException so FastAPI re-raises it when it comes out of receive() in the middle of
+    # its own File()/Form() parsing, instead of turning it into a 400 "error parsing the body"
+    def __init__(self, max_bytes: int):
+        super().__init__(status_code=413, detail="payload_too_large")
+        self.max_bytes = max_bytes
+
+
+def too_large_response(max_bytes: int) -> JSONResponse:
+    max_mb = round((max_bytes - MULTIPART_OVERHEAD) / (1024 * 1024), 2)
+    return JSONResponse({"detail": "payload_too_large", "max_mb": max_mb}, status_code=413)
+
+
+async def body_too_large_handler(request: Request, exc: BodyTooLarge) -> JSONResponse:
+    return too_large_response(exc.max_bytes)
+
+
+class BodySizeLimitMiddleware:
+    def __init__(self, app: ASGIApp, limits: Dict[str, int]):
+        self.app = app
+        # exact path -> max body bytes
+        self.limits = limits
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        max_bytes = self.limits.get(scope.get("path", "")) if scope["type"] == "http" else None
+        if max_bytes is None:
+            await self.app(scope, receive, send)
+            return
+
+        declared = dict(scope["headers"]).get(b"content-length", b"")
+        if declared.isdigit() and int(declared) > max_bytes:
+            await too_large_response(max_bytes)(scope, receive, send)
+            return
+
+        received = 0
+        response_started = False
+
+        async def limited_receive() -> Message:
+            nonlocal received
+            message = await receive()
+            if message["type"] == "http.request":
+                received += len(message.get("body", b""))
+                if received > max_bytes:
+                    raise BodyTooLarge(max_bytes)
+            return message
+
+        async def tracking_send(message: Message) -> None:
+            nonlocal response_started
+            if message["type"] == "http.response.start":
+                response_started = True
+            await send(message)
+
+        try:
+            await self.app(scope, limited_receive, tracking_send)
+        except BodyTooLarge:
+            # normally the app's handler answers it; this is for anything that lets it escape
+            if response_started:
+                raise
+            await too_large_response(max_bytes)(scope, receive, send)
+
+
+def install_body_limits(app: FastAPI, limits: Dict[str, int]) -> None:
+    app.add_exception_handler(BodyTooLarge, body_too_large_handler)
+    app.add_middleware(BodySizeLimitMiddleware, limits=limits)
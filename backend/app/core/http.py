@@ -0,0 +1,153 @@
+"""
+Shared outbound http clients, one pooled httpx.AsyncClient per upstream.
+
+Opening a client per call meant a fresh tcp+tls handshake on every request to the model
+service, OpenWeather and Google geocoding. These clients live for the whole app
+(started/closed in main.lifespan) and keep connections alive between requests.
+"""
+
+import logging
+import os
+import time
+from dataclasses import dataclass
+from typing import Any, Dict
+
+import httpx
+from dotenv import load_dotenv
+
+load_dotenv()
+logger = logging.getLogger("uvicorn")
+
+HTTP_MAX_CONNECTIONS = int(os.getenv("HTTP_MAX_CONNECTIONS", "20"))
+HTTP_MAX_KEEPALIVE = int(os.getenv("HTTP_MAX_KEEPALIVE", "10"))
+HTTP_KEEPALIVE_EXPIRY = float(os.getenv("HTTP_KEEPALIVE_EXPIRY", "30"))
+HTTP_CONNECT_TIMEOUT = float(os.getenv("HTTP_CONNECT_TIMEOUT", "5"))
+# how long a call waits for a free connection when the pool is full
+HTTP_POOL_TIMEOUT = float(os.getenv("HTTP_POOL_TIMEOUT", "5"))
+HTTP_TIMEOUT = float(os.getenv("HTTP_TIMEOUT", "5"))
+# needs the h2 package (pip install "httpx[http2]"), otherwise we stay on http/1.1
+HTTP2 = os.getenv("HTTP2", "0") == "1"
+
+# upstream name -> read/write timeout; the model can take a while on cold starts
+UPSTREAMS: Dict[str, float] = {
+    "predict": float(os.getenv("PREDICT_TIMEOUT", "60")),
+    "openweather": HTTP_TIMEOUT,
+    "google": HTTP_TIMEOUT,
+}
+
+
+def _http2_available() -> bool:
+    try:
+        import h2  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+
+@dataclass
+class UpstreamStats:
+    requests: int = 0
+    errors: int = 0
+    in_flight: int = 0
+    connections_opened: int = 0
+    seconds: float = 0.0
+
+
+class _CountingTransport(httpx.AsyncBaseTransport):
+    """Wraps the pooled transport to count requests, errors and new connections."""
+
+    def __init__(self, inner: httpx.AsyncHTTPTransport, stats: UpstreamStats):
+        self.inner = inner
+        self.stats = stats
+
+    async def _trace(self, event: str, info: Dict[str, Any]) -> None:
+        # httpcore only emits connect_tcp when it can't reuse a kept-alive connection
+        if event == "connection.connect_tcp.complete":
+            self.stats.connections_opened += 1
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        s = self.stats
+        request.extensions.setdefault("trace", self._trace)
+        s.requests += 1
+        s.in_flight += 1
+        t0 = time.perf_counter()
+        try:
+            return await self.inner.handle_async_request(request)
+        except Exception:
+            s.errors += 1
+            raise
+        finally:
+            # time until the response headers arrive
+            s.in_flight -= 1
+            s.seconds += time.perf_counter() - t0
+
+    async def aclose(self) -> None:
+        await self.inner.aclose()
+
+
+class HttpClients:
+    def __init__(self):
+        self._clients: Dict[str, httpx.AsyncClient] = {}
+        self._transports: Dict[str, httpx.AsyncHTTPTransport] = {}
+        self._stats: Dict[str, UpstreamStats] = {name: UpstreamStats() for name in UPSTREAMS}
+        self.http2 = HTTP2 and _http2_available()
+
+    def _build(self, name: str) -> httpx.AsyncClient:
+        limits = httpx.Limits(
+            max_connections=HTTP_MAX_CONNECTIONS,
+            max_keepalive_connections=HTTP_MAX_KEEPALIVE,
+            keepalive_expiry=HTTP_KEEPALIVE_EXPIRY,
+        )
+        transport = httpx.AsyncHTTPTransport(limits=limits, http2=self.http2)
+        self._transports[name] = transport
+        return httpx.AsyncClient(
+            transport=_CountingTransport(transport, self._stats[name]),
+            timeout=httpx.Timeout(UPSTREAMS[name], connect=HTTP_CONNECT_TIMEOUT, pool=HTTP_POOL_TIMEOUT),
+        )
+
+    async def start(self) -> None:
+        if HTTP2 and not self.http2:
+            logger.warning("HTTP2=1 but the h2 package is not installed, using http/1.1")
+        for name in UPSTREAMS:
+            self.get(name)
+
+    def get(self, name: str) -> httpx.AsyncClient:
+        # created on first use too, so scripts and jobs outside the app lifespan still work
+        client = self._clients.get(name)
+        if client is None or client.is_closed:
+            client = self._clients[name] = self._build(name)
+        return client
+
+    async def aclose(self) -> None:
+        for client in self._clients.values():
+            await client.aclose()
+        self._clients.clear()
+        self._transports.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        out: Dict[str, Any] = {
+            "http2": self.http2,
+            "max_connections": HTTP_MAX_CONNECTIONS,
+            "max_keepalive": HTTP_MAX_KEEPALIVE,
+            "upstreams": {},
+        }
+        for name, s in self._stats.items():
+            # httpcore's pool keeps the open connections; idle ones are the kept-alive spares
+            pool = getattr(self._transports.get(name), "_pool", None)
+            conns = list(getattr(pool, "connections", None) or [])
+            idle = sum(1 for c in conns if c.is_idle())
+            out["upstreams"][name] = {
+                "requests": s.requests,
+                "errors": s.errors,
+                "in_flight": s.in_flight,
+                "connections_opened": s.connections_opened,
+                "avg_ms": round(s.seconds / s.requests * 1000, 1) if s.requests else None,
+                "pool_connections": len(conns),
+                "pool_idle": idle,
+                "pool_active": len(conns) - idle,
+                "pool_utilization": round((len(conns) - idle) / HTTP_MAX_CONNECTIONS, 3),
+            }
+        return out
+
+
+http_clients = HttpClients()
@@ -1,3 +1,3 @@
  #aqui va el engine, SessionLocal
 from app.db.session import Base
-from app.db.models import User, UserWeatherPrefs, PredictionRecord, Subscription, PurchaseOrder
+from app.db.models import User, UserWeatherPrefs, PredictionRecord, Subscription, PurchaseOrder, DailyUsage
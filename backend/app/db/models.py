@@ -12,11 +12,13 @@ from sqlalchemy import (
     Boolean,
     Integer,
     ForeignKey,
+    LargeBinary,
+    Date,
 )
 from sqlalchemy.dialects.postgresql import UUID
 from sqlalchemy.sql import func
 from sqlalchemy.dialects.postgresql import JSONB
-from sqlalchemy.orm import relationship
+from sqlalchemy.orm import relationship, deferred
 
 from app.db.session import Base
 
@@ -104,9 +106,26 @@ class PredictionRecord(Base):
     advice = Column(JSONB, nullable=False, default=list)
     probability = Column(DOUBLE_PRECISION, nullable=False)
     model_version = Column(String, nullable=True)
+    # pooled backbone output (float16 little-endian bytes, 576 dims -> 1152 bytes), only when
+    # PREDICT_EMBEDDINGS is on. lets tasks/rescore.py apply a retrained head without re-running the cnn.
+    # deferred so history/summary queries don't pull it.
+    embedding = deferred(Column(LargeBinary, nullable=True))
     user = relationship("User", backref="prediction_records")
 
 
+class DailyUsage(Base):
+    # free-tier quota: one row per user per (utc) day, bumped atomically in usage_service,
+    # so the check is a single pk lookup instead of counting prediction_record rows
+    __tablename__ = "daily_usage"
+    user_id = Column(
+        UUID(as_uuid=True),
+        ForeignKey("users.id", ondelete="CASCADE"),
+        primary_key=True,
+    )
+    day = Column(Date, primary_key=True)
+    used = Column(Integer, nullable=False, default=0)
+
+
 class Subscription(Base):
     __tablename__ = "subscription"
     __table_args__ = (sa.Index("ix_subscription_user_active", "user_id", "is_active"),)
@@ -1,4 +1,8 @@
+import os
+from urllib.parse import parse_qsl, urlencode, urlsplit, urlunsplit
+
 from sqlalchemy import create_engine
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
 from sqlalchemy.orm import sessionmaker, declarative_base
 from app.core.config import settings
 
@@ -7,5 +11,42 @@ engine = create_engine(
     pool_pre_ping=True,  # evita conexiones muertas
 )
 
+# sync path: alembic, rescore and the plain `def` routes (those already run in the threadpool)
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+
+
+def async_database_url(url: str) -> tuple[str, dict]:
+    """
+    Same database, asyncpg driver. asyncpg doesn't take the libpq query params of the
+    Neon url (sslmode, channel_binding), so sslmode goes in as connect_args["ssl"].
+    """
+    parts = urlsplit(url)
+    scheme = parts.scheme.split("+", 1)[0]
+    if scheme == "postgres":
+        scheme = "postgresql"
+    query = dict(parse_qsl(parts.query))
+    connect_args = {}
+    sslmode = query.pop("sslmode", None)
+    query.pop("channel_binding", None)
+    if sslmode:
+        connect_args["ssl"] = sslmode
+    url = urlunsplit((f"{scheme}+asyncpg", parts.netloc, parts.path, urlencode(query), parts.fragment))
+    return url, connect_args
+
+
+_async_url, _async_connect_args = async_database_url(settings.DATABASE_URL)
+
+# async path: every `async def` route and the cron jobs, so a query never blocks the event loop
+async_engine = create_async_engine(
+    _async_url,
+    connect_args=_async_connect_args,
+    pool_pre_ping=True,
+    pool_size=int(os.getenv("DB_POOL_SIZE", "5")),
+    max_overflow=int(os.getenv("DB_MAX_OVERFLOW", "10")),
+)
+
+# expire_on_commit=False: attributes stay readable after commit without an (implicit, sync) refresh
+AsyncSessionLocal = async_sessionmaker(
+    async_engine, class_=AsyncSession, autoflush=False, expire_on_commit=False
+)
 Base = declarative_base()
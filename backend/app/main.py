@@ -1,4 +1,7 @@
-﻿from fastapi import FastAPI, Depends, Request
+﻿import os
+import secrets
+
+from fastapi import FastAPI, Depends, Header, HTTPException, Request
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.staticfiles import StaticFiles
 from fastapi.responses import RedirectResponse, JSONResponse
@@ -18,7 +21,12 @@ from app.api.routers.plant import router as plant_router
 from app.api.routers.payment import router as payment_router
 from app.api.routers.subscription import router as subscription_router
 from app.api.routers.debug import router as debug_router
-from app.db.session import SessionLocal
+from app.db.session import SessionLocal, async_engine, engine
+from app.core.http import http_clients
+from app.core.body_limit import MAX_BODY_BYTES, install_body_limits, multipart_limit
+from app.api.routers.users import MAX_BYTES as AVATAR_MAX_BYTES
+from app.services.image_service import predict_stats
+from app.services.context_service import context_cache
 from app.tasks.cron import cleanup_pending_orders, check_expired_subscriptions
 
 
@@ -29,15 +37,27 @@ async def lifespan(app: FastAPI):
     scheduler.add_job(check_expired_subscriptions, 'interval', hours=1)
     scheduler.start()
     print("BG Scheduler initialized")
+    await http_clients.start()
 
     yield
     scheduler.shutdown()
     print("BG Scheduler Stopped")
+    await http_clients.aclose()
+    await async_engine.dispose()
 
 
 app = FastAPI(title="PlantGuard API", version="1.0.0", lifespan=lifespan)
 
 
+# added before CORS so the 413 still gets the cors headers. only the upload routes are capped
+install_body_limits(
+    app,
+    {
+        "/api/plant/predict": MAX_BODY_BYTES,
+        "/api/users/me/avatar": multipart_limit(AVATAR_MAX_BYTES),
+    },
+)
+
 app.add_middleware(
     CORSMiddleware,
     allow_origins=settings.CORS_ORIGINS,
@@ -64,6 +84,49 @@ def health():
     return {"status": "ok"}
 
 
+# /metrics/* show pool, db and per-request internals: only with the METRICS_TOKEN header.
+# without the env var they're off (403), same as the model service's admin routes
+METRICS_TOKEN = os.getenv("METRICS_TOKEN")
+
+
+def require_metrics_token(x_metrics_token: str | None = Header(None)) -> None:
+    if not METRICS_TOKEN:
+        raise HTTPException(status_code=403, detail="metrics_disabled")
+    if not x_metrics_token or not secrets.compare_digest(x_metrics_token, METRICS_TOKEN):
+        raise HTTPException(status_code=401, detail="invalid_metrics_token")
+
+
+# pool usage of the outbound http clients (model, OpenWeather, Google)
+@app.get("/metrics/http", include_in_schema=False, dependencies=[Depends(require_metrics_token)])
+def http_metrics():
+    return http_clients.stats()
+
+
+# /api/plant/predict: end-to-end latency and what the optional downscale saved / cost
+@app.get("/metrics/predict", include_in_schema=False, dependencies=[Depends(require_metrics_token)])
+def predict_metrics():
+    return predict_stats.snapshot()
+
+
+# request context cache (user + subscription + weather prefs), per process
+@app.get("/metrics/context", include_in_schema=False, dependencies=[Depends(require_metrics_token)])
+def context_metrics():
+    return {"ttl_s": context_cache.ttl, "hits": context_cache.hits, "misses": context_cache.misses}
+
+
+# db connection pools: async (async routes + cron) and sync (plain def routes)
+@app.get("/metrics/db", include_in_schema=False, dependencies=[Depends(require_metrics_token)])
+def db_metrics():
+    def pool_stats(pool):
+        return {
+            "size": pool.size(),
+            "checked_out": pool.checkedout(),
+            "overflow": pool.overflow(),
+        }
+
+    return {"async": pool_stats(async_engine.sync_engine.pool), "sync": pool_stats(engine.pool)}
+
+
 @app.head("/", include_in_schema=False)
 def root_head():
     return JSONResponse({}, status_code=200)
@@ -27,3 +27,6 @@ class SubscriptionStatusResponse(BaseModel):
     plan_name: str
     is_active: bool
     expiry_date: Optional[str] = None
+    # free plan only: predictions used today / daily limit
+    daily_used: Optional[int] = None
+    daily_limit: Optional[int] = None
@@ -0,0 +1,117 @@
+"""
+Per-request user context: the user, whether they have an active subscription and their
+weather thresholds, loaded with one joined query and memoized per process for a few seconds.
+
+Hot endpoints used to pay up to three round trips to the (remote) db before doing anything:
+get_current_user, the Subscription lookup and the UserWeatherPrefs lookup. Writes to the
+profile, prefs or subscription call invalidate() so this process sees them right away; other
+workers pick them up when their entry expires (CONTEXT_CACHE_TTL).
+"""
+
+import os
+import threading
+import time
+from dataclasses import dataclass
+from typing import Dict, Optional, Tuple
+from uuid import UUID
+
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import joinedload
+
+from app.db.models import Subscription, User
+
+CONTEXT_CACHE_TTL = float(os.getenv("CONTEXT_CACHE_TTL", "30"))
+CONTEXT_CACHE_MAX = int(os.getenv("CONTEXT_CACHE_MAX", "10000"))
+
+THRESHOLD_FIELDS = {
+    "FROST": "dangerous_frost_threshold",
+    "HEAT": "dangerous_temp_threshold",
+    "RAIN": "rain_mm_threshold",
+    "WIND": "wind_kph_threshold",
+}
+
+
+@dataclass(frozen=True)
+class RequestContext:
+    # detached snapshot, read only: write endpoints keep using get_current_user
+    user: User
+    has_active_subscription: bool
+    # FROST/HEAT/RAIN/WIND as stored, None where the user has no value
+    thresholds: Dict[str, Optional[int]]
+
+    @property
+    def user_id(self) -> UUID:
+        return self.user.id
+
+
+class ContextCache:
+    def __init__(self, ttl: float = CONTEXT_CACHE_TTL, max_entries: int = CONTEXT_CACHE_MAX):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._entries: Dict[str, Tuple[float, RequestContext]] = {}
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, user_id: str) -> Optional[RequestContext]:
+        with self._lock:
+            entry = self._entries.get(user_id)
+            if entry is None or entry[0] < time.monotonic():
+                self.misses += 1
+                return None
+            self.hits += 1
+            return entry[1]
+
+    def set(self, user_id: str, ctx: RequestContext) -> None:
+        with self._lock:
+            if len(self._entries) >= self.max_entries:
+                now = time.monotonic()
+                self._entries = {k: v for k, v in self._entries.items() if v[0] >= now}
+                if len(self._entries) >= self.max_entries:
+                    self._entries.clear()
+            self._entries[user_id] = (time.monotonic() + self.ttl, ctx)
+
+    def invalidate(self, user_id) -> None:
+        with self._lock:
+            self._entries.pop(str(user_id), None)
+
+
+context_cache = ContextCache()
+
+
+def invalidate(user_id) -> None:
+    context_cache.invalidate(user_id)
+
+
+async def load_context(db: AsyncSession, user_id: str) -> Optional[RequestContext]:
+    cached = context_cache.get(user_id)
+    if cached is not None:
+        return cached
+
+    # users LEFT JOIN subscription LEFT JOIN user_weather_prefs, one round trip.
+    # a user can have several subscription rows (old inactive + current), so the join only
+    # takes the active one, same filter the routes used before
+    result = await db.execute(
+        select(User)
+        .options(
+            joinedload(User.subscription_status.and_(Subscription.is_active.is_(True))),
+            joinedload(User.weather_prefs),
+        )
+        .where(User.id == user_id)
+    )
+    user = result.unique().scalar_one_or_none()
+    if user is None:
+        return None
+
+    sub = user.subscription_status
+    prefs = user.weather_prefs
+    ctx = RequestContext(
+        user=user,
+        has_active_subscription=bool(sub and sub.is_active),
+        thresholds={k: getattr(prefs, f, None) if prefs else None for k, f in THRESHOLD_FIELDS.items()},
+    )
+    # detach (cascades to the joined rows) so the snapshot outlives this session
+    db.expunge(user)
+    context_cache.set(user_id, ctx)
+    return ctx
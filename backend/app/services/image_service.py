@@ -0,0 +1,106 @@
+"""
+Optional downscale of the uploaded photo before it goes to the model service.
+
+The model only ever looks at a 224x224 version, so sending a 12 MP original across hosts
+wastes upstream bandwidth and decode time on the inference side. With PREDICT_MAX_SIDE set,
+proxy_predict decodes the upload (EXIF-oriented), shrinks it and forwards a small JPEG.
+This runs in a worker thread, never on the event loop.
+"""
+
+import io
+import os
+import threading
+from collections import deque
+from typing import Any, BinaryIO, Deque, Dict, Optional
+
+from PIL import Image, ImageOps
+
+# longest side of the forwarded image; 0 = off, forward the original upload as a stream
+PREDICT_MAX_SIDE = int(os.getenv("PREDICT_MAX_SIDE", "0"))
+PREDICT_JPEG_QUALITY = int(os.getenv("PREDICT_JPEG_QUALITY", "90"))
+# the model squashes to 224x224, so the short side is never taken below that
+MODEL_SIDE = 224
+# same guard as the model service against decompression bombs
+Image.MAX_IMAGE_PIXELS = int(os.getenv("MAX_IMAGE_PIXELS", "50000000"))
+
+
+def downscale_jpeg(f: BinaryIO, max_side: int, quality: int) -> Optional[bytes]:
+    """
+    Returns the oriented, downscaled JPEG, or None when the original should go as is
+    (not an image, already small and upright, or the result wouldn't be smaller).
+    """
+    try:
+        with Image.open(f) as img:
+            w, h = img.size
+            scale = min(1.0, max(max_side / max(w, h), MODEL_SIDE / min(w, h)))
+            orientation = img.getexif().get(0x0112, 1)
+            if scale >= 1.0 and orientation == 1:
+                return None
+            size = (max(1, round(w * scale)), max(1, round(h * scale)))
+            # jpeg: decode straight at 1/2, 1/4 or 1/8 scale, never below the target size
+            img.draft("RGB", size)
+            out = ImageOps.exif_transpose(img).convert("RGB")
+            if orientation in (5, 6, 7, 8):
+                size = (size[1], size[0])
+            if out.size != size:
+                out = out.resize(size, Image.Resampling.BILINEAR, reducing_gap=2.0)
+            buf = io.BytesIO()
+            out.save(buf, "JPEG", quality=quality)
+    except (OSError, ValueError, Image.DecompressionBombError):
+        return None
+    data = buf.getvalue()
+    f.seek(0, os.SEEK_END)
+    return data if len(data) < f.tell() else None
+
+
+class PredictStats:
+    """Counters for /metrics/predict; proxy_predict records into the module-level instance."""
+
+    def __init__(self, window: int = 1000):
+        self._lock = threading.Lock()
+        self.requests = 0
+        self.downscaled = 0
+        self.passthrough = 0
+        self.bytes_in = 0
+        self.bytes_out = 0
+        self.downscale_seconds = 0.0
+        self._latency: Deque[float] = deque(maxlen=window)
+
+    def record_downscale(self, bytes_in: int, bytes_out: int, seconds: float, applied: bool) -> None:
+        with self._lock:
+            self.bytes_in += bytes_in
+            self.bytes_out += bytes_out
+            self.downscale_seconds += seconds
+            if applied:
+                self.downscaled += 1
+            else:
+                self.passthrough += 1
+
+    def record_request(self, seconds: float) -> None:
+        with self._lock:
+            self.requests += 1
+            self._latency.append(seconds)
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            lat = sorted(self._latency)
+            prepared = self.downscaled + self.passthrough
+
+            def pct(q: float) -> Optional[float]:
+                return round(lat[min(len(lat) - 1, int(q * len(lat)))] * 1000, 1) if lat else None
+
+            return {
+                "max_side": PREDICT_MAX_SIDE,
+                "requests": self.requests,
+                # end to end, upload in -> response out, over the last `window` requests
+                "latency_ms": {"p50": pct(0.50), "p95": pct(0.95), "p99": pct(0.99)},
+                "downscaled": self.downscaled,
+                "passthrough": self.passthrough,
+                "bytes_in": self.bytes_in,
+                "bytes_out": self.bytes_out,
+                "bytes_saved": self.bytes_in - self.bytes_out,
+                "downscale_avg_ms": round(self.downscale_seconds / prepared * 1000, 1) if prepared else None,
+            }
+
+
+predict_stats = PredictStats()
@@ -0,0 +1,102 @@
+"""
+Free-tier daily quota on top of the daily_usage table.
+
+reserve() does the check and the increment in one statement
+(INSERT .. ON CONFLICT DO UPDATE .. WHERE used < limit RETURNING used), so two uploads
+racing for the last slot can't both get it. The known counts are also kept in-process,
+so a user that already hit the limit is turned away without touching the db.
+"""
+
+import threading
+from datetime import date, datetime, timezone
+from typing import Dict, Optional, Tuple
+from uuid import UUID
+
+from sqlalchemy import and_, select, update
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.db.models import DailyUsage
+
+FREE_DAILY_LIMIT = 5
+
+
+def utc_today() -> date:
+    return datetime.now(timezone.utc).date()
+
+
+class UsageCache:
+    """(user_id, day) -> last count seen by this process. Only today's entries are kept."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._day: Optional[date] = None
+        self._counts: Dict[Tuple[UUID, date], int] = {}
+
+    def get(self, user_id: UUID, day: date) -> Optional[int]:
+        with self._lock:
+            return self._counts.get((user_id, day))
+
+    def set(self, user_id: UUID, day: date, used: int) -> None:
+        with self._lock:
+            if day != self._day:
+                # new day, yesterday's counts are useless
+                self._counts.clear()
+                self._day = day
+            self._counts[(user_id, day)] = used
+
+
+usage_cache = UsageCache()
+
+
+async def used_today(db: AsyncSession, user_id: UUID) -> int:
+    day = utc_today()
+    cached = usage_cache.get(user_id, day)
+    if cached is not None:
+        return cached
+    used = await db.scalar(
+        select(DailyUsage.used).where(and_(DailyUsage.user_id == user_id, DailyUsage.day == day))
+    ) or 0
+    usage_cache.set(user_id, day, used)
+    return used
+
+
+async def reserve(db: AsyncSession, user_id: UUID, limit: int) -> bool:
+    """Takes one slot of today's quota; False if the user already used `limit`."""
+    day = utc_today()
+    cached = usage_cache.get(user_id, day)
+    if cached is not None and cached >= limit:
+        # other workers can only have added to it (short of a failed upload handing its
+        # slot back), so the answer is still no
+        return False
+
+    stmt = (
+        insert(DailyUsage)
+        .values(user_id=user_id, day=day, used=1)
+        .on_conflict_do_update(
+            index_elements=[DailyUsage.user_id, DailyUsage.day],
+            set_={"used": DailyUsage.used + 1},
+            where=DailyUsage.used < limit,
+        )
+        .returning(DailyUsage.used)
+    )
+    used = (await db.execute(stmt)).scalar_one_or_none()
+    # committed right away, the row lock only lives for this statement
+    await db.commit()
+    usage_cache.set(user_id, day, limit if used is None else used)
+    return used is not None
+
+
+async def release(db: AsyncSession, user_id: UUID) -> None:
+    """Gives back a slot taken by reserve() when the prediction didn't go through."""
+    day = utc_today()
+    result = await db.execute(
+        update(DailyUsage)
+        .where(and_(DailyUsage.user_id == user_id, DailyUsage.day == day, DailyUsage.used > 0))
+        .values(used=DailyUsage.used - 1)
+        .returning(DailyUsage.used)
+    )
+    used = result.scalar_one_or_none()
+    await db.commit()
+    if used is not None:
+        usage_cache.set(user_id, day, used)
@@ -4,10 +4,11 @@ from datetime import datetime, timezone, timedelta
 from sqlalchemy import select, and_, or_, cast, Date
 from fastapi_mail import FastMail, MessageSchema, MessageType
 
-from app.db.session import SessionLocal
+from app.db.session import AsyncSessionLocal
 from app.db.models import PurchaseOrder, Subscription, User
 from app.core.config import settings
 from app.api.routers.mail import conf
+from app.services.context_service import invalidate
 
 FRONTEND_URL = os.getenv("VITE_FRONTEND_URL")
 logger = logging.getLogger("uvicorn")
@@ -35,9 +36,9 @@ async def cleanup_pending_orders():
     now = datetime.now(timezone.utc)
     limit_time = now - timedelta(minutes=15)
 
-    with SessionLocal() as db:
+    async with AsyncSessionLocal() as db:
         stale_orders = (
-            db.execute(
+            await db.scalars(
                 select(PurchaseOrder).where(
                     and_(
                         PurchaseOrder.status == "pending",
@@ -51,15 +52,13 @@ async def cleanup_pending_orders():
                     )
                 )
             )
-            .scalars()
-            .all()
-        )
+        ).all()
 
         if stale_orders:
             for order in stale_orders:
                 order.status = "expired"
 
-            db.commit()
+            await db.commit()
             logger.info(f"CRON: Marked {len(stale_orders)} orders as expired.")
         else:
             logger.info("CRON: No stale orders found.")
@@ -73,9 +72,9 @@ async def check_expired_subscriptions():
     logger.info("CRON: Checking for expired subscriptions...")
     today = datetime.now(timezone.utc).date()
 
-    with SessionLocal() as db:
+    async with AsyncSessionLocal() as db:
         expired_subs = (
-            db.execute(
+            await db.scalars(
                 select(Subscription).where(
                     and_(
                         Subscription.is_active == True,
@@ -83,13 +82,11 @@ async def check_expired_subscriptions():
                     )
                 )
             )
-            .scalars()
-            .all()
-        )
+        ).all()
 
         count = 0
         for sub in expired_subs:
-            user = db.get(User, sub.user_id)
+            user = await db.get(User, sub.user_id)
             sub.is_active = False
             count += 1
 
@@ -127,7 +124,10 @@ async def check_expired_subscriptions():
                 )
 
         if count > 0:
-            db.commit()
+            await db.commit()
+            # this process forgets them now, other workers once their entry expires
+            for sub in expired_subs:
+                invalidate(sub.user_id)
             logger.info(f"CRON: Deactivated {count} expired subscriptions.")
 
         else:
@@ -0,0 +1,122 @@
+"""
+Rescore stored predictions with a retrained classification head.
+
+Records saved with PREDICT_EMBEDDINGS on carry the pooled backbone output (float16).
+Since only the Dense head changes between retrains, applying the new head to those
+vectors with numpy gives the same top-1 the new model would, without the cnn.
+The head comes from DeployMobileNetV3Small/export_head.py (.npz).
+
+usage:
+    python -m app.tasks.rescore --head head_v2.npz [--only-version mobileNetV3Small.keras] [--dry-run]
+"""
+
+import argparse
+import json
+import sys
+import time
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+from sqlalchemy import select, update
+
+from app.db.session import SessionLocal
+from app.db.models import PredictionRecord
+
+
+def load_head(path: str) -> Dict[str, Any]:
+    with np.load(path) as npz:
+        activations = [str(a) for a in npz["activations"]]
+        return {
+            "activations": activations,
+            "kernels": [npz[f"kernel_{i}"] for i in range(len(activations))],
+            "biases": [npz[f"bias_{i}"] for i in range(len(activations))],
+            "labels": json.loads(str(npz["labels"])),
+            "model_version": str(npz["model_version"]),
+        }
+
+
+def apply_head(head: Dict[str, Any], x: np.ndarray) -> np.ndarray:
+    # (n, dim) float32 -> (n, classes) probabilities, same math as the keras Dense layers
+    for kernel, bias, act in zip(head["kernels"], head["biases"], head["activations"]):
+        x = x @ kernel + bias
+        if act == "relu":
+            np.maximum(x, 0, out=x)
+        elif act == "softmax":
+            x -= x.max(axis=1, keepdims=True)
+            np.exp(x, out=x)
+            x /= x.sum(axis=1, keepdims=True)
+    return x
+
+
+def rescore(head_path: str, only_version: Optional[str] = None, chunk: int = 5000, dry_run: bool = False) -> Dict[str, Any]:
+    head = load_head(head_path)
+    dim = head["kernels"][0].shape[0]
+    labels = head["labels"]
+    stats = {"rows": 0, "changed": 0, "skipped": 0}
+    started = time.perf_counter()
+
+    with SessionLocal() as db:
+        last_id = None
+        while True:
+            # keyset pagination on the pk, so big tables don't need OFFSET scans
+            q = select(PredictionRecord.id, PredictionRecord.title, PredictionRecord.embedding).where(
+                PredictionRecord.embedding.is_not(None)
+            )
+            if only_version is not None:
+                q = q.where(PredictionRecord.model_version == only_version)
+            if last_id is not None:
+                q = q.where(PredictionRecord.id > last_id)
+            rows = db.execute(q.order_by(PredictionRecord.id).limit(chunk)).all()
+            if not rows:
+                break
+            last_id = rows[-1].id
+
+            ok = [r for r in rows if len(r.embedding) == 2 * dim]
+            stats["skipped"] += len(rows) - len(ok)
+            if not ok:
+                continue
+            # one buffer for the whole chunk, then a single matmul per layer
+            x = np.frombuffer(b"".join(r.embedding for r in ok), dtype="<f2").reshape(len(ok), dim).astype(np.float32)
+            probs = apply_head(head, x)
+            top1 = probs.argmax(axis=1)
+            top1_p = probs[np.arange(len(ok)), top1]
+
+            updates: List[Dict[str, Any]] = []
+            for r, idx, p in zip(ok, top1, top1_p):
+                label = labels[int(idx)]
+                stats["changed"] += label["title"] != r.title
+                updates.append({
+                    "id": r.id,
+                    "title": label["title"],
+                    "severity": label["severity"],
+                    "advice": label["advice"],
+                    "probability": float(p),
+                    "model_version": head["model_version"],
+                })
+            stats["rows"] += len(ok)
+            if not dry_run:
+                # orm bulk update by primary key (executemany)
+                db.execute(update(PredictionRecord), updates)
+                db.commit()
+
+    elapsed = time.perf_counter() - started
+    stats["seconds"] = round(elapsed, 2)
+    stats["rows_per_s"] = round(stats["rows"] / elapsed, 1) if elapsed else 0.0
+    return stats
+
+
+def main() -> int:
+    ap = argparse.ArgumentParser(description="Rescore stored embeddings with a new head (.npz).")
+    ap.add_argument("--head", required=True)
+    ap.add_argument("--only-version", help="only rows whose model_version matches (same backbone)")
+    ap.add_argument("--chunk", type=int, default=5000)
+    ap.add_argument("--dry-run", action="store_true", help="compute and report, don't write")
+    args = ap.parse_args()
+
+    stats = rescore(args.head, args.only_version, args.chunk, args.dry_run)
+    print(json.dumps(stats))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
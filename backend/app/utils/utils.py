@@ -1,12 +1,11 @@
 from datetime import datetime, timedelta, timezone
 from sqlalchemy.ext.asyncio import AsyncSession
 from fastapi import HTTPException, Depends
-from sqlalchemy.orm import Session
 from sqlalchemy import select
-from app.db.models import User, UserWeatherPrefs, Subscription, PurchaseOrder
-from app.api.routers.auth import get_current_user, get_db
-
-import httpx
+from app.db.models import Subscription, PurchaseOrder
+from app.api.routers.auth import get_request_context
+from app.services.context_service import RequestContext, invalidate
+from app.core.http import http_clients
 
 DEFAULTS = {
     "frost": 1,
@@ -17,15 +16,13 @@ DEFAULTS = {
 SUBSCRIPTION_DURATION_DAYS = 30
 
 
-def activate_subscription(
+async def activate_subscription(
     user_id: int,
     purchase_order: PurchaseOrder,
-    db: Session = Depends(get_db)
+    db: AsyncSession,
 ):
-    subscription = (
-        db.execute(select(Subscription).where(Subscription.user_id == user_id))
-        .scalars()
-        .first()
+    subscription = await db.scalar(
+        select(Subscription).where(Subscription.user_id == user_id)
     )
     now = datetime.now(timezone.utc)
     new_expiry = now + timedelta(days=SUBSCRIPTION_DURATION_DAYS)
@@ -48,49 +45,28 @@ def activate_subscription(
     purchase_order.status = "paid"
     purchase_order.tbk_metadata = purchase_order.tbk_metadata or {}
 
-    db.commit()
-    db.refresh(subscription)
+    await db.commit()
+    await db.refresh(subscription)
+    invalidate(user_id)
 
     return subscription
 
 
-async def fetch_json(url: str, params: dict):
+async def fetch_json(url: str, params: dict, upstream: str = "openweather"):
     '''
     Method to simplify the fetch of weather data from the Openweathermap API.
+    upstream picks the pooled client from app/core/http.py ("openweather" / "google").
     '''
-    async with httpx.AsyncClient() as client:
-        response = await client.get(url, params=params)
-        if response.status_code != 200:
-            return {"error": f"Failed to fetch weather data: {response.text}"}
-        return response.json()
+    response = await http_clients.get(upstream).get(url, params=params)
+    if response.status_code != 200:
+        return {"error": f"Failed to fetch weather data: {response.text}"}
+    return response.json()
 
 
-def resolve_thresholds(
-    db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_user),
-):
+def resolve_thresholds(ctx: RequestContext = Depends(get_request_context)):
     '''Returns user weather preferences or in case they're null, returns default.'''
-    prefs = db.query(UserWeatherPrefs).filter_by(user_id=current_user.id).one_or_none()
-
+    # prefs come joined in with the request context, no extra query
     return {
-        "FROST": (
-            prefs.dangerous_frost_threshold
-            if prefs and prefs.dangerous_frost_threshold is not None
-            else DEFAULTS["frost"]
-        ),
-        "HEAT": (
-            prefs.dangerous_temp_threshold
-            if prefs and prefs.dangerous_temp_threshold is not None
-            else DEFAULTS["heat"]
-        ),
-        "RAIN": (
-            prefs.rain_mm_threshold
-            if prefs and prefs.rain_mm_threshold is not None
-            else DEFAULTS["rain"]
-        ),
-        "WIND": (
-            prefs.wind_kph_threshold
-            if prefs and prefs.wind_kph_threshold is not None
-            else DEFAULTS["wind"]
-        ),
+        key: value if value is not None else DEFAULTS[key.lower()]
+        for key, value in ctx.thresholds.items()
     }
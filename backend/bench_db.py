@@ -0,0 +1,144 @@
+# Concurrency benchmark: sync Session inside `async def` (how the async routes used to
+# query) vs AsyncSession (asyncpg), against the DATABASE_URL in .env.
+#
+# Every mode runs the same query from `concurrency` coroutines on one event loop, like
+# concurrent requests on one uvicorn worker. With the sync session each query blocks the
+# loop, so requests go one after the other and the loop lag grows with the db latency;
+# with AsyncSession they overlap up to the pool size (DB_POOL_SIZE + DB_MAX_OVERFLOW).
+#
+# Usage:
+#   python bench_db.py --concurrency 1 10 50 --requests 200
+#   python bench_db.py --query history --user-id <uuid> --concurrency 20 --out bench.json
+#   python bench_db.py --sleep-ms 20    # pg_sleep on top, to see the effect of a slower query
+
+import argparse
+import asyncio
+import json
+import time
+from typing import Any, Dict, List, Optional
+
+from sqlalchemy import select, text
+
+from app.db.models import PredictionRecord
+from app.db.session import AsyncSessionLocal, SessionLocal, async_engine, engine
+
+LAG_TICK = 0.01
+
+
+def build_query(kind: str, user_id: Optional[str], sleep_ms: float):
+    if kind == "history":
+        # same statement as GET /api/plant/predict/history
+        return (
+            select(PredictionRecord)
+            .where(PredictionRecord.user_id == user_id)
+            .order_by(PredictionRecord.date_created.desc())
+            .limit(50)
+        )
+    if sleep_ms:
+        return text("select pg_sleep(:s)").bindparams(s=sleep_ms / 1000)
+    return text("select 1")
+
+
+async def run_sync(stmt) -> None:
+    # what the async routes did before: blocking call straight on the event loop
+    with SessionLocal() as db:
+        db.execute(stmt).all()
+
+
+async def run_async(stmt) -> None:
+    async with AsyncSessionLocal() as db:
+        (await db.execute(stmt)).all()
+
+
+async def loop_lag(stop: asyncio.Event, out: List[float]) -> None:
+    # how late a 10 ms timer fires: every other request on the worker waits at least this much
+    while not stop.is_set():
+        t0 = time.perf_counter()
+        await asyncio.sleep(LAG_TICK)
+        out.append(time.perf_counter() - t0 - LAG_TICK)
+
+
+def pct(values: List[float], q: float) -> Optional[float]:
+    if not values:
+        return None
+    values = sorted(values)
+    return round(values[min(len(values) - 1, int(q * len(values)))] * 1000, 1)
+
+
+async def bench(mode: str, stmt, concurrency: int, total: int) -> Dict[str, Any]:
+    call = run_sync if mode == "sync" else run_async
+    latencies: List[float] = []
+    lags: List[float] = []
+    remaining = total
+
+    async def worker():
+        nonlocal remaining
+        while remaining > 0:
+            remaining -= 1
+            t0 = time.perf_counter()
+            await call(stmt)
+            latencies.append(time.perf_counter() - t0)
+
+    stop = asyncio.Event()
+    probe = asyncio.create_task(loop_lag(stop, lags))
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    wall = time.perf_counter() - started
+    stop.set()
+    await probe
+
+    return {
+        "mode": mode,
+        "concurrency": concurrency,
+        "requests": total,
+        "wall_s": round(wall, 3),
+        "req_per_s": round(total / wall, 1),
+        "latency_ms": {"p50": pct(latencies, 0.50), "p95": pct(latencies, 0.95), "p99": pct(latencies, 0.99)},
+        "loop_lag_ms": {"p50": pct(lags, 0.50), "max": pct(lags, 1.0)},
+    }
+
+
+async def main_async(args) -> List[Dict[str, Any]]:
+    stmt = build_query(args.query, args.user_id, args.sleep_ms)
+    # warm both pools so connection setup (tls + auth to neon) isn't part of the numbers
+    warm = max(args.concurrency)
+    await asyncio.gather(*(run_async(stmt) for _ in range(warm)))
+    # the sync mode never holds more than one connection at a time
+    await run_sync(stmt)
+
+    results = []
+    for concurrency in args.concurrency:
+        for mode in args.modes:
+            r = await bench(mode, stmt, concurrency, args.requests)
+            results.append(r)
+            print(
+                f"{mode:>5}  c={concurrency:<4} {r['req_per_s']:>8} req/s  "
+                f"p50={r['latency_ms']['p50']} ms  p95={r['latency_ms']['p95']} ms  "
+                f"loop lag max={r['loop_lag_ms']['max']} ms"
+            )
+    await async_engine.dispose()
+    engine.dispose()
+    return results
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--concurrency", type=int, nargs="+", default=[1, 10, 50])
+    ap.add_argument("--requests", type=int, default=200, help="queries per mode and concurrency level")
+    ap.add_argument("--modes", nargs="+", choices=["sync", "async"], default=["sync", "async"])
+    ap.add_argument("--query", choices=["ping", "history"], default="ping")
+    ap.add_argument("--user-id", help="user for --query history")
+    ap.add_argument("--sleep-ms", type=float, default=0.0, help="ping only: pg_sleep this long")
+    ap.add_argument("--out", help="also write the results as json")
+    args = ap.parse_args()
+    if args.query == "history" and not args.user_id:
+        ap.error("--query history needs --user-id")
+
+    results = asyncio.run(main_async(args))
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,72 @@
+import pytest
+
+pytest.importorskip("fastapi")
+pytest.importorskip("httpx")
+pytest.importorskip("multipart")
+
+from fastapi import FastAPI, File, UploadFile
+from fastapi.testclient import TestClient
+
+from app.core.body_limit import install_body_limits, multipart_limit
+
+AVATAR_PATH = "/api/users/me/avatar"
+AVATAR_MAX = 1024
+BOUNDARY = "limit-test"
+
+
+def make_client() -> TestClient:
+    # same wiring as app.main: a File() route behind the scoped limit, plus an uncapped route
+    app = FastAPI()
+    install_body_limits(app, {AVATAR_PATH: multipart_limit(AVATAR_MAX)})
+
+    @app.post(AVATAR_PATH)
+    async def upload(file: UploadFile = File(...)):
+        return {"size": len(await file.read())}
+
+    @app.post("/other")
+    async def other(file: UploadFile = File(...)):
+        return {"size": len(await file.read())}
+
+    return TestClient(app)
+
+
+def multipart_body(size: int) -> bytes:
+    return (
+        f"--{BOUNDARY}\r\n"
+        'Content-Disposition: form-data; name="file"; filename="a.jpg"\r\n'
+        "Content-Type: image/jpeg\r\n\r\n"
+    ).encode() + b"\xff" * size + f"\r\n--{BOUNDARY}--\r\n".encode()
+
+
+def chunked(body: bytes, size: int = 16 * 1024):
+    # a generator body: httpx sends it without Content-Length
+    for i in range(0, len(body), size):
+        yield body[i : i + size]
+
+
+HEADERS = {"content-type": f"multipart/form-data; boundary={BOUNDARY}"}
+
+
+def test_chunked_oversize_avatar_gets_413():
+    body = multipart_body(multipart_limit(AVATAR_MAX) * 2)
+    resp = make_client().post(AVATAR_PATH, content=chunked(body), headers=HEADERS)
+    assert resp.status_code == 413
+    assert resp.json()["detail"] == "payload_too_large"
+
+
+def test_declared_oversize_avatar_gets_413():
+    body = multipart_body(multipart_limit(AVATAR_MAX) * 2)
+    resp = make_client().post(AVATAR_PATH, content=body, headers=HEADERS)
+    assert resp.status_code == 413
+
+
+def test_small_avatar_goes_through():
+    resp = make_client().post(AVATAR_PATH, content=chunked(multipart_body(100)), headers=HEADERS)
+    assert resp.status_code == 200
+    assert resp.json() == {"size": 100}
+
+
+def test_other_routes_are_not_capped():
+    body = multipart_body(multipart_limit(AVATAR_MAX) * 2)
+    resp = make_client().post("/other", content=chunked(body), headers=HEADERS)
+    assert resp.status_code == 200
@@ -0,0 +1,137 @@
+"""
+reserve()/release() against a real Postgres: the quota relies on INSERT .. ON CONFLICT and
+row locks, so sqlite or a mock wouldn't prove anything. Runs only with TEST_DATABASE_URL set
+(a throwaway database; the users and daily_usage tables are created if missing).
+"""
+
+import asyncio
+import os
+import uuid
+
+import pytest
+
+pytest.importorskip("sqlalchemy")
+pytest.importorskip("asyncpg")
+pytest.importorskip("pydantic_settings")
+
+TEST_DATABASE_URL = os.getenv("TEST_DATABASE_URL")
+if not TEST_DATABASE_URL:
+    pytest.skip("TEST_DATABASE_URL not set", allow_module_level=True)
+
+from sqlalchemy import delete, insert, select
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
+
+from app.db.models import DailyUsage, User
+from app.db.session import async_database_url
+from app.services import usage_service
+
+LIMIT = 5
+
+
+@pytest.fixture(autouse=True)
+def fresh_cache(monkeypatch):
+    # the in-process counts would leak between tests (and hide the db from reserve)
+    monkeypatch.setattr(usage_service, "usage_cache", usage_service.UsageCache())
+
+
+def run(scenario):
+    """Runs scenario(sessionmaker, user_id) with its own engine and a throwaway user."""
+
+    async def main():
+        url, connect_args = async_database_url(TEST_DATABASE_URL)
+        engine = create_async_engine(url, connect_args=connect_args, pool_size=20, max_overflow=0)
+        sessions = async_sessionmaker(engine, class_=AsyncSession, expire_on_commit=False)
+        user_id = uuid.uuid4()
+        try:
+            async with engine.begin() as conn:
+                await conn.run_sync(
+                    lambda c: User.metadata.create_all(c, tables=[User.__table__, DailyUsage.__table__])
+                )
+                await conn.execute(
+                    insert(User).values(
+                        id=user_id,
+                        email=f"quota-{user_id}@test.local",
+                        password_hash="x",
+                        first_name="quota",
+                        last_name="test",
+                    )
+                )
+            return await scenario(sessions, user_id)
+        finally:
+            async with engine.begin() as conn:
+                await conn.execute(delete(User).where(User.id == user_id))
+            await engine.dispose()
+
+    return asyncio.run(main())
+
+
+async def reserve(sessions, user_id) -> bool:
+    async with sessions() as db:
+        return await usage_service.reserve(db, user_id, LIMIT)
+
+
+async def release(sessions, user_id) -> None:
+    async with sessions() as db:
+        await usage_service.release(db, user_id)
+
+
+async def used(sessions, user_id) -> int:
+    async with sessions() as db:
+        return await db.scalar(select(DailyUsage.used).where(DailyUsage.user_id == user_id)) or 0
+
+
+def test_concurrent_reserves_never_go_past_the_limit():
+    async def scenario(sessions, user_id):
+        # every call on its own connection, all racing for the first row and the last slots
+        results = await asyncio.gather(*(reserve(sessions, user_id) for _ in range(3 * LIMIT)))
+        return results, await used(sessions, user_id)
+
+    results, count = run(scenario)
+    assert sum(results) == LIMIT
+    assert count == LIMIT
+
+
+def test_release_gives_the_slot_back():
+    async def scenario(sessions, user_id):
+        for _ in range(LIMIT):
+            assert await reserve(sessions, user_id)
+        denied = await reserve(sessions, user_id)
+        await release(sessions, user_id)
+        after_release = await used(sessions, user_id)
+        again = await reserve(sessions, user_id)
+        return denied, after_release, again, await used(sessions, user_id)
+
+    denied, after_release, again, count = run(scenario)
+    assert denied is False
+    assert after_release == LIMIT - 1
+    # the cache said "full" before the release; it must not keep refusing
+    assert again is True
+    assert count == LIMIT
+
+
+def test_concurrent_release_and_reserve_keep_the_count_exact():
+    async def scenario(sessions, user_id):
+        for _ in range(LIMIT):
+            await reserve(sessions, user_id)
+        # two failed uploads hand back their slots while four new ones race for them
+        results = await asyncio.gather(
+            release(sessions, user_id),
+            release(sessions, user_id),
+            *(reserve(sessions, user_id) for _ in range(4)),
+        )
+        return results[2:], await used(sessions, user_id)
+
+    reserved, count = run(scenario)
+    # reserves that ran before a release saw a full quota; whatever got in, the count matches
+    assert count == LIMIT - 2 + sum(reserved)
+    assert count <= LIMIT
+
+
+def test_release_never_goes_below_zero():
+    async def scenario(sessions, user_id):
+        await reserve(sessions, user_id)
+        await release(sessions, user_id)
+        await release(sessions, user_id)
+        return await used(sessions, user_id)
+
+    assert run(scenario) == 0